@@ -0,0 +1,60 @@
+"""Throughput and latency of the alert rules on the ingest path
+
+Feeds synthetic readings to AlertEngine in batches the size the streaming
+reader delivers and reports records/s and per-batch evaluation latency.
+
+Usage: python benchmarks/bench_alerts.py [--records 1000000] [--batch 256 4096]
+       [--min-records-per-s 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.alerts import AlertEngine
+from watermonitoring.parser import parse_buffer
+from watermonitoring.simulator import synthetic_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[256, 4096])
+    parser.add_argument('--min-records-per-s', type=float, default=100000,
+                        help="exit with status 1 when throughput falls below this")
+    args = parser.parse_args()
+
+    # Generate a block once and tile it; rule cost does not depend on values
+    block = parse_buffer(synthetic_lines(min(args.records, 100000))).columns
+    reps = -(-args.records // len(block['time_ms']))
+    columns = {name: np.tile(column, reps)[:args.records] for name, column in block.items()}
+    elapsed = np.arange(args.records, dtype=np.float64) * 1000
+
+    failed = False
+    print(f"{'batch':>6} {'records/s':>12} {'p50 ms':>8} {'p99 ms':>8} {'alerts':>8}")
+    for size in args.batch:
+        engine = AlertEngine()
+        latencies = []
+        started = time.perf_counter()
+        for lo in range(0, args.records, size):
+            batch = {name: column[lo:lo + size] for name, column in columns.items()}
+            t = time.perf_counter()
+            engine.process(batch, elapsed[lo:lo + size])
+            latencies.append(time.perf_counter() - t)
+        rate = args.records / (time.perf_counter() - started)
+        p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+        print(f"{size:>6} {rate:>12,.0f} {p50:>8.3f} {p99:>8.3f} {engine.total:>8}")
+        failed |= bool(args.min_records_per_s and rate < args.min_records_per_s)
+
+    if failed:
+        print(f"FAIL: below {args.min_records_per_s:,.0f} records/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Scaling of the batch analytics from 1 to N worker processes
+
+Writes a synthetic corpus of save_data CSV files and imports it into an
+archive (depths cycling over 1, 2, 5, 10 m), then runs
+watermonitoring.analytics over both with 1, 2, 4, ... workers up to the
+CPU count. Reports seconds, rows/s, speedup and parallel efficiency, and
+checks that every worker count gives the same report.
+
+Usage: python benchmarks/bench_analytics.py [--files 64] [--rows 20000] [--max-workers N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from watermonitoring.analytics import analyze
+from watermonitoring.archive import Archive
+from watermonitoring.protocol import HEADERS
+from watermonitoring.simulator import iter_synthetic_lines
+
+DEPTHS = (1, 2, 5, 10)
+
+
+def write_corpus(folder, files, rows):
+    paths = []
+    saved = datetime(2024, 1, 1, 12)
+    for i in range(files):
+        path = os.path.join(folder, f"water_quality_{saved.strftime('%Y%m%d_%H%M%S')}.csv")
+        with open(path, 'w') as f:
+            f.write(';'.join(HEADERS) + '\n')
+            # CSV rows are the record lines without the finished token
+            f.writelines(line.rsplit(';', 1)[0] + '\n'
+                         for line in iter_synthetic_lines(rows, seed=i, malformed_ratio=0.001))
+        paths.append(path)
+        saved += timedelta(hours=6)
+    return paths
+
+
+def same_report(a, b):
+    if a.keys() != b.keys():
+        return False
+    for key, x in a.items():
+        y = b[key]
+        for stats_x, stats_y in ((x.values, y.values), (x.intervals, y.intervals)):
+            if stats_x.count != stats_y.count or not np.isclose(stats_x.mean, stats_y.mean):
+                return False
+            if stats_x.count > 1 and not np.isclose(stats_x.variance, stats_y.variance):
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=64, help="CSV files in the corpus")
+    parser.add_argument('--rows', type=int, default=20000, help="rows per file")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_workers:
+        counts.append(args.max_workers)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_corpus(folder, args.files, args.rows)
+        archive_dir = os.path.join(folder, 'arsip')
+        archive = Archive(archive_dir)
+        for i, path in enumerate(paths):
+            archive.import_csv(path, depth=DEPTHS[i % len(DEPTHS)])
+        total_rows = archive.rows
+        print(f"corpus: {args.files} files, {total_rows} rows; {os.cpu_count()} CPUs")
+
+        for label, sources in (("csv", paths), ("archive", [archive_dir])):
+            baseline = reference = None
+            print(f"{label:<8} {'workers':>7} {'seconds':>8} {'rows/s':>12} {'speedup':>8} "
+                  f"{'efficiency':>10}")
+            for workers in counts:
+                started = time.perf_counter()
+                report = analyze(sources, workers=workers)
+                elapsed = time.perf_counter() - started
+                if reference is None:
+                    baseline, reference = elapsed, report
+                elif not same_report(reference, report):
+                    raise SystemExit(f"{label}: report with {workers} workers differs")
+                speedup = baseline / elapsed
+                print(f"{'':<8} {workers:>7} {elapsed:>8.2f} {total_rows / elapsed:>12,.0f} "
+                      f"{speedup:>7.2f}x {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
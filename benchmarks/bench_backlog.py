@@ -0,0 +1,104 @@
+"""Stored-log retrieval: one fetch vs resumable chunks, with and without link loss
+
+Starts simulators whose SD log already holds --stored records and copies
+the log the way `python -m watermonitoring.backlog` does, once in a single
+fetch (the whole log in memory, as a non-resumable transfer) and once in
+chunks, again over a link that drops every --drop-every records. Reports
+records/s, MB/s, resumes and duplicates, and the peak Python memory of the
+transfer from tracemalloc in a second, traced pass.
+
+Usage: python benchmarks/bench_backlog.py [--stored 200000] [--chunk 2000] [--drop-every 30000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from watermonitoring import backlog
+from watermonitoring.backlog import BacklogTotals, Cursor, retrieve
+from watermonitoring.parser import parse_buffer
+from watermonitoring.session import ProbeConnection
+
+
+def start_simulator(args, drop_every=None):
+    command = [sys.executable, '-m', 'watermonitoring.simulator', '--port', '0',
+               '--records', '1000', '--stored', str(args.stored), '--malformed', '0.001']
+    if drop_every:
+        command += ['--drop-every', str(drop_every)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("listening on"):
+        process.kill()
+        raise SystemExit("simulator did not start")
+    host, port = line.split()[-1].rsplit(':', 1)
+    return process, host, int(port)
+
+
+def one_fetch(probe):
+    totals = BacklogTotals()
+    started = time.perf_counter()
+    lines, _ = probe.fetch(0, 0)
+    totals.add(parse_buffer(lines))
+    totals.bytes = sum(map(len, lines)) + len(lines)
+    totals.seconds = time.perf_counter() - started
+    return totals
+
+
+def chunked(probe, chunk):
+    return retrieve(probe, lambda result: None, Cursor(), chunk_records=chunk)
+
+
+def measure(address, transfer):
+    """(totals of an untraced run, peak traced MB of a second run)"""
+    probe = ProbeConnection(*address)
+    totals = transfer(probe)
+    tracemalloc.start()
+    transfer(probe)
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    probe.close()
+    return totals, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stored', type=int, default=200000, help="records in the stored log")
+    parser.add_argument('--chunk', type=int, default=backlog.CHUNK_RECORDS)
+    parser.add_argument('--drop-every', type=int, default=30000,
+                        help="records between link losses in the last run")
+    parser.add_argument('--resume-delay', type=float, default=0.05,
+                        help="seconds before resuming (the app waits RESUME_DELAY)")
+    args = parser.parse_args()
+    backlog.RESUME_DELAY = args.resume_delay
+
+    clean, host, port = start_simulator(args)
+    lossy, lossy_host, lossy_port = start_simulator(args, args.drop_every)
+    try:
+        runs = [
+            ("one fetch", measure((host, port), one_fetch)),
+            (f"chunks of {args.chunk}", measure((host, port), lambda p: chunked(p, args.chunk))),
+            (f"chunks, drop/{args.drop_every}",
+             measure((lossy_host, lossy_port), lambda p: chunked(p, args.chunk))),
+        ]
+    finally:
+        for process in (clean, lossy):
+            process.terminate()
+            process.wait()
+
+    print(f"stored log of {args.stored} records")
+    print(f"{'transfer':<22} {'records':>8} {'records/s':>10} {'MB/s':>6} {'resumes':>8} "
+          f"{'dupl.':>6} {'peak MB':>8}")
+    for name, (totals, peak) in runs:
+        print(f"{name:<22} {totals.records:>8} {totals.records_per_second:>10,.0f} "
+              f"{totals.bytes / totals.seconds / 1e6:>6.1f} {totals.resumes:>8} "
+              f"{totals.duplicates:>6} {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
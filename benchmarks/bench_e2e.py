@@ -0,0 +1,89 @@
+"""End-to-end acquisition benchmark against the local ESP32 simulator
+
+Starts `python -m watermonitoring.simulator` in a subprocess, runs the same
+request_test + ReadingStore path the GUI uses and reports records/s, batch
+parse latency percentiles and the peak RSS of this (client) process.
+
+Usage: python benchmarks/bench_e2e.py [--records 200000] [--runs 3]
+       [--rate R] [--malformed 0.001] [--min-records-per-s N]
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from watermonitoring import ReadingStore
+from watermonitoring.client import request_test
+
+
+def start_simulator(args):
+    command = [sys.executable, '-m', 'watermonitoring.simulator', '--port', '0',
+               '--records', str(args.records), '--malformed', str(args.malformed)]
+    if args.rate:
+        command += ['--rate', str(args.rate)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    banner = process.stdout.readline().split()
+    if not banner or banner[0] != 'listening':
+        process.kill()
+        raise SystemExit("simulator did not start")
+    host, port = banner[-1].rsplit(':', 1)
+    return process, host, int(port)
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000, help="records per run")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=None, help="simulator pacing, records/s")
+    parser.add_argument('--malformed', type=float, default=0.001)
+    parser.add_argument('--min-records-per-s', type=float, default=None,
+                        help="exit with status 1 when throughput falls below this")
+    args = parser.parse_args()
+
+    process, host, port = start_simulator(args)
+    try:
+        rss_before = peak_rss_mb()
+        rates = []
+        latencies = []
+        for run in range(args.runs):
+            store = ReadingStore()
+
+            def on_batch(result):
+                latencies.append(result.elapsed)
+                store.extend(result.columns)
+
+            start = time.perf_counter()
+            totals = request_test(host, port, 0, 1, True, on_batch)
+            elapsed = time.perf_counter() - start
+            rates.append(totals.records / elapsed)
+            print(f"run {run + 1}: {totals.records} records, {totals.malformed} malformed, "
+                  f"{totals.batches} batches in {elapsed:.2f} s ({rates[-1]:,.0f} records/s)")
+    finally:
+        process.terminate()
+        process.wait()
+
+    p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99])
+    print(f"records/s: median {np.median(rates):,.0f}, best {max(rates):,.0f}")
+    print(f"batch parse latency ms: p50 {p50:.2f}  p90 {p90:.2f}  p99 {p99:.2f}")
+    print(f"peak RSS: {peak_rss_mb():.1f} MB (before runs {rss_before:.1f} MB)")
+
+    if args.min_records_per_s and np.median(rates) < args.min_records_per_s:
+        print(f"FAIL: below {args.min_records_per_s:,.0f} records/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
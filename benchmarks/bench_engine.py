@@ -0,0 +1,48 @@
+"""Run the asyncio acquisition engine against many local fake ESP32 probes
+
+Usage: python benchmarks/bench_engine.py [--devices 50] [--records 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.engine import DONE, AcquisitionEngine, Device
+from watermonitoring.simulator import FakeESP32
+
+
+async def run(device_count, records):
+    servers = [await FakeESP32(records=records, seed=i).start() for i in range(device_count)]
+    devices = [Device(f"probe{i:02d}", server.host, server.port, depth=i % 10, duration=1)
+               for i, server in enumerate(servers)]
+    engine = AcquisitionEngine(devices)
+    per_device = dict.fromkeys(engine.sessions, 0)
+    start = time.perf_counter()
+    async for batch in engine.stream():
+        per_device[batch.device_id] += len(batch)
+    elapsed = time.perf_counter() - start
+    for server in servers:
+        await server.close()
+    return engine, per_device, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--records', type=int, default=2000, help="records sent per device")
+    args = parser.parse_args()
+
+    engine, per_device, elapsed = asyncio.run(run(args.devices, args.records))
+    done = sum(state == DONE for state in engine.states().values())
+    total = sum(per_device.values())
+    print(f"devices done: {done}/{args.devices}")
+    print(f"records: {total} in {elapsed:.2f} s ({total / elapsed:,.0f} records/s)")
+    print(f"per device min/max: {min(per_device.values())}/{max(per_device.values())}")
+
+
+if __name__ == "__main__":
+    main()
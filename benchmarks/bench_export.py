@@ -0,0 +1,84 @@
+"""Export formats compared: write time, file size, reload time and write memory
+
+Fills a ReadingStore with synthetic readings and saves it in every format
+available here (see watermonitoring.export), CSV being the layout
+save_data always wrote. Reports seconds to write, MB on disk, seconds to
+load the columns back, the peak Python memory of the write from
+tracemalloc in a second, traced pass (buffers pyarrow allocates itself are
+not traced), and checks that the reloaded columns match the store.
+
+Usage: python benchmarks/bench_export.py [--records 1000000] [--chunk 65536]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.export import (EXPORT_CHUNK_ROWS, EXPORTERS, available_formats, export,
+                                    iter_store_chunks, load)
+from watermonitoring.parser import parse_buffer
+from watermonitoring.simulator import synthetic_lines
+from watermonitoring.store import ReadingStore
+
+
+def same_columns(store, columns, exact):
+    for name, column in store.columns().items():
+        if exact and not np.array_equal(column, columns[name]):
+            return False
+        # CSV keeps 6 significant digits
+        if not exact and not np.allclose(column, columns[name], rtol=1e-5):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--chunk', type=int, default=EXPORT_CHUNK_ROWS, help="rows per written chunk")
+    args = parser.parse_args()
+
+    # Generate a block once and tile it, advancing the stamps
+    block = parse_buffer(synthetic_lines(min(args.records, 100000))).columns
+    store = ReadingStore(args.records)
+    while len(store) < args.records:
+        count = min(len(block['time_ms']), args.records - len(store))
+        store.extend({name: column[:count] for name, column in block.items()})
+    print(f"{len(store)} rows, {store.nbytes / 1e6:.1f} MB in memory; "
+          f"formats here: {', '.join(available_formats())}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"{'format':<8} {'write s':>8} {'MB':>7} {'vs csv':>7} {'load s':>7} "
+              f"{'peak MB':>8} {'same':>5}")
+        csv_size = None
+        for fmt in available_formats():
+            path = os.path.join(folder, 'export' + EXPORTERS[fmt].extension)
+            started = time.perf_counter()
+            export(iter_store_chunks(store, args.chunk), path, fmt)
+            write = time.perf_counter() - started
+            size = os.path.getsize(path)
+            csv_size = csv_size or size
+            started = time.perf_counter()
+            columns = load(path)
+            reload = time.perf_counter() - started
+            same = same_columns(store, columns, exact=fmt != 'csv')
+            del columns
+            os.remove(path)
+
+            tracemalloc.start()
+            export(iter_store_chunks(store, args.chunk), path, fmt)
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            os.remove(path)
+            print(f"{fmt:<8} {write:>8.2f} {size / 1e6:>7.1f} {size / csv_size:>6.0%} {reload:>7.2f} "
+                  f"{peak:>8.1f} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
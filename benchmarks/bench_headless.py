@@ -0,0 +1,80 @@
+"""Startup time and resident memory of the headless CLI vs the GUI module
+
+Each variant runs in a fresh interpreter; wall time and peak RSS come from
+the child's own rusage. The GUI is only imported (no Tk window), which is
+a lower bound for its real startup. The last row is a full headless test
+against the simulator.
+
+Usage: python benchmarks/bench_headless.py [--runs 5] [--records 20000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+GUI_STACK = ('tkinter', 'matplotlib', 'ttkbootstrap')
+
+CHECK_IMPORTS = ("import sys; import watermonitoring.cli; "
+                 f"loaded = [m for m in sys.modules if m.split('.')[0] in {GUI_STACK!r}]; "
+                 "sys.exit(1 if loaded else 0)")
+
+
+def run_child(args, env):
+    """Run a child process; returns (seconds, peak RSS in MB, exit status)"""
+    started = time.perf_counter()
+    child = subprocess.Popen(args, env=env, cwd=ROOT,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(child.pid, 0)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, usage.ru_maxrss / 1024, os.waitstatus_to_exitcode(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    python = sys.executable
+    if run_child([python, '-c', CHECK_IMPORTS], env)[2] != 0:
+        print("FAIL: importing watermonitoring.cli loads the GUI stack")
+        sys.exit(1)
+
+    simulator = subprocess.Popen([python, '-m', 'watermonitoring.simulator', '--port', '0',
+                                  '--records', str(args.records)],
+                                 env=env, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    port = simulator.stdout.readline().rsplit(':', 1)[1].strip()
+    log_dir = tempfile.mkdtemp(prefix='wq_headless_')
+    variants = [
+        ("headless CLI --help", [python, '-m', 'watermonitoring', 'acquire', '--help']),
+        ("GUI module import", [python, '-c', 'import ta_water_monitoring_gui']),
+        (f"headless test, {args.records} records",
+         [python, '-m', 'watermonitoring', 'acquire', '--device', f'127.0.0.1:{port}',
+          '--depth', '1', '--duration', '1', '--output', 'none', '--log-dir', log_dir]),
+    ]
+    try:
+        print(f"{'variant':<34} {'median s':>9} {'best s':>8} {'peak RSS MB':>12}")
+        for name, command in variants:
+            results = [run_child(command, env) for _ in range(args.runs)]
+            if any(status != 0 for _, _, status in results):
+                print(f"{name:<34} failed")
+                continue
+            times = [elapsed for elapsed, _, _ in results]
+            rss = max(peak for _, peak, _ in results)
+            print(f"{name:<34} {np.median(times):>9.3f} {min(times):>8.3f} {rss:>12.1f}")
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+if __name__ == "__main__":
+    main()
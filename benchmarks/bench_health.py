@@ -0,0 +1,69 @@
+"""Throughput and latency of the probe health analyzer on the ingest path
+
+Feeds synthetic readings to HealthMonitor in batches the size the
+streaming reader delivers and reports records/s, per-batch latency and the
+resulting score, and checks that the score does not depend on the batch
+size.
+
+Usage: python benchmarks/bench_health.py [--records 1000000] [--batch 256 4096]
+       [--min-records-per-s 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.health import HealthMonitor
+from watermonitoring.parser import parse_buffer
+from watermonitoring.simulator import synthetic_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[256, 4096])
+    parser.add_argument('--min-records-per-s', type=float, default=100000,
+                        help="exit with status 1 when throughput falls below this")
+    args = parser.parse_args()
+
+    # Generate a block once and tile it; the cost does not depend on values
+    block = parse_buffer(synthetic_lines(min(args.records, 100000))).columns
+    reps = -(-args.records // len(block['time_ms']))
+    columns = {name: np.tile(column, reps)[:args.records] for name, column in block.items()}
+    elapsed = np.arange(args.records, dtype=np.int64) * 1000
+
+    failed = False
+    scores = set()
+    print(f"{'batch':>6} {'records/s':>12} {'p50 ms':>8} {'p99 ms':>8} {'score':>6}")
+    for size in args.batch:
+        monitor = HealthMonitor()
+        latencies = []
+        started = time.perf_counter()
+        for lo in range(0, args.records, size):
+            batch = {name: column[lo:lo + size] for name, column in columns.items()}
+            t = time.perf_counter()
+            monitor.process(batch, elapsed[lo:lo + size])
+            latencies.append(time.perf_counter() - t)
+        rate = args.records / (time.perf_counter() - started)
+        p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+        score, _ = monitor.score()
+        scores.add(round(score, 6))
+        print(f"{size:>6} {rate:>12,.0f} {p50:>8.3f} {p99:>8.3f} {score:>6.1f}")
+        failed |= bool(args.min_records_per_s and rate < args.min_records_per_s)
+
+    if len(scores) > 1:
+        print("FAIL: score depends on the batch size")
+        failed = True
+    elif failed:
+        print(f"FAIL: below {args.min_records_per_s:,.0f} records/s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare the per-line parser with parse_buffer on synthetic SD-card dumps
+
+Usage: python benchmarks/bench_parse.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring import ReadingStore
+from watermonitoring.parser import parse_buffer, parse_line
+from watermonitoring.simulator import synthetic_lines
+
+
+def parse_per_line(lines):
+    store = ReadingStore()
+    for line in lines:
+        try:
+            store.append(*parse_line(line))
+        except ValueError:
+            pass
+    return store
+
+
+def parse_bulk(lines):
+    store = ReadingStore()
+    store.extend(parse_buffer(lines).columns)
+    return store
+
+
+def same_rows(a, b):
+    if len(a) != len(b):
+        return False
+    for name in ('time_ms', 'flags', 'value_pH', 'interval_pH', 'value_temp', 'interval_temp',
+                 'value_DO', 'interval_DO', 'value_turb', 'interval_turb', 'current', 'voltage'):
+        if not np.array_equal(a.column(name), b.column(name)):
+            return False
+    return True
+
+
+def timed(func, lines):
+    start = time.perf_counter()
+    result = func(lines)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--malformed', type=float, default=0.001,
+                        help="fraction of malformed lines in the dump")
+    args = parser.parse_args()
+
+    print(f"{'lines':>10} {'per-line/s':>14} {'bulk/s':>14} {'speedup':>8}  same")
+    for size in args.sizes:
+        lines = synthetic_lines(size, malformed_ratio=args.malformed)
+        reference, t_ref = timed(parse_per_line, lines)
+        bulk, t_bulk = timed(parse_bulk, lines)
+        print(f"{size:>10} {size / t_ref:>14,.0f} {size / t_bulk:>14,.0f} "
+              f"{t_ref / t_bulk:>7.1f}x  {same_rows(reference, bulk)}")
+
+
+if __name__ == "__main__":
+    main()
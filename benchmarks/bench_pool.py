@@ -0,0 +1,88 @@
+"""Connection reuse: one-shot connections vs a pooled keep-alive session
+
+Starts the simulator with a per-connection accept delay (standing in for
+connection setup to a probe on Wi-Fi) and runs the same short tests once
+with a new connection per test, as before the pool, and once over one
+persistent session. Reports per-test latency and connections opened.
+
+Usage: python benchmarks/bench_pool.py [--runs 50] [--records 200] [--accept-delay 0.02]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from watermonitoring.client import request_test
+from watermonitoring.metrics import Metrics
+from watermonitoring.session import ConnectionPool
+
+
+def start_simulator(args):
+    command = [sys.executable, '-m', 'watermonitoring.simulator', '--port', '0',
+               '--records', str(args.records), '--accept-delay', str(args.accept_delay)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("listening on"):
+        process.kill()
+        raise SystemExit("simulator did not start")
+    host, port = line.split()[-1].rsplit(':', 1)
+    return process, host, int(port)
+
+
+def timed_runs(runs, run_test):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        totals = run_test()
+        latencies.append(time.perf_counter() - started)
+        if not totals.finished:
+            raise SystemExit("test reply ended early")
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--records', type=int, default=200, help="records per test")
+    parser.add_argument('--accept-delay', type=float, default=0.02,
+                        help="simulated connection setup time of the probe (s)")
+    args = parser.parse_args()
+
+    process, host, port = start_simulator(args)
+    try:
+        one_shot = Metrics()
+        one_shot_ms = timed_runs(args.runs, lambda: request_test(
+            host, port, 1, 1, False, lambda result: None, metrics=one_shot))
+
+        pooled = Metrics()
+        pool = ConnectionPool(metrics=pooled)
+        with pool.connection(host, port) as probe:
+            # Warm the session like the GUI does at startup
+            probe.status()
+            pooled_ms = timed_runs(args.runs, lambda: probe.run_test(1, 1, False, lambda result: None))
+            server_connections = probe.status()['connections']
+        pool.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{args.runs} tests of {args.records} records, accept delay {args.accept_delay * 1000:.0f} ms")
+    print(f"{'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'total s':>8} {'connections':>12}")
+    for name, latencies, connections in (
+            ("one-shot", one_shot_ms, one_shot.timings['connect_seconds'].count),
+            ("pooled", pooled_ms, pooled.counters.get('connections_opened_total', 0))):
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"{name:<12} {p50:>8.2f} {p95:>8.2f} {latencies.sum() / 1000:>8.2f} {connections:>12}")
+    print(f"simulator saw {server_connections} connections in total")
+    print(f"speedup (p50): {np.median(one_shot_ms) / np.median(pooled_ms):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
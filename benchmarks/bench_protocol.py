@@ -0,0 +1,44 @@
+"""Compare wire size and decode time of the text and binary response modes
+
+Usage: python benchmarks/bench_protocol.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.parser import encode_binary, parse_binary, parse_buffer
+from watermonitoring.simulator import synthetic_lines
+
+
+def best_of(func, payload, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'records':>9} {'text bytes':>12} {'binary bytes':>13} {'ratio':>6} "
+          f"{'text ms':>9} {'binary ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        text = ('\n'.join(synthetic_lines(size)) + '\n').encode('ascii')
+        binary = encode_binary(parse_buffer(text).columns)
+        t_text = best_of(parse_buffer, text)
+        t_binary = best_of(parse_binary, binary)
+        print(f"{size:>9} {len(text):>12,} {len(binary):>13,} {len(text) / len(binary):>5.1f}x "
+              f"{t_text * 1000:>9.1f} {t_binary * 1000:>10.2f} {t_text / t_binary:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Import and startup time of the GUI, cold and warm
+
+Every run is a fresh interpreter. Cold runs point PYTHONPYCACHEPREFIX at an
+empty directory so every module is compiled again (the OS file cache is not
+dropped); warm runs reuse the bytecode of the previous run. Variants:
+
+  GUI import      what the app imports before its window exists
+  + data stack    GUI import plus the numpy modules preloaded in the background
+  + graph stack   GUI import plus everything, the cost before lazy loading
+  first paint     GUI import, app construction and one Tk update (needs $DISPLAY)
+
+Exits with status 1 when the GUI import loads numpy or matplotlib.
+
+Usage: python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+LAZY_STACK = ('numpy', 'matplotlib')
+
+CHECK_IMPORTS = ("import sys; import ta_water_monitoring_gui; "
+                 f"loaded = [m for m in sys.modules if m.split('.')[0] in {LAZY_STACK!r}]; "
+                 "sys.exit(1 if loaded else 0)")
+
+GUI_IMPORT = "import ta_water_monitoring_gui"
+DATA_STACK = GUI_IMPORT + "; import watermonitoring.chart, watermonitoring.alerts, watermonitoring.archive"
+GRAPH_STACK = DATA_STACK + ("; import matplotlib.figure"
+                            "; import matplotlib.backends.backend_tkagg")
+FIRST_PAINT = ("import tkinter as tk; import ta_water_monitoring_gui as gui; "
+               "root = tk.Tk(); app = gui.WaterQualityApp(root); root.update(); root.destroy()")
+
+
+def run_child(code, env):
+    """Seconds for a fresh interpreter to run `code`, None if it failed"""
+    started = time.perf_counter()
+    status = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    return time.perf_counter() - started if status == 0 else None
+
+
+def measure(code, runs, env):
+    """(cold, warm) lists of seconds; each cold run starts from an empty bytecode cache"""
+    cold, warm = [], []
+    for _ in range(runs):
+        cache = tempfile.mkdtemp(prefix='wq_pycache_')
+        try:
+            run_env = dict(env, PYTHONPYCACHEPREFIX=cache)
+            cold.append(run_child(code, run_env))
+            warm.append(run_child(code, run_env))
+        finally:
+            shutil.rmtree(cache, ignore_errors=True)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    if run_child(CHECK_IMPORTS, env) is None:
+        print("FAIL: importing the GUI loads numpy or matplotlib")
+        sys.exit(1)
+
+    variants = [
+        ("GUI import", GUI_IMPORT),
+        ("+ data stack", DATA_STACK),
+        ("+ graph stack", GRAPH_STACK),
+    ]
+    if os.environ.get('DISPLAY'):
+        variants.append(("first paint", FIRST_PAINT))
+    else:
+        print("no $DISPLAY, first paint not measured")
+
+    print(f"{'variant':<16} {'cold median s':>14} {'warm median s':>14} {'warm best s':>12}")
+    for name, code in variants:
+        cold, warm = measure(code, args.runs, env)
+        if None in cold or None in warm:
+            print(f"{name:<16} failed")
+            continue
+        print(f"{name:<16} {np.median(cold):>14.3f} {np.median(warm):>14.3f} {min(warm):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
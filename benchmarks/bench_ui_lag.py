@@ -0,0 +1,162 @@
+"""Tk event-loop lag of the GUI while a fast test streams in
+
+Starts the simulator unpaced, builds the real WaterQualityApp against it,
+runs one test with the live graph open and measures how late a probe
+scheduled every PROBE_MS on the Tk event loop runs. Readings reach the Tk
+thread through the UI bridge (watermonitoring.uibridge), which stores the
+batches of a frame together, refreshes the widgets once per frame and
+holds the receive thread back when the UI falls behind.
+
+Needs a display. Without $DISPLAY an Xvfb server is started if one is
+installed, otherwise the benchmark is skipped. Logs and the archive are
+written to a temporary directory. Exits with status 1 when the 99th
+percentile lag exceeds --max-lag-ms.
+
+Usage: python benchmarks/bench_ui_lag.py [--records 200000] [--max-lag-ms 50] [--no-graph]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+# Interval of the lag probe (ms)
+PROBE_MS = 10
+
+# Display number tried for Xvfb
+XVFB_DISPLAY = 99
+
+# Time the app gets to preload and open its session before the test (s)
+SETTLE_S = 1.0
+
+
+def start_simulator(records):
+    command = [sys.executable, '-m', 'watermonitoring.simulator', '--port', '0',
+               '--records', str(records)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("listening on"):
+        process.kill()
+        raise SystemExit("simulator did not start")
+    host, port = line.split()[-1].rsplit(':', 1)
+    return process, host, int(port)
+
+
+def start_xvfb():
+    """Xvfb process serving $DISPLAY, None if there is no Xvfb"""
+    if shutil.which('Xvfb') is None:
+        return None
+    display = f":{XVFB_DISPLAY}"
+    process = subprocess.Popen(['Xvfb', display, '-screen', '0', '1280x800x24', '-nolisten', 'tcp'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_path = f"/tmp/.X11-unix/X{XVFB_DISPLAY}"
+    deadline = time.monotonic() + 5
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise SystemExit("Xvfb did not start")
+        time.sleep(0.05)
+    os.environ['DISPLAY'] = display
+    return process
+
+
+def run_gui(host, port, graph, timeout):
+    """(lags in ms, seconds of the test, app) of one test in the GUI"""
+    import tkinter as tk
+
+    import ta_water_monitoring_gui as gui
+
+    gui.ESP32_IP, gui.ESP32_PORT = host, port
+    root = tk.Tk()
+    app = gui.WaterQualityApp(root)
+    lags = []
+    state = {'started': None, 'ended': None}
+
+    def probe(expected=None):
+        now = time.perf_counter()
+        if expected is not None and state['started'] is not None:
+            lags.append(max(0.0, now - expected) * 1000)
+        root.after(PROBE_MS, probe, now + PROBE_MS / 1000)
+
+    def start():
+        state['started'] = time.perf_counter()
+        app.start_test("1", "60", save=False)
+
+    def watch():
+        if graph and app.graph_window is None and app.store is not None and len(app.store):
+            app.show_graph()
+        if app.response_text or time.perf_counter() - state['started'] > timeout:
+            state['ended'] = time.perf_counter()
+            app.on_close()
+            return
+        root.after(50, watch)
+
+    probe()
+    root.after(int(SETTLE_S * 1000), start)
+    root.after(int(SETTLE_S * 1000) + 50, watch)
+    root.mainloop()
+    return np.array(lags), state['ended'] - state['started'], app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000, help="records the simulator sends")
+    parser.add_argument('--max-lag-ms', type=float, default=50.0,
+                        help="allowed 99th percentile event-loop lag")
+    parser.add_argument('--no-graph', dest='graph', action='store_false',
+                        help="do not open the live graph")
+    parser.add_argument('--timeout', type=float, default=300.0, help="seconds the test may take")
+    args = parser.parse_args()
+
+    xvfb = None
+    if not os.environ.get('DISPLAY'):
+        xvfb = start_xvfb()
+        if xvfb is None:
+            print("SKIP: no $DISPLAY and no Xvfb installed")
+            return
+
+    process, host, port = start_simulator(args.records)
+    workdir = tempfile.mkdtemp(prefix='wq_ui_lag_')
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        lags, seconds, app = run_gui(host, port, args.graph, args.timeout)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        process.kill()
+        if xvfb is not None:
+            xvfb.kill()
+
+    rows = len(app.store)
+    snapshot = app.metrics.snapshot()
+    frame = snapshot['timings'].get('ui_frame_seconds', {})
+    waits = snapshot['timings'].get('ui_backpressure_seconds', {})
+    render = snapshot['timings'].get('render_seconds', {})
+    print(f"{app.response_text}")
+    print(f"{rows} rows in {seconds:.1f} s ({rows / seconds:,.0f} records/s), "
+          f"{app.bridge.frames} frames, graph {'open' if args.graph else 'closed'}")
+    print(f"frame ms: p50 {frame.get('p50', 0) * 1000:.1f}, p99 {frame.get('p99', 0) * 1000:.1f}, "
+          f"max {frame.get('max', 0) * 1000:.1f}; render ms p99 {render.get('p99', 0) * 1000:.1f}; "
+          f"receive thread held back {waits.get('count', 0)} times, {waits.get('sum', 0):.1f} s")
+    p50, p99 = np.percentile(lags, [50, 99]) if len(lags) else (0.0, 0.0)
+    top = lags.max() if len(lags) else 0.0
+    print(f"event-loop lag ms: p50 {p50:.1f}, p99 {p99:.1f}, max {top:.1f} ({len(lags)} probes)")
+    if not app.test_completed:
+        print("FAIL: the test did not complete")
+        sys.exit(1)
+    if p99 > args.max_lag_ms:
+        print(f"FAIL: 99th percentile lag above {args.max_lag_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Soak test: memory of continuous monitoring with a RingStore stays flat
+
+Runs one test of --records readings, one row per second of probe time
+across many days, against the simulator through acquire(), the path of
+`python -m watermonitoring.cli run --window`: acquisition engine, RingStore
+with a downsampled tier, reading log, alert rules and health analyzer.
+Samples the resident set size as it goes and fails when it grows by more
+than --tolerance-mb once the window is full. With --store full the test
+runs without a window, into a ReadingStore, for comparison.
+
+Usage: python benchmarks/soak_ring.py [--records 2000000] [--window 100000]
+       [--store ring|full] [--tolerance-mb 8]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.cli import acquire
+from watermonitoring.engine import DONE, Device
+from watermonitoring.metrics import Metrics
+from watermonitoring.simulator import FakeESP32
+
+# Samples of the RSS taken over the run
+SAMPLES = 20
+
+# Seconds between checks of the records received
+POLL_S = 0.05
+
+
+def rss_mb():
+    """Current resident set size; the peak where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        # ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def soak(records, window, folder, warmup):
+    """(engine, RSS samples, baseline RSS) of one test through acquire()"""
+    server = await FakeESP32(records=records, chunk_lines=1024).start()
+    metrics = Metrics()
+    every = max(records // SAMPLES, 1)
+    samples = []
+    state = {'baseline': None}
+
+    async def sample():
+        started = time.perf_counter()
+        taken = 0
+        while True:
+            done = metrics.counters.get('records_total', 0)
+            if state['baseline'] is None and done >= warmup:
+                state['baseline'] = rss_mb()
+            if done // every > taken:
+                taken = done // every
+                samples.append((done, rss_mb(), time.perf_counter() - started))
+            await asyncio.sleep(POLL_S)
+
+    sampler = asyncio.create_task(sample())
+    try:
+        with open(os.devnull, 'w') as sink:
+            engine = await acquire([Device('soak', server.host, server.port)], folder,
+                                   output='summary', out=sink, err=sink, window=window,
+                                   metrics=metrics, read_timeout=60.0)
+    finally:
+        sampler.cancel()
+        await server.close()
+    samples.append((metrics.counters.get('records_total', 0), rss_mb(), samples[-1][2] if samples else 0.0))
+    return engine, samples, state['baseline']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000000)
+    parser.add_argument('--window', type=int, default=100000, help="rows the RingStore holds")
+    parser.add_argument('--store', choices=('ring', 'full'), default='ring')
+    parser.add_argument('--tolerance-mb', type=float, default=8.0,
+                        help="allowed RSS growth after the warm-up")
+    args = parser.parse_args()
+
+    window = args.window if args.store == 'ring' else None
+    warmup = min(3 * args.window, args.records // 2)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as folder:
+        engine, samples, baseline = asyncio.run(soak(args.records, window, folder, warmup))
+    seconds = time.perf_counter() - started
+    session = engine.sessions['soak']
+
+    print(f"{args.store} store, window {args.window} rows, {session.totals.records} records "
+          f"({args.records / 86400:.1f} days at 1 Hz) in {seconds:.1f} s, "
+          f"{session.totals.records / seconds:,.0f} records/s")
+    print(f"{'records':>10} {'RSS MB':>8} {'seconds':>8}")
+    for count, rss, at in samples:
+        print(f"{count:>10} {rss:>8.1f} {at:>8.1f}")
+    if session.state != DONE:
+        print(f"FAIL: the test ended {session.state}: {session.error}")
+        sys.exit(1)
+    growth = max(rss for count, rss, _ in samples if count >= warmup) - baseline
+    print(f"RSS after warm-up ({warmup} records): {baseline:.1f} MB, growth {growth:+.1f} MB")
+    if growth > args.tolerance_mb:
+        print(f"FAIL: RSS grew by more than {args.tolerance_mb} MB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
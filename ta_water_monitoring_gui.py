@@ -3,29 +3,70 @@ import tkinter as tk
 from tkinter.ttk import *
 import socket
 import threading
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import csv
+import os
+import time
 from datetime import datetime
-import numpy as np
 import struct
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap import Style
+# Only the numpy-free protocol module is imported up front. The data stack
+# (numpy and the modules built on it) is loaded in the background once the
+# window is up, matplotlib when the graph is first opened.
+from watermonitoring.protocol import PARAMETERS, format_waktu
+from watermonitoring.metrics import METRICS, Capture, Metrics
+from watermonitoring.uibridge import UIBridge
+from watermonitoring.errors import ProbeError, SessionUnsupported
 
 # Configuration
 ESP32_IP = "192.168.1.100"  # Update with your ESP32's IP
 ESP32_PORT = 80
 SSID = "titanium"
 PASSWORD = "titanium"
+# Ask the ESP32 for binary records; firmware without support answers in text
+USE_BINARY_PROTOCOL = False
 
-# Define headers
-HEADERS = [
-    'waktu', 'save_pH', 'value_pH', 'interval_pH', 
-    'save_temp', 'value_temp', 'interval_temp', 
-    'save_DO', 'value_DO', 'interval_DO', 
-    'save_turb', 'value_turb', 'interval_turb', 
-    'current', 'voltage'
+# Folder for the crash-safe reading logs written while a test runs
+LOG_DIR = "log_data"
+# Archive every finished test is added to
+ARCHIVE_DIR = "arsip"
+
+# Frame time (ms) of the UI bridge: batches that arrived in between are
+# stored together, and the ResultsPage and graph refreshed at most once
+REFRESH_MS = 100
+
+# Series longer than this are drawn without point markers
+MARKER_LIMIT = 500
+
+# Most rows listed in the timestamp diagnostics window
+DIAGNOSTIC_ROWS = 1000
+
+# Interval (ms) of the probe measuring Tk event-loop lag
+LAG_PROBE_MS = 250
+
+# Rows kept in memory in continuous monitoring mode; older rows are only in
+# the reading log and the per-minute *_downsampled.csv
+MONITOR_WINDOW_ROWS = 100000
+
+# Format "Simpan Data" offers before preload() has asked
+# watermonitoring.export which formats are installed; CSV needs nothing
+DEFAULT_EXPORT_FORMAT = "csv"
+
+# Refresh interval (ms) of the open performance diagnostics panel
+DIAGNOSTICS_REFRESH_MS = 1000
+
+# Delay (ms) before the data stack is imported in the background, so the
+# first paint of the window is not competing with it
+PRELOAD_DELAY_MS = 200
+
+# Headroom added when a live graph axis has to grow, as a fraction of its span
+GRAPH_HEADROOM = 0.25
+
+GRAPH_TITLES = [
+    ('pH', 'pH Value', 'pH Sampling Interval (s)'),
+    ('Temperature', 'Temperature (°C)', 'Temp Sampling Interval (s)'),
+    ('Dissolved Oxygen', 'DO (mg/L)', 'DO Sampling Interval (s)'),
+    ('Turbidity', 'Turbidity (NTU)', 'Turb Sampling Interval (s)'),
 ]
 
 class WaterQualityApp:
@@ -33,13 +74,29 @@ class WaterQualityApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Water Quality Test")
-        self.root.geometry("900x600")
+        self.root.geometry("1200x600")
         
         # Initialize data storage
         self.test_completed = False
-        self.raw_data = []
-        self.parsed_data = []
-        self.last_data_hash = None
+        # Created with the data stack on the first test, see load_data_stack
+        self.store = None
+        self.record_log = None
+        self.alert_engine = None
+        self.health = None
+        self.chart_data = None
+        self.graph_window = None
+        self.profile_window = None
+        # File name of the export a worker is writing, see save_data
+        self.saving = None
+        self.metrics = Metrics()
+        # Worker threads hand readings and results to the Tk thread through the
+        # bridge; only the Tk thread touches the store and the widgets
+        self.bridge = UIBridge(root, REFRESH_MS, on_frame=self.refresh_results, metrics=self.metrics)
+        # Persistent connection to the ESP32, created with the data stack
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        # Set from the diagnostics panel: profile the next test only
+        self.capture_next = False
         self.response_text = ""
         
         # Create container frame
@@ -55,6 +112,85 @@ class WaterQualityApp:
             frame.grid(row=0, column=0, sticky="nsew")
         
         self.show_page("InputPage")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(PRELOAD_DELAY_MS, lambda: threading.Thread(
+            target=self.preload, daemon=True).start())
+        self.probe_loop_lag()
+    
+    def probe_loop_lag(self, expected=None):
+        """Record how late the periodic probe runs; a busy Tk thread shows up as lag"""
+        now = time.perf_counter()
+        if expected is not None:
+            self.metrics.observe('tk_loop_lag_seconds', max(0.0, now - expected))
+        self.root.after(LAG_PROBE_MS, self.probe_loop_lag, now + LAG_PROBE_MS / 1000)
+    
+    def preload(self):
+        """Import the data stack off the Tk thread while the window is idle"""
+        import watermonitoring.alerts
+        import watermonitoring.archive
+        import watermonitoring.backlog
+        import watermonitoring.chart
+        import watermonitoring.client
+        import watermonitoring.health
+        import watermonitoring.recordlog
+        from watermonitoring.export import available_formats
+        # Arrow and Parquet are only offered when pyarrow is installed
+        self.bridge.post(self.pages["ResultsPage"].show_formats, available_formats())
+        # Open the session to the ESP32 now, so the first test does not wait for it
+        status = self.probe_status()
+        self.bridge.post(self.pages["InputPage"].show_probe_status, status)
+    
+    def connection_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                from watermonitoring.session import ConnectionPool
+                self.pool = ConnectionPool(metrics=self.metrics)
+            return self.pool
+    
+    def probe_status(self):
+        """Short Indonesian description of the ESP32 connection"""
+        try:
+            with self.connection_pool().connection(ESP32_IP, ESP32_PORT) as probe:
+                status = probe.status()
+        except SessionUnsupported:
+            return "terhubung (firmware tanpa sesi)"
+        except ProbeError as e:
+            return f"tidak terhubung ({str(e)})"
+        return "terhubung, " + ", ".join(f"{key}={value}" for key, value in status.items())
+    
+    def load_data_stack(self, continuous=False):
+        """Create the reading store and chart data; imports numpy if preload has not yet
+        
+        With `continuous` the store is a RingStore of fixed size.
+        """
+        from watermonitoring.store import ReadingStore, RingStore
+        if self.store is not None and isinstance(self.store, RingStore) == continuous:
+            return
+        from watermonitoring.chart import ChartData
+        self.store = RingStore(MONITOR_WINDOW_ROWS) if continuous else ReadingStore()
+        self.chart_data = ChartData(self.store)
+    
+    def on_close(self):
+        # Worker threads blocked on a full bridge give up
+        self.bridge.close()
+        # Does not wait for a running test, its session is cut instead
+        if self.pool is not None:
+            self.pool.close()
+        # Flush the reading log of a running test before leaving
+        if self.record_log is not None:
+            try:
+                self.record_log.close()
+            except OSError:
+                # Nothing is left on screen to show it on
+                pass
+        self.root.destroy()
+    
+    def open_record_log(self):
+        """Start the append-only log receiving every reading of this test"""
+        os.makedirs(LOG_DIR, exist_ok=True)
+        from watermonitoring.recordlog import RecordLogWriter
+        filename = f"water_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wqlog"
+        return RecordLogWriter(os.path.join(LOG_DIR, filename))
     
     def show_page(self, page_name):
         frame = self.pages[page_name]
@@ -74,110 +210,21 @@ class WaterQualityApp:
         except:
             return "Unknown"
     
-    def send_to_esp32(self, depth, duration, save):
-        try:
-            # Create TCP socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)  # Increased timeout for data transfer
-            sock.connect((ESP32_IP, ESP32_PORT))
-            
-            # Create byte array with signature and data
-            data = bytearray()
-            
-            # Add signature "ABC" (3 bytes)
-            data.extend(b'ABC')
-            
-            # Add depth as integer (4 bytes)
-            data.extend(struct.pack('i', int(depth)))
-            
-            # Add duration as integer (4 bytes)
-            data.extend(struct.pack('i', int(duration)))
-            
-            # Add save status (1 byte)
-            data.extend(struct.pack('B', 1 if save else 0))
-            
-            # Send data
-            sock.sendall(data)
-            
-            # Create file-like object for reading lines
-            sock_file = sock.makefile('r')
-            
-            # Read response line by line
-            response_lines = []
-            finished = False
-            
-            while not finished:
-                line = sock_file.readline().strip()
-                if not line:
-                    break
-                
-                # Check if this is the last line
-                if ';' in line:
-                    tokens = line.split(';')
-                    # Last token is the sd_card_finished flag
-                    if tokens and tokens[-1] == '1':
-                        finished = True
-                
-                response_lines.append(line)
-            
-            sock_file.close()
-            return response_lines
-            
-        except socket.timeout:
-            return "Error: ESP32 response timeout"
-        except ConnectionRefusedError:
-            return "Error: Connection refused (ESP32 offline?)"
-        except OSError as e:
-            return f"Network Error: {str(e)}"
-        except struct.error as e:
-            return f"Data packing error: {str(e)}"
-        finally:
-            try:
-                sock.close()
-            except:
-                pass
+    def send_to_esp32(self, depth, duration, save, on_batch):
+        """Run a test over the pooled ESP32 connection, streaming the reply into `on_batch`
+
+        With `save` the records a broken reply left out are fetched from the
+        SD card, so a dropped link does not lose the test. Returns the
+        StreamTotals of the reply; failures raise ProbeError.
+        """
+        # Parse the response in batches as it arrives
+        with self.connection_pool().connection(ESP32_IP, ESP32_PORT) as probe:
+            if save:
+                from watermonitoring.backlog import run_saved_test
+                return run_saved_test(probe, depth, duration, on_batch, binary=USE_BINARY_PROTOCOL)
+            return probe.run_test(depth, duration, save, on_batch, binary=USE_BINARY_PROTOCOL)
     
-    def parse_response_data(self, response_lines):
-        """Parse the ESP32 response into structured data"""
-        self.raw_data = []
-        self.parsed_data = []
-        
-        if isinstance(response_lines, str):
-            return
-            
-        for line in response_lines:
-            if not line:
-                continue
-                
-            tokens = line.split(';')
-            if len(tokens) < 16:
-                continue
-                
-            try:
-                # Safely convert numeric fields
-                reading = {
-                    'waktu': tokens[0],
-                    'save_pH': int(round(float(tokens[1]))),
-                    'value_pH': float(tokens[2]),
-                    'interval_pH': int(round(float(tokens[3]))),
-                    'save_temp': int(round(float(tokens[4]))),
-                    'value_temp': float(tokens[5]),
-                    'interval_temp': int(round(float(tokens[6]))),
-                    'save_DO': int(round(float(tokens[7]))),
-                    'value_DO': float(tokens[8]),
-                    'interval_DO': int(round(float(tokens[9]))),
-                    'save_turb': int(round(float(tokens[10]))),
-                    'value_turb': float(tokens[11]),
-                    'interval_turb': int(round(float(tokens[12]))),
-                    'current': float(tokens[13]),
-                    'voltage': float(tokens[14])
-                }
-                self.parsed_data.append(reading)
-                self.raw_data.append(line)
-            except (ValueError, TypeError, IndexError) as e:
-                print(f"Error parsing line: {line}\nError: {str(e)}")
-    
-    def start_test(self, depth, duration, save):
+    def start_test(self, depth, duration, save, continuous=False):
         # Validate inputs
         try:
             depth_val = int(depth)
@@ -190,192 +237,612 @@ class WaterQualityApp:
         # Show sending message
         self.pages["InputPage"].update_response("Mengirim ke ESP32...")
         self.test_completed = False
+        from watermonitoring.alerts import AlertEngine
+        from watermonitoring.health import HealthMonitor
+        self.load_data_stack(continuous)
+        self.store.clear()
+        self.chart_data.reset()
+        if self.graph_window is not None:
+            # The open graph belongs to the previous test
+            self.graph_window.close()
+        record_log = None
+        log_error = None
+        started = datetime.now()
+        if continuous:
+            # Rows leaving the window are summarized per minute next to the reading log
+            self.store.tier.path = os.path.join(
+                LOG_DIR, f"water_quality_{started.strftime('%Y%m%d_%H%M%S')}_downsampled.csv")
+        # Alerts of this test are logged next to its reading log
+        alert_engine = self.alert_engine = AlertEngine(
+            depth=depth_val,
+            log_path=os.path.join(LOG_DIR, f"water_quality_{started.strftime('%Y%m%d_%H%M%S')}_alerts.csv"))
+        health = self.health = HealthMonitor(ESP32_IP)
+        
+        def ingest(results):
+            # On the Tk thread, once per frame with every batch that arrived since
+            from watermonitoring.parser import concat_columns
+            columns = concat_columns([result.columns for result in results])
+            start = len(self.store)
+            # Rules run on the new rows only, reusing the time axis of the store;
+            # in continuous mode a big frame may already have pushed some out
+            elapsed = self.store.extend(columns)
+            alert_engine.process(columns, elapsed)
+            health.process(columns, elapsed)
+            if not start and len(self.store):
+                self.show_page("ResultsPage")
+        
+        def on_batch(result):
+            nonlocal log_error
+            # Queued for the log writer thread, never waits for the disk. A
+            # failed log does not stop the test, it is reported at the end;
+            # ValueError means on_close already closed the log
+            if log_error is None:
+                try:
+                    record_log.append(result.columns)
+                except (OSError, ValueError) as e:
+                    log_error = e
+            # Waits here while the Tk thread is behind, which slows the probe down
+            self.bridge.push(ingest, result)
         
         # Send in separate thread
+        capture = None
+        if self.capture_next:
+            self.capture_next = False
+            capture = Capture(os.path.join(LOG_DIR, f"water_quality_{started.strftime('%Y%m%d_%H%M%S')}_profile"))
+        
         def communication_thread():
-            response = self.send_to_esp32(depth, duration, save)
-            self.response_text = response
-            
-            if isinstance(response, str) and response.startswith("Error:"):
-                # Handle network errors
-                self.test_completed = False
-                self.response_text = response
-                # Update response in ResultsPage
-                self.root.after(0, lambda: self.pages["ResultsPage"].update_response(response))
+            nonlocal record_log, log_error
+            self.metrics.count('tests_total')
+            try:
+                record_log = self.record_log = self.open_record_log()
+                if capture is not None:
+                    with capture:
+                        response = self.send_to_esp32(depth, duration, save, on_batch)
+                else:
+                    response = self.send_to_esp32(depth, duration, save, on_batch)
+            except ProbeError as e:
+                response = f"Error: {str(e)}"
+            except struct.error as e:
+                response = f"Data packing error: {str(e)}"
+            except Exception as e:
+                response = f"Data parsing error: {str(e)}"
+            finally:
+                if record_log is not None:
+                    try:
+                        record_log.close()
+                    except OSError as e:
+                        log_error = log_error or e
+                # Every batch received is in the store once the bridge is empty
+                self.bridge.flush()
+                alert_engine.close()
+            self.bridge.post(wrap_up, response)
+        
+        def wrap_up(response):
+            # On the Tk thread, the only one reading the store; the files are
+            # written by another worker from a copy of the rows
+            store = self.store
+            if continuous:
+                # Finishes the last bucket, the worker closes its file
+                store.tier.flush()
+            columns = None
+            if not isinstance(response, str) and not store.first:
+                columns = {name: column.copy() for name, column in store.columns().items()}
+            threading.Thread(target=write_out, args=(response, columns, store.first, store.tier),
+                             daemon=True).start()
+        
+        def write_out(response, columns, first, tier):
+            # Files of this test that could not be written, shown below its outcome
+            notes = []
+            if isinstance(response, str):
+                self.metrics.count('test_failures_total')
             else:
-                try:
-                    # Parse string data
-                    self.parse_response_data(response)
-                    self.test_completed = True
-                    # Update response with success message
-                    success_msg = f"Berhasil menerima {len(self.parsed_data)} data"
-                    self.root.after(0, lambda: self.pages["ResultsPage"].update_response(success_msg))
-                except Exception as e:
-                    self.test_completed = False
-                    error_msg = f"Data parsing error: {str(e)}"
-                    self.response_text = error_msg
-                    self.root.after(0, lambda: self.pages["ResultsPage"].update_response(error_msg))
+                notes.append(self.archive_session(columns, first, started, depth_val, duration_val))
+            if continuous:
+                tier.close()
+                if tier.error is not None:
+                    notes.append(f"Gagal menulis {tier.path}: {tier.error}")
+            notes.append(self.export_metrics())
+            notes = [note for note in notes if note is not None]
+            if isinstance(log_error, OSError):
+                notes.append(f"Gagal menulis {record_log.path}: {log_error}")
+            if alert_engine.error is not None:
+                notes.append(f"Gagal menulis log alarm: {alert_engine.error}")
             
-            # Switch to results page
-            self.root.after(0, lambda: self.show_page("ResultsPage"))
+            if isinstance(response, str):
+                # Handle network and parsing errors
+                self.bridge.post(self.finish_test, False, "\n".join([response] + notes))
+            else:
+                self.bridge.post(self.finish_test, True,
+                                 "\n".join([f"Berhasil menerima {response.summary()}"] + notes))
         
         threading.Thread(target=communication_thread, daemon=True).start()
     
+    def finish_test(self, completed, message):
+        """Show the outcome of a test; runs on the Tk thread"""
+        self.test_completed = completed
+        self.response_text = message
+        self.pages["ResultsPage"].update_response(message)
+        self.show_page("ResultsPage")
+    
+    def export_metrics(self):
+        """Write the metrics for scrapers and append a snapshot to the history
+        
+        Returns the text to show when the files could not be written.
+        """
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            self.metrics.write_prometheus(os.path.join(LOG_DIR, "metrics.prom"))
+            self.metrics.append_jsonl(os.path.join(LOG_DIR, "metrics.jsonl"))
+        except OSError as e:
+            return f"Gagal menulis metrik: {str(e)}"
+        return None
+    
+    def archive_session(self, columns, first, started, depth, duration):
+        """Add the finished test to the archive as a depth-tagged session
+        
+        `columns` is a copy of the rows of the test, None when the store no
+        longer held the `first` oldest ones. Runs on a worker thread; returns
+        the text to show when the test was not archived.
+        """
+        if first:
+            # The archive takes a session in one piece, the oldest rows are only in the reading log
+            return f"Tidak diarsipkan: {first} data tertua ada di {self.record_log.path}"
+        if not len(columns['time_ms']):
+            return None
+        from watermonitoring.archive import Archive
+        try:
+            Archive(ARCHIVE_DIR).add_session(columns, started, depth=depth,
+                                             duration=duration, device=ESP32_IP)
+        except (OSError, ValueError) as e:
+            return f"Gagal mengarsipkan data: {str(e)}"
+        # The depth profile grid now includes this test
+        self.bridge.post(self.refresh_profile)
+        return None
+    
+    def refresh_results(self):
+        """Refresh the ResultsPage and graph; once per bridge frame that brought data"""
+        self.pages["ResultsPage"].update_display()
+        if self.graph_window is not None:
+            self.graph_window.update_data()
+    
     def get_last_valid_reading(self, save_key, value_key, interval_key):
         """Find the last valid reading for a specific parameter"""
-        for data in reversed(self.parsed_data):
-            if data[save_key] == 1:  # Only consider valid readings
-                return data[value_key], data[interval_key]
-        return None, None
+        return self.store.last_valid(save_key)
     
     def save_data(self):
-        """Save test data to CSV file"""
-        if not self.raw_data:
+        """Save test data in the format chosen on the results page, CSV by default"""
+        if not len(self.store):
             self.pages["ResultsPage"].update_response("Tidak ada data untuk disimpan")
             return
         
-        filename = f"water_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        results = self.pages["ResultsPage"]
+        if self.saving is not None:
+            results.update_response(f"Masih menyimpan {self.saving}")
+            return
         
-        try:
-            with open(filename, 'w', newline='') as csvfile:
-                # Write header
-                writer = csv.writer(csvfile, delimiter=';')
-                writer.writerow(HEADERS)
-                
-                # Write data
-                for data in self.raw_data:
-                    # Only write the first 15 tokens (ignore sd_card_finished)
-                    writer.writerow(data.split(';')[:15])
-            
-            self.pages["ResultsPage"].update_response(f"Data disimpan sebagai {filename}")
-        except Exception as e:
-            self.pages["ResultsPage"].update_response(f"Gagal menyimpan: {str(e)}")
+        from watermonitoring.export import EXPORTERS, export, iter_column_chunks, iter_log_chunks
+        fmt = results.format_var.get()
+        filename = f"water_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}{EXPORTERS[fmt].extension}"
+        # A continuous test only holds its newest rows, the reading log has
+        # them all; otherwise the rows are copied here, on the Tk thread that
+        # owns the store, and the file is written by a worker
+        log_path = self.record_log.path if self.store.first else None
+        columns = None
+        if log_path is None:
+            columns = {name: column.copy() for name, column in self.store.columns().items()}
+        self.saving = filename
+        results.update_response(f"Menyimpan {filename}...")
+        
+        def write_file():
+            try:
+                chunks = iter_log_chunks(log_path) if log_path else iter_column_chunks(columns)
+                export(chunks, filename, fmt)
+                message = f"Data disimpan sebagai {filename}"
+            except Exception as e:
+                message = f"Gagal menyimpan: {str(e)}"
+            self.bridge.post(saved, message)
+        
+        def saved(message):
+            self.saving = None
+            results.update_response(message)
+        
+        threading.Thread(target=write_file, daemon=True).start()
     
     def show_graph(self):
-        """Display water quality graphs with value and interval plots"""
-        if not self.parsed_data:
+        """Open the live graph window, or bring the open one to the front"""
+        if not len(self.store):
             self.pages["ResultsPage"].update_response("Tidak ada data untuk ditampilkan")
             return
         
-        # Create a new window for graphs
-        graph_window = tk.Toplevel(self.root)
-        graph_window.title("Grafik Kualitas Air")
-        graph_window.geometry("1000x800")
-        
-        # Create figure for plots - 4 rows, 2 columns
-        fig, axs = plt.subplots(4, 2, figsize=(12, 16))
-        fig.suptitle("Parameter Kualitas Air dengan Interval Sampling", fontsize=12)
-        
-        # Convert waktu to seconds since first reading
-        time_seconds = []
-        base_time = None
-        for data in self.parsed_data:
-            t = data['waktu']
-            parts = t.split(':')
-            if len(parts) == 4:
-                try:
-                    # Convert H:M:S:ms to total seconds
-                    total_seconds = (int(parts[0]) * 3600 + 
-                                    int(parts[1]) * 60 + 
-                                    int(parts[2]) + 
-                                    int(parts[3])/1000.0)
-                    if base_time is None:
-                        base_time = total_seconds
-                    time_seconds.append(total_seconds - base_time)
-                except:
-                    time_seconds.append(0.0)
-            else:
-                time_seconds.append(0.0)
-        
-        # Initialize lists for valid data
-        valid_ph = {'time': [], 'value': []}
-        valid_temp = {'time': [], 'value': []}
-        valid_do = {'time': [], 'value': []}
-        valid_turb = {'time': [], 'value': []}
-        
-        # Collect only valid readings based on save flags
-        for i, data in enumerate(self.parsed_data):
-            if data['save_pH'] == 1:
-                valid_ph['time'].append(time_seconds[i])
-                valid_ph['value'].append(data['value_pH'])
-                
-            if data['save_temp'] == 1:
-                valid_temp['time'].append(time_seconds[i])
-                valid_temp['value'].append(data['value_temp'])
-                
-            if data['save_DO'] == 1:
-                valid_do['time'].append(time_seconds[i])
-                valid_do['value'].append(data['value_DO'])
-                
-            if data['save_turb'] == 1:
-                valid_turb['time'].append(time_seconds[i])
-                valid_turb['value'].append(data['value_turb'])
-        
-        # Plot pH values and intervals
-        self.plot_parameter(axs[0, 0], axs[0, 1], 
-                           valid_ph['value'],
-                           [d['interval_pH']/1000 for d in self.parsed_data if d['save_pH'] == 1],
-                           valid_ph['time'],
-                           'pH', 'pH Value', 'pH Sampling Interval (s)')
-        
-        # Plot Temperature values and intervals
-        self.plot_parameter(axs[1, 0], axs[1, 1], 
-                           valid_temp['value'],
-                           [d['interval_temp']/1000 for d in self.parsed_data if d['save_temp'] == 1],
-                           valid_temp['time'],
-                           'Temperature', 'Temperature (°C)', 'Temp Sampling Interval (s)')
-        
-        # Plot Dissolved Oxygen values and intervals
-        self.plot_parameter(axs[2, 0], axs[2, 1], 
-                           valid_do['value'],
-                           [d['interval_DO']/1000 for d in self.parsed_data if d['save_DO'] == 1],
-                           valid_do['time'],
-                           'Dissolved Oxygen', 'DO (mg/L)', 'DO Sampling Interval (s)')
-        
-        # Plot Turbidity values and intervals
-        self.plot_parameter(axs[3, 0], axs[3, 1], 
-                           valid_turb['value'],
-                           [d['interval_turb']/1000 for d in self.parsed_data if d['save_turb'] == 1],
-                           valid_turb['time'],
-                           'Turbidity', 'Turbidity (NTU)', 'Turb Sampling Interval (s)')
-        
-        plt.tight_layout(rect=[0, 0, 1, 0.96])
-        plt.subplots_adjust(hspace=0.5)
+        if self.graph_window is None:
+            self.graph_window = GraphWindow(self)
+        else:
+            self.graph_window.window.lift()
+            self.graph_window.update_data()
 
-        # Embed plot in Tkinter window
-        canvas = FigureCanvasTkAgg(fig, master=graph_window)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    def show_profile(self):
+        """Open the depth x time heatmap of the archive, or bring it to the front"""
+        if self.profile_window is None:
+            self.profile_window = ProfileWindow(self)
+        else:
+            self.profile_window.window.lift()
+    
+    def refresh_profile(self):
+        if self.profile_window is not None:
+            self.profile_window.load()
+    
+    def show_performance(self):
+        """Open the live performance diagnostics panel"""
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostik Kinerja")
+        window.geometry("700x450")
         
-        # Add a close button
-        close_btn = tk.Button(graph_window, text="Tutup", 
-                             command=graph_window.destroy,
-                             bg="#f44336", fg="white", padx=10, pady=5)
-        close_btn.pack(pady=10)
+        columns = ("metric", "value")
+        table = ttk.Treeview(window, columns=columns, show="headings")
+        table.heading("metric", text="Metrik")
+        table.heading("value", text="Nilai")
+        table.column("metric", width=380)
+        table.column("value", width=280)
+        table.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        controls = tk.Frame(window)
+        controls.pack(fill="x", padx=10, pady=5)
+        capture_var = BooleanVar(value=self.capture_next)
+        
+        def toggle_capture():
+            self.capture_next = capture_var.get()
+        
+        Checkbutton(controls, text="Profil pengujian berikutnya (cProfile + tracemalloc)",
+                    variable=capture_var, command=toggle_capture).pack(side="left")
+        status = tk.Label(controls, text="")
+        
+        def export():
+            error = self.export_metrics()
+            status.config(text=error or f"Disimpan di {LOG_DIR}/metrics.prom dan metrics.jsonl")
+        
+        tk.Button(controls, text="Ekspor", command=export).pack(side="right")
+        status.pack(side="right", padx=10)
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            snapshot = self.metrics.snapshot()
+            rows = []
+            for name, value in sorted(snapshot['counters'].items()):
+                rows.append((METRICS.get(name, (None, name))[1], f"{value:,}"))
+            for name, value in sorted(snapshot['gauges'].items()):
+                rows.append((METRICS.get(name, (None, name))[1], f"{value:,.0f} /s"))
+            for name, summary in sorted(snapshot['timings'].items()):
+                rows.append((METRICS.get(name, (None, name))[1],
+                             f"p50 {summary['p50'] * 1000:.1f} ms, p95 {summary['p95'] * 1000:.1f} ms, "
+                             f"maks {summary['max'] * 1000:.1f} ms (n={summary['count']})"))
+            table.delete(*table.get_children())
+            for row in rows:
+                table.insert("", "end", values=row)
+            window.after(DIAGNOSTICS_REFRESH_MS, refresh)
+        
+        refresh()
     
-    def plot_parameter(self, value_ax, interval_ax, values, intervals, timestamps, 
-                      title, value_label, interval_label):
-        """Plot parameter values and intervals in two subplots"""
-        # Plot values
-        value_ax.plot(timestamps, values, 'b-o')
-        value_ax.set_title(title + ' Values')
-        value_ax.set_ylabel(value_label)
-        value_ax.grid(True)
-        plt.subplots_adjust(hspace=0.5)
-        
-        # Plot intervals
-        if intervals:  # Only plot if we have interval data
-            interval_ax.plot(timestamps, intervals, 'r-o')
+    def show_health(self):
+        """Sampling interval, gap and power health of the probe in the last test"""
+        report = self.health.report()
+        window = tk.Toplevel(self.root)
+        window.title("Kesehatan Probe")
+        window.geometry("750x400")
+        tk.Label(window, text=self.health.summary(), anchor="w").pack(fill="x", padx=10, pady=5)
+        
+        def number(value, fmt):
+            return "-" if value is None else format(value, fmt)
+        
+        gaps = (f"{report['gaps']} celah, {report['lost_rows']} data hilang, "
+                f"terpanjang {report['longest_gap_ms'] / 1000:.1f} s")
+        power = (f"{number(report['power_w'], '.2f')} W, tegangan min {number(report['voltage_min'], '.2f')} V, "
+                 f"arus maks {number(report['current_max'], '.3f')} A")
+        tk.Label(window, text=f"{gaps}; {power}", anchor="w").pack(fill="x", padx=10)
+        
+        columns = ("param", "valid", "interval", "jitter", "drift", "power")
+        table = ttk.Treeview(window, columns=columns, show="headings")
+        for column, heading, width in (("param", "Parameter", 80), ("valid", "Valid", 70),
+                                       ("interval", "Interval (s)", 90),
+                                       ("jitter", "Jitter p5/p50/p95 (ms)", 190),
+                                       ("drift", "Drift", 80), ("power", "Daya sensor (W)", 120)):
+            table.heading(column, text=heading)
+            table.column(column, width=width)
+        for name, sensor in report['sensors'].items():
+            jitter = sensor['jitter_ms']
+            table.insert("", "end", values=(
+                name,
+                number(sensor['valid_ratio'] and sensor['valid_ratio'] * 100, '.1f') + " %",
+                number(sensor['mean_interval_s'], '.3f'),
+                " / ".join(f"{value:+.0f}" for value in jitter.values()) if jitter else "-",
+                number(sensor['drift'] and sensor['drift'] * 100, '+.1f') + " %",
+                number(sensor['power_draw_w'], '+.3f'),
+            ))
+        table.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        tk.Button(window, text="Tutup", command=window.destroy,
+                  bg="#f44336", fg="white", padx=10, pady=5).pack(pady=10)
+    
+    def show_time_diagnostics(self):
+        """List the rollover, out-of-order and malformed timestamps of the test"""
+        from watermonitoring.timeaxis import MALFORMED, NON_MONOTONIC, ROLLOVER
+        labels = {
+            MALFORMED: "Format waktu rusak",
+            NON_MONOTONIC: "Waktu mundur",
+            ROLLOVER: "Lewat tengah malam",
+        }
+        time_axis = self.store.time_axis
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostik Waktu")
+        window.geometry("600x400")
+        
+        counts = time_axis.counts()
+        summary = ", ".join(f"{labels[kind]}: {count}" for kind, count in counts.items())
+        if time_axis.issues[DIAGNOSTIC_ROWS:]:
+            summary += f" (ditampilkan {DIAGNOSTIC_ROWS} pertama)"
+        tk.Label(window, text=summary, anchor="w").pack(fill="x", padx=10, pady=5)
+        
+        table = ttk.Treeview(window, columns=("row", "kind", "waktu", "previous"), show="headings")
+        for column, heading, width in (("row", "Baris", 80), ("kind", "Jenis", 180),
+                                       ("waktu", "Waktu", 140), ("previous", "Sebelumnya", 140)):
+            table.heading(column, text=heading)
+            table.column(column, width=width)
+        for row, kind, stamp, previous in time_axis.issues[:DIAGNOSTIC_ROWS]:
+            table.insert("", "end", values=(row + 1, labels[kind],
+                                            format_waktu(stamp) or "-",
+                                            format_waktu(previous) or "-"))
+        table.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        tk.Button(window, text="Tutup", command=window.destroy,
+                  bg="#f44336", fg="white", padx=10, pady=5).pack(pady=10)
+
+class GraphWindow:
+    """Graph window that stays open and follows the readings as they arrive
+    
+    The figure and its line artists are created once. New readings only
+    change the line data, which is blitted over a cached background; the
+    whole figure is redrawn only when an axis range has to grow or the
+    user zooms, pans or resizes.
+    """
+    
+    def __init__(self, controller):
+        # matplotlib is the slowest import of the app, loaded on first use
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        self.controller = controller
+        self.chart = controller.chart_data
+        self.background = None
+        self.adjusting = False
+        # perf_counter() of a pending full redraw, timed until its draw_event
+        self.draw_requested = None
+        
+        # Create a new window for graphs
+        self.window = tk.Toplevel(controller.root)
+        self.window.title("Grafik Kualitas Air")
+        self.window.geometry("1000x800")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        # Create figure for plots - 4 rows, 2 columns. A plain Figure is not
+        # kept alive by pyplot once the window is closed
+        self.figure = Figure(figsize=(12, 16))
+        self.figure.suptitle("Parameter Kualitas Air dengan Interval Sampling", fontsize=12)
+        axs = self.figure.subplots(4, 2)
+        
+        self.series = []
+        self.avg_lines = {}
+        for row, ((name, _, _, _), (title, value_label, interval_label)) in enumerate(
+                zip(PARAMETERS, GRAPH_TITLES)):
+            value_ax, interval_ax = axs[row]
+            value_ax.set_title(title + ' Values')
+            value_ax.set_ylabel(value_label)
+            value_ax.grid(True)
             interval_ax.set_title(title + ' Sampling Intervals')
             interval_ax.set_ylabel(interval_label)
             interval_ax.grid(True)
+            self.add_series(value_ax, self.chart.values[name], 'b')
+            self.add_series(interval_ax, self.chart.intervals[name], 'r')
             
-            # Add horizontal line for average interval
-            if len(intervals) > 0:
-                avg_interval = np.mean(intervals)
-                interval_ax.axhline(y=avg_interval, color='g', linestyle='--', 
-                                   label=f'Avg: {avg_interval:.2f} s')
-                interval_ax.legend()
+            # Horizontal line for the average interval
+            self.avg_lines[name] = interval_ax.axhline(y=0, color='g', linestyle='--',
+                                                       label='Avg: -', animated=True)
+            interval_ax.legend(loc='upper right')
+        
+        self.figure.tight_layout(rect=[0, 0, 1, 0.96])
+        self.figure.subplots_adjust(hspace=0.5)
+        
+        # Embed plot in Tkinter window, the toolbar provides zoom and pan
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        NavigationToolbar2Tk(self.canvas, self.window).update()
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        # Add a close button
+        close_btn = tk.Button(self.window, text="Tutup", 
+                             command=self.close,
+                             bg="#f44336", fg="white", padx=10, pady=5)
+        close_btn.pack(pady=10)
+        
+        self.update_data(force=True)
+    
+    def add_series(self, ax, pyramid, color):
+        """Create the persistent line of one pyramid on its axes"""
+        line, = ax.plot([], [], color + '-', animated=True)
+        series = {'ax': ax, 'line': line, 'pyramid': pyramid, 'follow': True, 'scaled': False}
+        self.series.append(series)
+        
+        def on_xlim(axes):
+            # Zooming or panning away from the newest data stops the axes
+            # from following it; coming back to the end resumes following
+            if not self.adjusting and len(pyramid):
+                series['follow'] = axes.get_xlim()[1] >= pyramid.raw_x.view()[-1]
+            self.refine(series)
+        
+        ax.callbacks.connect('xlim_changed', on_xlim)
+    
+    def refine(self, series):
+        """Load the points of the visible x range into the line"""
+        ax, line, pyramid = series['ax'], series['line'], series['pyramid']
+        max_points = 2 * max(int(ax.get_window_extent().width), 100)
+        x0, x1 = ax.get_xlim()
+        line.set_data(*pyramid.fetch(x0, x1, max_points))
+        line.set_marker('o' if len(pyramid) <= MARKER_LIMIT else '')
+    
+    def grow_limits(self, series):
+        """Widen a following axes to cover all data; True if limits changed"""
+        ax, pyramid = series['ax'], series['pyramid']
+        if not series['follow'] or not len(pyramid):
+            return False
+        # Every level keeps the extremes, so a coarse fetch gives the y range
+        _, y = pyramid.fetch(max_points=1000)
+        x_end = pyramid.raw_x.view()[-1]
+        y_lo, y_hi = float(y.min()), float(y.max())
+        x0, x1 = ax.get_xlim()
+        y0, y1 = ax.get_ylim()
+        if not series['scaled']:
+            # Forget the placeholder limits of the empty axes
+            x0, x1, y0, y1 = 0.0, 0.0, y_lo, y_hi
+        changed = False
+        self.adjusting = True
+        if self.chart.start and x0 < pyramid.raw_x.view()[0]:
+            # The store no longer holds the oldest rows (see RingStore), follow its window
+            x0 = pyramid.raw_x.view()[0]
+            x1 = max(x1, x0 + 1.0)
+            ax.set_xlim(x0, x1)
+            changed = True
+        if x_end >= x1:
+            ax.set_xlim(x0, x0 + max(x_end - x0, 1.0) * (1 + GRAPH_HEADROOM))
+            changed = True
+        if not series['scaled'] or y_lo < y0 or y_hi > y1:
+            pad = max(y_hi - y_lo, abs(y_hi) * 0.1, 1e-3) * GRAPH_HEADROOM
+            ax.set_ylim(min(y0, y_lo) - pad, max(y1, y_hi) + pad)
+            changed = True
+        self.adjusting = False
+        series['scaled'] = True
+        return changed
+    
+    def update_data(self, force=False):
+        """Take in new readings; redraws only when the data changed"""
+        if not self.chart.update() and not force:
+            return
+        started = time.perf_counter()
+        full_redraw = force or self.background is None
+        for series in self.series:
+            if self.grow_limits(series):
+                full_redraw = True
+            self.refine(series)
+        for name, line in self.avg_lines.items():
+            avg_interval = self.chart.mean_interval(name)
+            if avg_interval is not None:
+                line.set_ydata([avg_interval, avg_interval])
+                line.set_label(f'Avg: {avg_interval:.2f} s')
+        if full_redraw:
+            for line in self.avg_lines.values():
+                line.axes.legend(loc='upper right')
+            self.draw_requested = started
+            self.canvas.draw_idle()
+        else:
+            self.blit()
+            self.controller.metrics.observe('render_seconds', time.perf_counter() - started)
+    
+    def on_draw(self, event):
+        # Full redraws skip the animated lines; keep the result as the
+        # background for blitting and put the lines back on top
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
+        if self.draw_requested is not None:
+            self.controller.metrics.observe('render_seconds',
+                                            time.perf_counter() - self.draw_requested)
+            self.draw_requested = None
+    
+    def blit(self):
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.figure.bbox)
+    
+    def draw_lines(self):
+        for series in self.series:
+            series['ax'].draw_artist(series['line'])
+        for line in self.avg_lines.values():
+            line.axes.draw_artist(line)
+    
+    def close(self):
+        """Destroy the window and release the figure"""
+        self.window.destroy()
+        self.figure.clear()
+        self.series = []
+        self.background = None
+        self.controller.graph_window = None
+
+class ProfileWindow:
+    """Heatmap of one parameter over depth and time across archived tests
+
+    Drawn from the archive's pre-aggregated depth x time grid, so opening
+    it costs the same for a day or for months of data.
+    """
+    
+    def __init__(self, controller):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from watermonitoring.profile import PROFILE_LABELS
+        self.controller = controller
+        self.grid = None
+        
+        self.window = tk.Toplevel(controller.root)
+        self.window.title("Profil Kedalaman")
+        self.window.geometry("1000x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        # Parameter and statistic selection
+        controls = tk.Frame(self.window)
+        controls.pack(fill="x", padx=10, pady=5)
+        self.names = {label: name for name, label in PROFILE_LABELS.items()}
+        self.parameter_var = StringVar(value=next(iter(self.names)))
+        self.stat_var = StringVar(value="mean")
+        tk.Label(controls, text="Parameter:").pack(side="left")
+        parameter_box = Combobox(controls, textvariable=self.parameter_var,
+                                 values=list(self.names), state="readonly", width=25)
+        parameter_box.pack(side="left", padx=5)
+        tk.Label(controls, text="Statistik:").pack(side="left")
+        stat_box = Combobox(controls, textvariable=self.stat_var,
+                            values=["mean", "min", "max", "count"], state="readonly", width=8)
+        stat_box.pack(side="left", padx=5)
+        parameter_box.bind("<<ComboboxSelected>>", lambda event: self.draw())
+        stat_box.bind("<<ComboboxSelected>>", lambda event: self.draw())
+        
+        self.figure = Figure(figsize=(10, 5))
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        NavigationToolbar2Tk(self.canvas, self.window).update()
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        close_btn = tk.Button(self.window, text="Tutup", 
+                             command=self.close,
+                             bg="#f44336", fg="white", padx=10, pady=5)
+        close_btn.pack(pady=10)
+        
+        self.load()
+    
+    def load(self):
+        """Read the archive's grid again, e.g. after a test was archived"""
+        from watermonitoring.archive import Archive
+        try:
+            self.grid = Archive(ARCHIVE_DIR).profile()
+        except (OSError, ValueError) as e:
+            self.controller.pages["InputPage"].update_response(f"Gagal membaca arsip: {str(e)}")
+            return
+        self.draw()
+    
+    def draw(self):
+        from watermonitoring.profile import plot_profile
+        if self.grid is None:
+            return
+        plot_profile(self.figure, self.grid, self.names[self.parameter_var.get()],
+                     self.stat_var.get())
+        self.canvas.draw_idle()
+    
+    def close(self):
+        self.window.destroy()
+        self.figure.clear()
+        self.controller.profile_window = None
 
 class InputPage(tk.Frame):
     def __init__(self, parent, controller):
@@ -404,31 +871,56 @@ class InputPage(tk.Frame):
         self.depth_entry = Entry(main_frame, width=20)
         self.duration_entry = Entry(main_frame, width=20)
         
+        # Long tests keep only the newest readings in memory
+        self.continuous_var = BooleanVar(value=False)
+        continuous_check = Checkbutton(main_frame, text="Pemantauan kontinu (memori tetap)",
+                                       variable=self.continuous_var)
+        
         # Buttons
         send_btn = Button(main_frame, text="Kirim", 
                           command=self.send_test, width=15, bg="#009DFF", fg="#ffffff")
         ambil_btn = Button(main_frame, text="Ambil Data", 
                           command=self.start_test, width=15, bg="#4CAF50", fg="#ffffff")
+        profile_btn = Button(main_frame, text="Profil Kedalaman", 
+                             command=self.controller.show_profile, width=15, bg="#009DFF", fg="#ffffff")
+        performance_btn = Button(main_frame, text="Diagnostik Kinerja", 
+                                 command=self.controller.show_performance, width=15, bg="#009DFF", fg="#ffffff")
         
         # Response display
         self.response_var = StringVar()
         response_label = Label(main_frame, textvariable=self.response_var, 
                               fg="blue", wraplength=400, justify="left", bg="#ffffff")
         
-        # IP display
-        computer_ip = self.controller.get_local_ip()
-        ip_info = f"Computer IP: {computer_ip}\nESP32 IP: {ESP32_IP}\nSSID: {SSID}"
-        ip_label = Label(main_frame, text=ip_info, fg="green", justify="left", bg="#ffffff")
+        # IP display, the lookup runs in the background so it never delays
+        # the first paint
+        ip_info = "Computer IP: {}\nESP32 IP: " + f"{ESP32_IP}\nSSID: {SSID}"
+        ip_label = Label(main_frame, text=ip_info.format("mencari..."), fg="green",
+                         justify="left", bg="#ffffff")
+        
+        def lookup_ip():
+            computer_ip = self.controller.get_local_ip()
+            self.controller.bridge.post(lambda: ip_label.config(text=ip_info.format(computer_ip)))
+        
+        threading.Thread(target=lookup_ip, daemon=True).start()
+        
+        # Connection state, filled in once the session is opened in the background
+        self.probe_var = StringVar(value="Status ESP32: memeriksa...")
+        probe_label = Label(main_frame, textvariable=self.probe_var, fg="green",
+                            justify="left", wraplength=400, bg="#ffffff")
         
         # Layout
         depth_label.grid(row=0, column=0, sticky="w", pady=5)
         self.depth_entry.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
         duration_label.grid(row=1, column=0, sticky="w", pady=5)
         self.duration_entry.grid(row=1, column=1, padx=10, pady=5, sticky="ew")
-        send_btn.grid(row=2, column=0, pady=10, padx=5)
-        ambil_btn.grid(row=2, column=1, pady=10, padx=5)
-        response_label.grid(row=3, column=0, columnspan=2, pady=5, sticky="w")
-        ip_label.grid(row=4, column=0, columnspan=2, pady=5, sticky="w")
+        continuous_check.grid(row=2, column=0, columnspan=2, pady=5, sticky="w")
+        send_btn.grid(row=3, column=0, pady=10, padx=5)
+        ambil_btn.grid(row=3, column=1, pady=10, padx=5)
+        profile_btn.grid(row=4, column=0, pady=(0, 10), padx=5)
+        performance_btn.grid(row=4, column=1, pady=(0, 10), padx=5)
+        response_label.grid(row=5, column=0, columnspan=2, pady=5, sticky="w")
+        ip_label.grid(row=6, column=0, columnspan=2, pady=5, sticky="w")
+        probe_label.grid(row=7, column=0, columnspan=2, pady=5, sticky="w")
         
         # Configure grid columns
         main_frame.columnconfigure(0, weight=1)
@@ -437,15 +929,20 @@ class InputPage(tk.Frame):
     def send_test(self):
         depth = self.depth_entry.get()
         duration = self.duration_entry.get()
-        self.controller.start_test(depth, duration, save=False)
+        self.controller.start_test(depth, duration, save=False,
+                                   continuous=self.continuous_var.get())
     
     def start_test(self):
         depth = self.depth_entry.get()
         duration = self.duration_entry.get()
-        self.controller.start_test(depth, duration, save=True)
+        self.controller.start_test(depth, duration, save=True,
+                                   continuous=self.continuous_var.get())
     
     def update_response(self, message):
         self.response_var.set(message)
+    
+    def show_probe_status(self, status):
+        self.probe_var.set(f"Status ESP32: {status}")
 
 class ResultsPage(tk.Frame):
     def __init__(self, parent, controller):
@@ -477,6 +974,18 @@ class ResultsPage(tk.Frame):
                               fg="blue", wraplength=300, justify="left", bg="#ffffff")
         response_label.pack(anchor="w", pady=5)
         
+        # Newest alert of the alert engine
+        self.alert_var = StringVar()
+        alert_label = Label(status_frame, textvariable=self.alert_var, 
+                           fg="#f44336", wraplength=800, justify="left", bg="#ffffff")
+        alert_label.pack(anchor="w")
+        
+        # Health score of the probe, see watermonitoring.health
+        self.health_var = StringVar()
+        health_label = Label(status_frame, textvariable=self.health_var, 
+                            wraplength=800, justify="left", bg="#ffffff")
+        health_label.pack(anchor="w")
+        
         # Main content
         content_frame = tk.Frame(self, bg="#ffffff")
         content_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -494,7 +1003,12 @@ class ResultsPage(tk.Frame):
             fg="white",
             state="disabled"
         )
-        self.save_btn.pack(pady=10)
+        self.save_btn.pack(pady=(10, 0))
+        
+        self.format_var = StringVar(value=DEFAULT_EXPORT_FORMAT)
+        self.format_box = Combobox(button_frame, textvariable=self.format_var,
+                                   values=(DEFAULT_EXPORT_FORMAT,), state="readonly", width=13)
+        self.format_box.pack(pady=(2, 10))
         
         self.graph_btn = Button(
             button_frame,
@@ -507,6 +1021,28 @@ class ResultsPage(tk.Frame):
         )
         self.graph_btn.pack(pady=10)
         
+        self.time_btn = Button(
+            button_frame,
+            text="Diagnostik Waktu",
+            command=self.controller.show_time_diagnostics,
+            width=15,
+            bg="#9E9E9E",
+            fg="white",
+            state="disabled"
+        )
+        self.time_btn.pack(pady=10)
+        
+        self.health_btn = Button(
+            button_frame,
+            text="Kesehatan Probe",
+            command=self.controller.show_health,
+            width=15,
+            bg="#9E9E9E",
+            fg="white",
+            state="disabled"
+        )
+        self.health_btn.pack(pady=10)
+        
         # Right panel - Results
         results_frame = tk.Frame(content_frame, bg="#ffffff", padx=10, pady=10)
         results_frame.pack(side="right", fill="both", expand=True)
@@ -555,6 +1091,16 @@ class ResultsPage(tk.Frame):
             pady=5
         ).grid(row=0, column=2, sticky="ew", padx=1, pady=1)
         
+        tk.Label(
+            grid_frame,
+            text="Statistik (min / rata-rata ± sd / maks)",
+            font=("Arial", 12, "bold"),
+            bg="#e0e0e0",
+            width=34,
+            padx=10,
+            pady=5
+        ).grid(row=0, column=3, sticky="ew", padx=1, pady=1)
+        
         # Parameter rows
         self.param_labels = {}
         
@@ -605,6 +1151,20 @@ class ResultsPage(tk.Frame):
             )
             interval_label.grid(row=i, column=2, sticky="ew", padx=1, pady=1)
             self.param_labels[f"{param.lower().replace(' ', '_')}_interval"] = interval_label
+            
+            # Running statistics of all valid readings
+            stats_label = tk.Label(
+                grid_frame,
+                text="-",
+                font=("Arial", 11),
+                bg="#ffffff",
+                width=34,
+                padx=10,
+                pady=5,
+                anchor="center"
+            )
+            stats_label.grid(row=i, column=3, sticky="ew", padx=1, pady=1)
+            self.param_labels[f"{param.lower().replace(' ', '_')}_stats"] = stats_label
         
         # Data display
         data_frame = tk.Frame(results_frame, bg="#ffffff", pady=10)
@@ -649,67 +1209,103 @@ class ResultsPage(tk.Frame):
     
     def update_display(self):
         """Update the display with test results"""
-        if self.controller.test_completed and self.controller.parsed_data:
+        store = self.controller.store
+        if self.controller.test_completed and len(store):
             # Update status
             self.status_var.set("Status: Pengujian Selesai")
             
             # Enable buttons
             self.save_btn.config(state="normal")
             self.graph_btn.config(state="normal")
-            
-            # Get last valid readings
-            # pH
-            ph_value, ph_interval = self.controller.get_last_valid_reading('save_pH', 'value_pH', 'interval_pH')
-            if ph_value is not None:
-                self.param_labels['ph_value'].config(text=f"{ph_value:.2f}")
-                self.param_labels['ph_interval'].config(text=f"{ph_interval/1000:.1f} detik")
-            else:
-                self.param_labels['ph_value'].config(text="Tidak ada data")
-                self.param_labels['ph_interval'].config(text="Tidak ada data")
-            
-            # Temperature
-            temp_value, temp_interval = self.controller.get_last_valid_reading('save_temp', 'value_temp', 'interval_temp')
-            if temp_value is not None:
-                self.param_labels['suhu_value'].config(text=f"{temp_value:.2f} °C")
-                self.param_labels['suhu_interval'].config(text=f"{temp_interval/1000:.1f} detik")
-            else:
-                self.param_labels['suhu_value'].config(text="Tidak ada data")
-                self.param_labels['suhu_interval'].config(text="Tidak ada data")
-            
-            # Dissolved Oxygen
-            do_value, do_interval = self.controller.get_last_valid_reading('save_DO', 'value_DO', 'interval_DO')
-            if do_value is not None:
-                self.param_labels['oksigen_terlarut_value'].config(text=f"{do_value:.2f} mg/L")
-                self.param_labels['oksigen_terlarut_interval'].config(text=f"{do_interval/1000:.1f} detik")
-            else:
-                self.param_labels['oksigen_terlarut_value'].config(text="Tidak ada data")
-                self.param_labels['oksigen_terlarut_interval'].config(text="Tidak ada data")
-            
-            # Turbidity
-            turb_value, turb_interval = self.controller.get_last_valid_reading('save_turb', 'value_turb', 'interval_turb')
-            if turb_value is not None:
-                self.param_labels['turbidity_value'].config(text=f"{turb_value:.2f} NTU")
-                self.param_labels['turbidity_interval'].config(text=f"{turb_interval/1000:.1f} detik")
-            else:
-                self.param_labels['turbidity_value'].config(text="Tidak ada data")
-                self.param_labels['turbidity_interval'].config(text="Tidak ada data")
-            
-            # Show last data string
-            if self.controller.raw_data:
-                self.data_var.set(self.controller.raw_data[-1])
         else:
             # Show in-progress status
-            self.status_var.set("Status: Pengujian sedang berlangsung...")
+            if len(store):
+                self.status_var.set(f"Status: Pengujian sedang berlangsung... ({len(store)} data)")
+            else:
+                self.status_var.set("Status: Pengujian sedang berlangsung...")
             
-            # Disable buttons until test completes
+            # Disable saving until the test completes; the graph follows the
+            # data live and is available as soon as readings arrive
             self.save_btn.config(state="disabled")
-            self.graph_btn.config(state="disabled")
-            
-            # Schedule another update
-            self.after(1000, self.update_display)
+            self.graph_btn.config(state="normal" if len(store) else "disabled")
+        self.time_btn.config(state="normal" if len(store) else "disabled")
+        self.health_btn.config(state="normal" if len(store) else "disabled")
+        
+        # Readings stream in while the test runs, show the newest ones
+        if len(store):
+            self.show_last_readings()
+        self.show_alerts()
+        health = self.controller.health
+        self.health_var.set(health.summary() if health is not None else "")
+    
+    def show_alerts(self):
+        alert_engine = self.controller.alert_engine
+        if alert_engine is None or not alert_engine.total:
+            self.alert_var.set("")
+            return
+        active = len(alert_engine.active)
+        self.alert_var.set(f"Peringatan ({alert_engine.total}, {active} aktif): {alert_engine.alerts[-1]}")
+    
+    def show_last_readings(self):
+        """Fill the parameter grid and "Data Terakhir" from the newest data"""
+        # Get last valid readings
+        # pH
+        ph_value, ph_interval = self.controller.get_last_valid_reading('save_pH', 'value_pH', 'interval_pH')
+        if ph_value is not None:
+            self.param_labels['ph_value'].config(text=f"{ph_value:.2f}")
+            self.param_labels['ph_interval'].config(text=f"{ph_interval/1000:.1f} detik")
+        else:
+            self.param_labels['ph_value'].config(text="Tidak ada data")
+            self.param_labels['ph_interval'].config(text="Tidak ada data")
+        
+        # Temperature
+        temp_value, temp_interval = self.controller.get_last_valid_reading('save_temp', 'value_temp', 'interval_temp')
+        if temp_value is not None:
+            self.param_labels['suhu_value'].config(text=f"{temp_value:.2f} °C")
+            self.param_labels['suhu_interval'].config(text=f"{temp_interval/1000:.1f} detik")
+        else:
+            self.param_labels['suhu_value'].config(text="Tidak ada data")
+            self.param_labels['suhu_interval'].config(text="Tidak ada data")
+        
+        # Dissolved Oxygen
+        do_value, do_interval = self.controller.get_last_valid_reading('save_DO', 'value_DO', 'interval_DO')
+        if do_value is not None:
+            self.param_labels['oksigen_terlarut_value'].config(text=f"{do_value:.2f} mg/L")
+            self.param_labels['oksigen_terlarut_interval'].config(text=f"{do_interval/1000:.1f} detik")
+        else:
+            self.param_labels['oksigen_terlarut_value'].config(text="Tidak ada data")
+            self.param_labels['oksigen_terlarut_interval'].config(text="Tidak ada data")
+        
+        # Turbidity
+        turb_value, turb_interval = self.controller.get_last_valid_reading('save_turb', 'value_turb', 'interval_turb')
+        if turb_value is not None:
+            self.param_labels['turbidity_value'].config(text=f"{turb_value:.2f} NTU")
+            self.param_labels['turbidity_interval'].config(text=f"{turb_interval/1000:.1f} detik")
+        else:
+            self.param_labels['turbidity_value'].config(text="Tidak ada data")
+            self.param_labels['turbidity_interval'].config(text="Tidak ada data")
+        
+        # Summary statistics, kept up to date by the store as data arrives
+        for (name, _, _, _), key in zip(PARAMETERS, ('ph', 'suhu', 'oksigen_terlarut', 'turbidity')):
+            self.param_labels[f'{key}_stats'].config(text=self.format_stats(self.controller.store.stats(name)))
+        
+        # Show last data string
+        self.data_var.set(';'.join(self.controller.store.format_row(-1)))
+    
+    def format_stats(self, stats):
+        if not stats.count:
+            return "Tidak ada data"
+        std = f" ± {stats.std:.2f}" if stats.std is not None else ""
+        return f"{stats.min:.2f} / {stats.mean:.2f}{std} / {stats.max:.2f} (n={stats.count})"
     
     def update_response(self, message):
         self.response_var.set(message)
+    
+    def show_formats(self, formats):
+        """Offer the export formats whose dependencies are installed"""
+        self.format_box.config(values=formats)
+        if self.format_var.get() not in formats:
+            self.format_var.set(formats[0])
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+# The tests import the package from the checkout, as the benchmarks do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from watermonitoring.simulator import FakeESP32  # noqa: E402
+
+
+@pytest.fixture
+def simulator():
+    """Start FakeESP32 servers on a background event loop"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+
+    def start(**options):
+        server = asyncio.run_coroutine_threadsafe(FakeESP32(**options).start(), loop).result()
+        servers.append(server)
+        return server
+
+    yield start
+
+    async def shutdown():
+        for server in servers:
+            await server.close()
+        # Connection handlers still serving a session
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+
+from watermonitoring.alerts import (ALERT_LOG_HEADER, CLEAR_AFTER, AlertEngine, EwmaRule,
+                                    RateRule, ThresholdRule, ZScoreRule)
+from watermonitoring.parser import empty_columns, parse_buffer
+from watermonitoring.protocol import SAVE_BITS
+from watermonitoring.simulator import synthetic_lines
+
+
+def out_of_range_batch():
+    columns = parse_buffer(synthetic_lines(100)).columns
+    columns['value_pH'] = np.full(100, 12.0, dtype=np.float32)
+    return columns
+
+
+def ph_batch(values, step_ms=1000, start_ms=8 * 3600000):
+    """Columns of pH readings `step_ms` apart, every sensor saving"""
+    columns = empty_columns(len(values))
+    columns['time_ms'] = start_ms + np.arange(len(values), dtype=np.int64) * step_ms
+    columns['flags'][:] = sum(set(SAVE_BITS.values()))
+    columns['value_pH'] = np.asarray(values, dtype=np.float32)
+    return columns
+
+
+def wave(count):
+    """Clean readings: a slow swing of +-0.1 around pH 7"""
+    return 7.0 + 0.1 * np.sin(np.arange(count) / 5.0)
+
+
+def alert_rows(rule, values, **options):
+    engine = AlertEngine({'pH': [rule]})
+    return [alert.row for alert in engine.process(ph_batch(values, **options))]
+
+
+def test_threshold_fires_on_the_first_row_outside_either_limit():
+    values = wave(200)
+    values[50:55] = 8.7
+    values[120] = 6.2
+    assert alert_rows(ThresholdRule(6.5, 8.5), values) == [50, 120]
+    assert alert_rows(ThresholdRule(6.5, 8.5), wave(200)) == []
+
+
+def test_rate_fires_on_a_jump_but_not_on_the_same_change_spread_out():
+    values = wave(100)
+    values[40:] += 2.0
+    assert alert_rows(RateRule(1.0), values) == [40]
+    # The same jump over ten seconds is 0.2 per second
+    assert alert_rows(RateRule(1.0), values, step_ms=10000) == []
+
+
+def test_zscore_fires_on_a_spike_after_its_warm_up():
+    values = wave(300)
+    values[[5, 150]] += 1.0
+    # Row 5 has too few values before it to judge
+    assert alert_rows(ZScoreRule(window=60, limit=4.0, warmup=20), values) == [150]
+    assert alert_rows(ZScoreRule(), wave(1000)) == []
+
+
+def test_ewma_fires_once_on_a_level_shift_and_follows_it():
+    values = wave(600)
+    values[300:] += 1.0
+    engine = AlertEngine({'pH': [EwmaRule(alpha=0.05, limit=4.0, warmup=20)]})
+    assert [alert.row for alert in engine.process(ph_batch(values))] == [300]
+    # The mean has moved to the new level, so the alert has cleared
+    assert engine.active == []
+    assert alert_rows(EwmaRule(), wave(1000)) == []
+
+
+def test_a_value_hovering_at_the_limit_raises_one_alert_until_it_clears():
+    values = wave(200)
+    values[20:60:2] = 8.6
+    values[60 + CLEAR_AFTER + 10] = 8.6
+    values[60 + CLEAR_AFTER + 12] = 8.6
+    engine = AlertEngine({'pH': [ThresholdRule(6.5, 8.5)]})
+    assert [alert.row for alert in engine.process(ph_batch(values[:70]))] == [20]
+    assert engine.active == [('pH', 'threshold')]
+    # 58 was the last crossing; the alert clears CLEAR_AFTER values later
+    assert [alert.row for alert in engine.process(ph_batch(values[70:]))] == [60 + CLEAR_AFTER + 10]
+
+
+def test_batches_of_any_size_raise_the_alerts_of_one_batch():
+    columns = parse_buffer(synthetic_lines(3000, seed=4)).columns
+    columns['value_pH'][[500, 1700]] = 11.0
+    columns['value_temp'][2200:2400] += 6.0
+    whole = [(alert.row, alert.source, alert.kind) for alert in AlertEngine().process(columns)]
+    assert whole
+
+    engine = AlertEngine()
+    rng = np.random.default_rng(1)
+    cuts = np.sort(rng.choice(np.arange(1, 3000), 40, replace=False))
+    pieces = []
+    for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, 3000]):
+        batch = {name: column[lo:hi] for name, column in columns.items()}
+        pieces += [(alert.row, alert.source, alert.kind) for alert in engine.process(batch)]
+    assert sorted(pieces) == sorted(whole)
+
+
+def test_alert_log_is_written_off_the_calling_thread(tmp_path, monkeypatch):
+    path = tmp_path / 'alerts.csv'
+    engine = AlertEngine(log_path=str(path))
+    writers = []
+    real_open = open
+
+    def watched_open(file, *args, **kwargs):
+        if str(file) == str(path):
+            writers.append(threading.current_thread())
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', watched_open)
+    raised = engine.process(out_of_range_batch())
+    engine.close()
+    assert raised
+    assert writers and threading.current_thread() not in writers
+    lines = path.read_text().splitlines(keepends=True)
+    assert lines[0] == ALERT_LOG_HEADER
+    assert len(lines) == 1 + len(raised)
+
+
+def test_failing_alert_log_is_kept_in_error(tmp_path):
+    engine = AlertEngine(log_path=str(tmp_path / 'missing' / 'alerts.csv'))
+    engine.process(out_of_range_batch())
+    engine.close()
+    assert isinstance(engine.error, OSError)
+    assert engine.total
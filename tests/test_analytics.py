@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from watermonitoring.analytics import analyze, by_parameter, format_report, report_dict
+from watermonitoring.archive import Archive
+from watermonitoring.parser import concat_columns, parse_buffer
+from watermonitoring.protocol import HEADERS, PARAMETERS, SAVE_BITS, TIME_INVALID
+from watermonitoring.simulator import synthetic_lines
+from watermonitoring.store import ReadingStore
+
+DEPTHS = (1.0, 3.0, 1.0, 7.5)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """An archive of sessions at a few depths and a save_data CSV at depth 3"""
+    archive = Archive(str(tmp_path / 'arsip'))
+    columns = {}
+    for seed, depth in enumerate(DEPTHS):
+        session = parse_buffer(synthetic_lines(5000 + 700 * seed, seed=seed,
+                                               malformed_ratio=0.01)).columns
+        session['time_ms'][::97] = TIME_INVALID
+        archive.add_session(session, datetime(2026, 3, 1 + seed), depth=depth)
+        columns.setdefault(depth, []).append(session)
+
+    store = ReadingStore()
+    store.extend(parse_buffer(synthetic_lines(3000, seed=9)).columns)
+    csv_path = tmp_path / 'water_quality_20260305_120000.csv'
+    csv_path.write_text(';'.join(HEADERS) + '\n' + ''.join(';'.join(row) + '\n'
+                                                           for row in store.iter_rows()))
+    columns[3.0].append(store.columns())
+    return [archive.path, str(csv_path)], {depth: concat_columns(parts)
+                                           for depth, parts in columns.items()}
+
+
+def assert_same_report(report, expected):
+    assert report.keys() == expected.keys()
+    for key, aggregate in expected.items():
+        for kind in ('values', 'intervals'):
+            mine, theirs = getattr(report[key], kind), getattr(aggregate, kind)
+            assert mine.count == theirs.count and (mine.min, mine.max) == (theirs.min, theirs.max)
+            assert mine.mean == pytest.approx(theirs.mean, rel=1e-12)
+            assert mine.std == pytest.approx(theirs.std, rel=1e-9)
+        assert report[key].rows == aggregate.rows
+        assert report[key].sessions == aggregate.sessions
+
+
+def test_worker_processes_give_the_serial_report(sources):
+    paths, _ = sources
+    serial = analyze(paths, depth=3.0, workers=1, task_rows=1000)
+    assert_same_report(analyze(paths, depth=3.0, workers=3, task_rows=1000), serial)
+    # Task size only changes how the rows are split
+    assert_same_report(analyze(paths, depth=3.0, workers=2, task_rows=4096), serial)
+    assert format_report(analyze(paths, depth=3.0, workers=3)) == format_report(serial)
+
+
+def test_report_matches_numpy_over_all_rows_of_a_depth(sources):
+    paths, columns = sources
+    report = analyze(paths, depth=3.0, workers=2, task_rows=1500)
+    for depth, rows in columns.items():
+        stamped = rows['time_ms'] != TIME_INVALID
+        for name, _, value_key, interval_key in PARAMETERS:
+            valid = ((rows['flags'] & SAVE_BITS[name]) != 0) & stamped
+            values = rows[value_key][valid].astype(np.float64)
+            aggregate = report[(depth, name)]
+            assert aggregate.rows == len(rows['time_ms'])
+            assert aggregate.values.count == len(values)
+            assert aggregate.values.mean == pytest.approx(values.mean(), rel=1e-12)
+            assert aggregate.values.std == pytest.approx(values.std(ddof=1), rel=1e-9)
+            assert aggregate.values.min == values.min() and aggregate.values.max == values.max()
+            assert aggregate.intervals.mean == pytest.approx(
+                rows[interval_key][valid].mean() / 1000.0, rel=1e-12)
+    assert [len(report[(depth, 'pH')].sessions) for depth in (1.0, 3.0, 7.5)] == [2, 2, 1]
+    assert by_parameter(report)['pH'].values.count == sum(
+        np.count_nonzero((rows['flags'] & SAVE_BITS['pH']) & (rows['time_ms'] != TIME_INVALID))
+        for rows in columns.values())
+    assert [entry['depth'] for entry in report_dict(report)['depths']] == [1.0, 3.0, 7.5]
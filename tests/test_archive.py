@@ -0,0 +1,102 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from watermonitoring.archive import INDEX_STRIDE, Archive
+from watermonitoring.parser import empty_columns
+from watermonitoring.protocol import SAVE_BITS
+from watermonitoring.store import COLUMN_DTYPES
+
+DAY = datetime(2026, 3, 1)
+MIDNIGHT_MS = int(DAY.timestamp() * 1000)
+
+
+def session(rows, start_ms=8 * 3600000, step_ms=1000, seed=0):
+    """Columns of a test with every sensor saving, stamps wrapping at midnight"""
+    rng = np.random.default_rng(seed)
+    columns = empty_columns(rows)
+    columns['time_ms'] = (start_ms + np.arange(rows, dtype=np.int64) * step_ms) % 86400000
+    columns['flags'][:] = sum(set(SAVE_BITS.values()))
+    for name, dtype in COLUMN_DTYPES.items():
+        if name.startswith(('value_', 'interval_')):
+            columns[name] = rng.uniform(0, 1000, rows).astype(dtype)
+    return columns
+
+
+def test_columns_read_back_as_added(tmp_path):
+    archive = Archive(str(tmp_path))
+    columns = session(1000)
+    added = archive.add_session(columns, DAY, depth=2.0, device='probe')
+    assert added['rows'] == 1000 and added['start_ms'] == MIDNIGHT_MS + 8 * 3600000
+
+    reopened = Archive(str(tmp_path))
+    for name in COLUMN_DTYPES:
+        if name in ('time_ms', 'flags'):
+            continue
+        times, values = reopened.query(name, valid_only=False)
+        np.testing.assert_array_equal(times, MIDNIGHT_MS + columns['time_ms'])
+        np.testing.assert_array_equal(values, columns[name], err_msg=name)
+
+
+def test_time_range_query_matches_a_scan_of_every_row(tmp_path):
+    archive = Archive(str(tmp_path))
+    first = session(3 * INDEX_STRIDE + 100, seed=1)
+    second = session(INDEX_STRIDE + 7, start_ms=12 * 3600000, step_ms=250, seed=2)
+    archive.add_session(first, DAY, depth=1.0)
+    archive.add_session(second, DAY, depth=3.0)
+
+    times = MIDNIGHT_MS + np.concatenate([first['time_ms'], second['time_ms']])
+    values = np.concatenate([first['value_pH'], second['value_pH']])
+    # Edges inside blocks of both sessions, on a stamp and between two
+    for lo, hi in ((8 * 3600000 + 5000, 8 * 3600000 + 2 * INDEX_STRIDE * 1000 + 500),
+                   (8 * 3600000 + 3 * INDEX_STRIDE * 1000, 12 * 3600000 + 100000),
+                   (0, 86400000)):
+        mask = (times >= MIDNIGHT_MS + lo) & (times <= MIDNIGHT_MS + hi)
+        got_times, got_values = archive.query('value_pH', MIDNIGHT_MS + lo, MIDNIGHT_MS + hi)
+        np.testing.assert_array_equal(got_times, times[mask])
+        np.testing.assert_array_equal(got_values, values[mask])
+
+    _, deep = archive.query('value_pH', depth=3.0)
+    np.testing.assert_array_equal(deep, second['value_pH'])
+
+
+def test_session_across_midnight_is_found_on_both_days(tmp_path):
+    archive = Archive(str(tmp_path))
+    columns = session(180, start_ms=86400000 - 60000)
+    added = archive.add_session(columns, DAY)
+    next_day = MIDNIGHT_MS + 86400000
+    assert added['start_ms'] == next_day - 60000 and added['end_ms'] == next_day + 119000
+
+    times, values = archive.query('value_temp', datetime(2026, 3, 1, 23, 59, 30),
+                                  datetime(2026, 3, 2, 0, 0, 30))
+    np.testing.assert_array_equal(times, next_day + np.arange(-30000, 31000, 1000))
+    np.testing.assert_array_equal(values, columns['value_temp'][30:91])
+    assert [s['id'] for s in archive.find_sessions(start=next_day + 100000)] == [0]
+
+
+def test_writers_sharing_an_archive_append_one_after_another(tmp_path):
+    writers = [Archive(str(tmp_path)) for _ in range(4)]
+
+    def add(index, archive):
+        for number in range(5):
+            archive.add_session(session(INDEX_STRIDE + 10 * number, seed=index), DAY,
+                                device=f'probe{index}')
+
+    threads = [threading.Thread(target=add, args=item) for item in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    archive = Archive(str(tmp_path))
+    assert [s['id'] for s in archive.sessions] == list(range(20))
+    offset = 0
+    for added in archive.sessions:
+        assert added['offset'] == offset
+        offset += added['rows']
+    for index in range(4):
+        _, values = archive.query('value_DO', device=f'probe{index}', valid_only=False)
+        expected = [session(INDEX_STRIDE + 10 * number, seed=index)['value_DO'] for number in range(5)]
+        np.testing.assert_array_equal(values, np.concatenate(expected))
+    assert archive.profile().sessions == 20
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from watermonitoring import backlog
+from watermonitoring.backlog import Cursor, retrieve
+from watermonitoring.parser import parse_buffer
+from watermonitoring.session import ProbeConnection
+from watermonitoring.simulator import synthetic_lines
+
+STORED = 5000
+RECORDS = 1000
+
+
+@pytest.fixture(autouse=True)
+def no_resume_delay(monkeypatch):
+    monkeypatch.setattr(backlog, 'RESUME_DELAY', 0.0)
+
+
+def expected_times():
+    return parse_buffer(synthetic_lines(RECORDS) * (STORED // RECORDS)).columns['time_ms']
+
+
+def received_times(batches):
+    return np.concatenate([result.columns['time_ms'] for result in batches])
+
+
+def run(server, on_batch, cursor, **options):
+    probe = ProbeConnection(server.host, server.port)
+    try:
+        return retrieve(probe, on_batch, cursor, **options)
+    finally:
+        probe.close()
+
+
+class Crash(Exception):
+    pass
+
+
+def test_saved_cursor_resumes_after_the_last_chunk(simulator, tmp_path):
+    server = simulator(records=RECORDS, stored=STORED)
+    path = str(tmp_path / 'probe.cursor')
+    batches = []
+
+    def crash_after_two(result):
+        batches.append(result)
+        if len(batches) == 2:
+            raise Crash()
+
+    with pytest.raises(Crash):
+        run(server, crash_after_two, Cursor.load(path), chunk_records=800)
+    # The chunk being handed on when the process died is fetched again
+    assert Cursor.load(path).sequence == 800
+
+    del batches[1:]
+    totals = run(server, batches.append, Cursor.load(path), chunk_records=800)
+    assert totals.finished and totals.duplicates == 1 and totals.restarts == 0
+    np.testing.assert_array_equal(received_times(batches), expected_times())
+    assert Cursor.load(path).sequence == STORED
+
+
+def test_broken_fetches_resume_without_duplicates(simulator):
+    server = simulator(records=RECORDS, stored=STORED, chunk_lines=100, drop_every=1500)
+    batches = []
+    totals = run(server, batches.append, Cursor(), chunk_records=800)
+    assert server.drops and totals.resumes == server.drops
+    np.testing.assert_array_equal(received_times(batches), expected_times())
+
+
+def test_a_replaced_card_starts_over(simulator):
+    server = simulator(records=RECORDS, stored=STORED)
+    batches = []
+    totals = run(server, batches.append, Cursor(sequence=3000, last_time_ms=-5))
+    assert totals.restarts == 1
+    np.testing.assert_array_equal(received_times(batches), expected_times())
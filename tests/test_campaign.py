@@ -0,0 +1,86 @@
+import asyncio
+import json
+import shutil
+
+from watermonitoring.archive import Archive
+from watermonitoring.campaign import FAILED, QUEUED, RUNNING, CampaignScheduler, JobQueue
+from watermonitoring.engine import DONE
+
+
+def campaign_queue(path, server, depths=(1, 2)):
+    queue = JobQueue(str(path))
+    queue.add_campaign('profil', [f'probe={server.host}:{server.port}'], depths, duration=10)
+    return queue
+
+
+def scheduler(queue, log_dir, archive, finished=None):
+    log_dir.mkdir(exist_ok=True)
+    return CampaignScheduler(queue, str(log_dir), archive, on_job=finished,
+                             max_attempts=1, read_timeout=10.0)
+
+
+def test_a_stopped_scheduler_resumes_the_job_it_was_running(simulator, tmp_path):
+    server = simulator(records=40, rate=40, chunk_lines=4)
+    path = tmp_path / 'jobs.json'
+    archive = Archive(str(tmp_path / 'arsip'))
+    queue = campaign_queue(path, server)
+
+    async def second_job_saved():
+        # The file as a killed scheduler would leave it
+        while not any(job['id'] == 1 and job['state'] == RUNNING
+                      for job in json.loads(path.read_text())['jobs']):
+            await asyncio.sleep(0.01)
+
+    async def stop_during_second_job():
+        task = asyncio.create_task(scheduler(queue, tmp_path / 'logs', archive).run())
+        try:
+            await asyncio.wait_for(second_job_saved(), 10)
+            shutil.copy(path, tmp_path / 'killed.json')
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(stop_during_second_job())
+    assert [job['state'] for job in JobQueue(str(path)).jobs] == [DONE, QUEUED]
+
+    queue = JobQueue(str(tmp_path / 'killed.json'))
+    assert [job['state'] for job in queue.jobs] == [DONE, QUEUED]
+    asyncio.run(scheduler(queue, tmp_path / 'logs', archive).run())
+    jobs = JobQueue(str(tmp_path / 'killed.json')).jobs
+    assert [job['state'] for job in jobs] == [DONE, DONE]
+    assert [job['runs'] for job in jobs] == [1, 2]
+    assert [job['rows'] for job in jobs] == [40, 40]
+    assert [session['depth'] for session in Archive(str(tmp_path / 'arsip')).sessions] == [1, 2]
+
+
+class FullDisk(Archive):
+    """An archive whose disk fills up on the first session"""
+
+    def add_session(self, *args, **kwargs):
+        if not self.sessions and not getattr(self, 'failed', False):
+            self.failed = True
+            raise OSError(28, "No space left on device")
+        return super().add_session(*args, **kwargs)
+
+
+def test_a_job_that_cannot_be_archived_fails_alone(simulator, tmp_path):
+    server = simulator(records=50)
+    queue = campaign_queue(tmp_path / 'jobs.json', server, depths=(1, 2, 3))
+    archive = FullDisk(str(tmp_path / 'arsip'))
+    finished = []
+    asyncio.run(scheduler(queue, tmp_path / 'logs', archive, finished.append).run())
+
+    jobs = JobQueue(str(tmp_path / 'jobs.json')).jobs
+    assert [job['state'] for job in jobs] == [FAILED, DONE, DONE]
+    assert "No space left on device" in jobs[0]['error'] and jobs[0]['run_time'] is not None
+    assert [job['id'] for job in finished] == [0, 1, 2]
+    assert [job['session'] for job in jobs] == [None, 0, 1]
+
+
+def test_a_job_whose_log_cannot_be_created_fails_alone(simulator, tmp_path):
+    server = simulator(records=50)
+    queue = campaign_queue(tmp_path / 'jobs.json', server, depths=(1,))
+    # The log folder is gone, e.g. an unmounted card
+    asyncio.run(CampaignScheduler(queue, str(tmp_path / 'logs'), None, max_attempts=1).run())
+    [job] = JobQueue(str(tmp_path / 'jobs.json')).jobs
+    assert job['state'] == FAILED and job['runs'] == 1 and job['error']
@@ -0,0 +1,86 @@
+import numpy as np
+
+from watermonitoring.chart import ChartData
+from watermonitoring.parser import parse_buffer
+from watermonitoring.protocol import PARAMETERS
+from watermonitoring.simulator import synthetic_lines
+from watermonitoring.store import ReadingStore, RingStore
+
+NAMES = [name for name, _, _, _ in PARAMETERS]
+
+
+def batches(count, pieces, seed=0):
+    columns = parse_buffer(synthetic_lines(count, seed=seed)).columns
+    cuts = np.sort(np.random.default_rng(seed).choice(np.arange(1, count), pieces - 1, replace=False))
+    for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, count]):
+        yield {name: column[lo:hi] for name, column in columns.items()}
+
+
+def series(chart):
+    """Every raw point and level of every pyramid of a chart"""
+    out = {}
+    for kind in ('values', 'intervals'):
+        for name, pyramid in getattr(chart, kind).items():
+            out[kind, name, 'raw'] = (pyramid.raw_x.view(), pyramid.raw_y.view())
+            for i, level in enumerate(pyramid.levels):
+                out[kind, name, i] = (level.x.view(), level.y.view())
+    return out
+
+
+def assert_same_series(chart, redrawn):
+    mine, theirs = series(chart), series(redrawn)
+    assert mine.keys() == theirs.keys()
+    for key, (x, y) in theirs.items():
+        np.testing.assert_array_equal(mine[key][0], x, err_msg=str(key))
+        np.testing.assert_array_equal(mine[key][1], y, err_msg=str(key))
+
+
+def test_updates_after_every_batch_equal_one_full_redraw():
+    store = ReadingStore()
+    chart = ChartData(store)
+    assert not chart.update()
+    for batch in batches(20000, 50):
+        store.extend(batch)
+        assert chart.update()
+    assert not chart.update()
+
+    redrawn = ChartData(store)
+    redrawn.update()
+    assert_same_series(chart, redrawn)
+    for name in NAMES:
+        assert np.isclose(chart.mean_interval(name), redrawn.mean_interval(name))
+    assert len(chart.values['pH']) == np.count_nonzero(store.valid('pH'))
+
+
+def test_a_cleared_store_starts_the_series_over():
+    store = ReadingStore()
+    chart = ChartData(store)
+    store.extend(parse_buffer(synthetic_lines(500)).columns)
+    chart.update()
+    store.clear()
+    store.extend(parse_buffer(synthetic_lines(300, seed=1)).columns)
+    chart.update()
+
+    redrawn = ChartData(store)
+    redrawn.update()
+    assert_same_series(chart, redrawn)
+
+
+def test_series_over_a_ring_stay_bounded_and_end_like_a_redraw():
+    window = 2000
+    store = RingStore(window)
+    chart = ChartData(store)
+    for batch in batches(30000, 120, seed=3):
+        store.extend(batch)
+        chart.update()
+        assert chart.rows - chart.start <= 2 * window + len(batch['time_ms'])
+
+        redrawn = ChartData(store)
+        redrawn.update()
+        # The redraw holds the rows the ring still has; the live series may
+        # keep older ones until its next restart
+        for name in NAMES:
+            x, y = chart.values[name].raw_x.view(), chart.values[name].raw_y.view()
+            rx, ry = redrawn.values[name].raw_x.view(), redrawn.values[name].raw_y.view()
+            np.testing.assert_array_equal(y[len(y) - len(ry):], ry)
+            np.testing.assert_array_equal(x[len(x) - len(rx):], rx)
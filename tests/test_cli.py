@@ -0,0 +1,83 @@
+import asyncio
+import glob
+import io
+import os
+import socket
+import sys
+
+import numpy as np
+import pytest
+
+from watermonitoring import cli
+from watermonitoring.cli import acquire
+from watermonitoring.engine import DONE, Device
+from watermonitoring.parser import parse_buffer
+from watermonitoring.recordlog import load
+from watermonitoring.simulator import synthetic_lines
+
+RECORDS = 1000
+
+
+def run(server, log_dir, **options):
+    """(engine, stdout, stderr) of one acquire() against the simulator"""
+    out = io.StringIO()
+    err = io.StringIO()
+    engine = asyncio.run(acquire([Device('probe', server.host, server.port, depth=3)],
+                                 str(log_dir), out=out, err=err, read_timeout=10.0, **options))
+    return engine, out.getvalue(), err.getvalue()
+
+
+def assert_columns_equal(columns, expected):
+    for name, column in expected.items():
+        np.testing.assert_array_equal(columns[name], column, err_msg=name)
+
+
+def printed_columns(stdout):
+    lines = stdout.splitlines()
+    assert all(line.startswith('probe;') for line in lines)
+    # A row printed to stdout is a record line without the finished token
+    return parse_buffer([line[len('probe;'):] + ';0' for line in lines]).columns
+
+
+@pytest.mark.parametrize('window', [None, 100])
+def test_every_reading_reaches_stdout_and_the_reading_log(simulator, tmp_path, window):
+    server = simulator(records=RECORDS, chunk_lines=500)
+    engine, stdout, stderr = run(server, tmp_path, window=window)
+    expected = parse_buffer(synthetic_lines(RECORDS)).columns
+
+    assert engine.states() == {'probe': DONE}
+    assert_columns_equal(printed_columns(stdout), expected)
+    [log] = glob.glob(os.path.join(str(tmp_path), 'probe_*.wqlog'))
+    assert_columns_equal(load(log).columns(), expected)
+    assert f"probe: {RECORDS} data" in stderr and stderr.rstrip().endswith(DONE)
+    assert "GAGAL" not in stderr
+
+
+def test_summary_output_counts_the_rows(simulator, tmp_path):
+    server = simulator(records=RECORDS)
+    _, stdout, _ = run(server, tmp_path, output='summary')
+    lines = stdout.splitlines()
+    assert lines[-1].endswith(f"data ({RECORDS} total)")
+    assert sum(int(line.split('+')[1].split()[0]) for line in lines) == RECORDS
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize('reachable', [True, False])
+def test_exit_status_tells_whether_every_test_finished(simulator, tmp_path, monkeypatch,
+                                                        capsys, reachable):
+    server = simulator(records=100)
+    port = server.port if reachable else closed_port()
+    monkeypatch.setattr(cli.signal, 'signal', lambda *args: None)
+    monkeypatch.setattr(sys, 'argv', [
+        'watermonitoring', 'acquire', '--device', f'probe=127.0.0.1:{port}', '--depth', '1',
+        '--duration', '1', '--log-dir', str(tmp_path), '--output', 'none', '--window', '50',
+        '--retries', '1', '--connect-timeout', '2', '--read-timeout', '10'])
+    with pytest.raises(SystemExit) as exit_:
+        cli.main()
+    assert exit_.value.code == (0 if reachable else 1)
+    assert capsys.readouterr().out == ""
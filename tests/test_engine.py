@@ -0,0 +1,136 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from watermonitoring.engine import DONE, FAILED, AcquisitionEngine, Device
+from watermonitoring.parser import parse_buffer
+from watermonitoring.simulator import FakeESP32, synthetic_lines
+
+
+def run_tests(server_options, tests=1, **session_options):
+    """(session, batches) of `tests` tests run one after another on one simulator"""
+    async def run():
+        server = await FakeESP32(**server_options).start()
+        runs = []
+        try:
+            for _ in range(tests):
+                engine = AcquisitionEngine([Device('probe', server.host, server.port)],
+                                           backoff_base=0.0, **session_options)
+                batches = [batch async for batch in engine.stream()]
+                runs.append((engine.sessions['probe'], batches))
+        finally:
+            await server.close()
+        return runs
+
+    return asyncio.run(run())
+
+
+def rows(batches):
+    return sum(len(batch) for batch in batches)
+
+
+def test_complete_test():
+    [(session, batches)] = run_tests({'records': 1000, 'chunk_lines': 100})
+    assert session.state == DONE
+    assert rows(batches) == 1000
+    assert session.totals.records == 1000 and session.totals.finished
+
+
+def times(batches):
+    return np.concatenate([batch.columns['time_ms'] for batch in batches])
+
+
+EXPECTED = parse_buffer(synthetic_lines(1000)).columns['time_ms']
+
+
+@pytest.mark.parametrize('drop_every', range(650, 654))
+def test_torn_last_line_is_not_the_finished_flag(drop_every):
+    # Cut halfway through a line, the fragment may end in a save flag of 1
+    [(session, batches)] = run_tests({'records': 1000, 'chunk_lines': 100, 'drop_every': drop_every},
+                                     max_attempts=1)
+    assert session.state == FAILED
+    assert not session.totals.finished
+    np.testing.assert_array_equal(times(batches), EXPECTED[:drop_every])
+
+
+def test_failed_attempts_deliver_each_row_once():
+    # Both attempts break after 654 records
+    [(session, batches)] = run_tests({'records': 1000, 'chunk_lines': 100, 'drop_every': 654},
+                                     max_attempts=2)
+    assert session.state == FAILED
+    np.testing.assert_array_equal(times(batches), EXPECTED[:654])
+    assert session.totals.records == 654
+
+
+def test_retry_continues_after_the_rows_delivered():
+    # The first test leaves 200 records until the next drop, so the second
+    # test breaks once and its retry completes
+    _, (session, batches) = run_tests({'records': 1000, 'chunk_lines': 100, 'drop_every': 1200},
+                                      tests=2, max_attempts=2)
+    assert session.state == DONE
+    assert session.attempts == 2
+    np.testing.assert_array_equal(times(batches), EXPECTED)
+    assert session.totals.records == 1000
+    assert {batch.attempt for batch in batches} == {1, 2}
+    assert rows(batch for batch in batches if batch.attempt == 1) == 200
+
+
+def test_batches_stream_while_the_test_runs():
+    async def run():
+        server = await FakeESP32(records=60, rate=20, chunk_lines=5).start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        arrivals = []
+        try:
+            engine = AcquisitionEngine([Device('probe', server.host, server.port)])
+            async for batch in engine.stream():
+                arrivals.append((loop.time() - started, len(batch)))
+        finally:
+            await server.close()
+        return arrivals
+
+    arrivals = asyncio.run(run())
+    assert sum(rows for _, rows in arrivals) == 60
+    # The test takes 3 s; its first rows must not wait for the end
+    assert arrivals[0][0] < 1.0 and arrivals[-1][0] > 2.0
+
+
+def serve_raw(data, **session_options):
+    """(session, batches) of one test against a server sending `data` on every connection"""
+    async def run():
+        async def handle(reader, writer):
+            await reader.read(8)
+            writer.write(data)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            engine = AcquisitionEngine([Device('probe', '127.0.0.1', port)], backoff_base=0.0,
+                                       **session_options)
+            batches = [batch async for batch in engine.stream()]
+        finally:
+            server.close()
+            await server.wait_closed()
+        return engine.sessions['probe'], batches
+
+    return asyncio.run(run())
+
+
+def test_blank_lines_are_skipped():
+    lines = synthetic_lines(10)
+    data = ('\n'.join(lines[:5]) + '\n\n\r\n' + '\n'.join(lines[5:]) + '\n').encode('ascii')
+    session, batches = serve_raw(data)
+    assert session.state == DONE and session.totals.finished
+    np.testing.assert_array_equal(times(batches), parse_buffer(lines).columns['time_ms'])
+
+
+def test_overlong_line_fails_the_attempt():
+    lines = synthetic_lines(10)
+    data = ('\n'.join(lines[:5]) + '\n' + 'x' * 100000 + '\n' + '\n'.join(lines[5:]) + '\n')
+    session, batches = serve_raw(data.encode('ascii'), max_attempts=2)
+    assert session.state == FAILED and session.attempts == 2
+    assert isinstance(session.error, ConnectionResetError)
+    assert rows(batches) == 5
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+
+from watermonitoring import export as exports
+from watermonitoring.export import (EXPORTERS, available_formats, export, iter_log_chunks,
+                                    iter_store_chunks, load)
+from watermonitoring.parser import parse_buffer
+from watermonitoring.recordlog import RecordLogWriter, export_csv
+from watermonitoring.simulator import synthetic_lines
+from watermonitoring.store import ReadingStore, format_rows
+
+ROWS = 10000
+
+
+@pytest.fixture
+def store():
+    store = ReadingStore()
+    store.extend(parse_buffer(synthetic_lines(ROWS, malformed_ratio=0.02, seed=3)).columns)
+    return store
+
+
+def assert_same_columns(columns, store):
+    for name, column in store.columns().items():
+        assert columns[name].dtype == column.dtype, name
+        np.testing.assert_array_equal(columns[name], column, err_msg=name)
+
+
+@pytest.mark.parametrize('fmt', list(EXPORTERS))
+def test_every_format_reads_back_equal_to_the_store(store, tmp_path, fmt):
+    if fmt not in available_formats():
+        pytest.skip(f"{fmt} needs pyarrow")
+    path = str(tmp_path / ('readings' + EXPORTERS[fmt].extension))
+    assert export(iter_store_chunks(store, 3000), path) == len(store)
+    assert_same_columns(load(path), store)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'npz'])
+def test_a_reading_log_exports_like_the_store(store, tmp_path, fmt):
+    log = str(tmp_path / 'test.wqlog')
+    writer = RecordLogWriter(log)
+    for chunk in iter_store_chunks(store, 250):
+        writer.append(chunk)
+    writer.close()
+    path = str(tmp_path / ('readings' + EXPORTERS[fmt].extension))
+    assert export(iter_log_chunks(log, 4000), path, fmt) == len(store)
+    assert_same_columns(load(path), store)
+
+
+def test_csv_export_writes_the_rows_of_format_row(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, 'CSV_BLOCK_ROWS', 777)
+    path = tmp_path / 'readings.csv'
+    export(iter_store_chunks(store), str(path))
+    lines = path.read_text().splitlines()
+    assert lines[1:] == [';'.join(store.format_row(i)) for i in range(len(store))]
+    assert format_rows(store.columns())[-1] == tuple(store.format_row(-1))
+
+    log = str(tmp_path / 'test.wqlog')
+    writer = RecordLogWriter(log)
+    writer.append(store.columns())
+    writer.close()
+    export_csv(log, str(tmp_path / 'from_log.csv'))
+    assert (tmp_path / 'from_log.csv').read_text() == path.read_text()
+
+
+def test_a_failed_export_leaves_no_file(store, tmp_path):
+    def broken():
+        yield from iter_store_chunks(store, 1000)
+        raise OSError(28, "No space left on device")
+
+    for fmt in ('csv', 'npz'):
+        path = str(tmp_path / ('readings' + EXPORTERS[fmt].extension))
+        with pytest.raises(OSError):
+            export(broken(), path)
+        assert not os.path.exists(path)
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from watermonitoring.health import PENALTIES, HealthMonitor
+from watermonitoring.parser import empty_columns
+from watermonitoring.protocol import PARAMETERS, SAVE_BITS
+
+ROWS = 2000
+NOMINAL = {'pH': 1000, 'temp': 1000, 'DO': 2000, 'turb': 3000}
+
+
+def clean_run(rows=ROWS):
+    """A probe in good order: a row every second, every sensor on its interval"""
+    columns = empty_columns(rows)
+    columns['time_ms'] = 8 * 3600000 + np.arange(rows, dtype=np.int64) * 1000
+    columns['flags'][:] = sum(set(SAVE_BITS.values()))
+    for name, _, value_key, interval_key in PARAMETERS:
+        columns[value_key][:] = 7.0
+        columns[interval_key][:] = NOMINAL[name]
+    columns['current'][:] = 0.1
+    columns['voltage'][:] = 3.7
+    return columns
+
+
+def health(columns, batch=256):
+    monitor = HealthMonitor('probe')
+    for lo in range(0, len(columns['time_ms']), batch):
+        monitor.process({name: column[lo:lo + batch] for name, column in columns.items()})
+    return monitor
+
+
+def only_penalty(monitor):
+    score, penalties = monitor.score()
+    # Rounding in the EWMA leaves a drift of about 1e-13 on exact intervals
+    hit = {part: penalty for part, penalty in penalties.items() if penalty > 1e-9}
+    assert score == pytest.approx(100 - sum(hit.values()))
+    return hit
+
+
+def test_a_probe_in_good_order_scores_100():
+    monitor = health(clean_run())
+    score, penalties = monitor.score()
+    assert score == pytest.approx(100.0) and max(penalties.values()) < 1e-9
+    assert monitor.status() == "baik" and monitor.gaps == 0 and monitor.step == 1000
+
+
+def test_a_gap_costs_the_share_of_rows_it_lost():
+    columns = clean_run()
+    keep = np.r_[0:1000, 1050:ROWS]
+    monitor = health({name: column[keep] for name, column in columns.items()})
+    assert (monitor.gaps, monitor.lost, monitor.longest_gap) == (1, 50, 51000)
+    weight, full = PENALTIES['gaps']
+    assert only_penalty(monitor) == {'gaps': pytest.approx(weight * (50 / ROWS) / full)}
+
+
+def test_interval_jitter_lowers_the_score():
+    columns = clean_run()
+    rng = np.random.default_rng(0)
+    columns['interval_DO'] += rng.integers(-400, 401, ROWS).astype(np.int32)
+    monitor = health(columns)
+    penalties = only_penalty(monitor)
+    # The noise moves the mean interval the drift is read from a little
+    assert penalties['jitter'] == PENALTIES['jitter'][0]
+    assert penalties.get('drift', 0) < PENALTIES['drift'][0] / 4
+    assert set(penalties) <= {'jitter', 'drift'}
+    percentiles = monitor.sensors['DO'].jitter_percentiles((0.05, 0.95))
+    assert percentiles[0.05] < -300 and percentiles[0.95] > 300
+    assert monitor.sensors['pH'].jitter_percentiles((0.95,))[0.95] == 0.0
+
+
+def test_a_slowing_sensor_clock_shows_as_drift():
+    columns = clean_run()
+    # The turbidity sensor slows down to 20 % over its nominal interval
+    columns['interval_turb'][ROWS // 4:ROWS // 2] = np.linspace(3000, 3600, ROWS // 4).astype(np.int32)
+    columns['interval_turb'][ROWS // 2:] = 3600
+    monitor = health(columns)
+    assert monitor.sensors['turb'].drift == pytest.approx(0.2, abs=0.01)
+    penalties = only_penalty(monitor)
+    assert penalties['drift'] == PENALTIES['drift'][0] and set(penalties) <= {'drift', 'jitter'}
+
+
+def test_invalid_readings_and_a_weak_battery_lower_the_score():
+    columns = clean_run()
+    columns['flags'][::4] ^= SAVE_BITS['temp']
+    columns['voltage'][-200:] = 3.0
+    monitor = health(columns)
+    weight, _ = PENALTIES['valid']
+    assert only_penalty(monitor) == {'valid': pytest.approx(weight * 0.25),
+                                     'power': pytest.approx(PENALTIES['power'][0])}
+    assert monitor.sensors['temp'].valid_ratio == 0.75
+
+
+@pytest.mark.parametrize('batch', [1, 37, ROWS])
+def test_the_score_does_not_depend_on_the_batch_size(batch):
+    columns = clean_run()
+    columns['interval_pH'] += np.random.default_rng(1).integers(-100, 101, ROWS).astype(np.int32)
+    keep = np.r_[0:700, 720:ROWS]
+    columns = {name: column[keep] for name, column in columns.items()}
+    score, penalties = health(columns, batch).score()
+    expected_score, expected = health(columns, 256).score()
+    assert score == pytest.approx(expected_score) and penalties == pytest.approx(expected)
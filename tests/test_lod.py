@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from watermonitoring.lod import MIN_BUCKETS, LODPyramid, downsample
+
+
+def series(count, seed=0):
+    """Random walk with a few spikes; x is the point's index"""
+    rng = np.random.default_rng(seed)
+    y = np.cumsum(rng.standard_normal(count))
+    y[rng.choice(count, 5, replace=False)] += rng.choice([-50.0, 50.0], 5)
+    return np.arange(count, dtype=np.float64), y
+
+
+def test_every_level_keeps_the_extremes_of_its_buckets():
+    x, y = series(10000)
+    pyramid = LODPyramid(x, y)
+    assert len(pyramid.levels) >= 5
+    for level in pyramid.levels:
+        buckets = y[:len(level) * level.size].reshape(len(level), level.size)
+        np.testing.assert_array_equal(level.ymin.view(), buckets.min(axis=1))
+        np.testing.assert_array_equal(level.ymax.view(), buckets.max(axis=1))
+        # The x of each extreme is the x of a point holding that value
+        np.testing.assert_array_equal(y[level.xmin.view().astype(int)], level.ymin.view())
+        np.testing.assert_array_equal(y[level.xmax.view().astype(int)], level.ymax.view())
+        assert np.all(np.diff(level.x.view()) >= 0)
+    assert len(pyramid.levels[-1]) < 4 * MIN_BUCKETS
+
+
+def test_appending_in_pieces_builds_the_same_pyramid():
+    x, y = series(5000, seed=1)
+    whole = LODPyramid(x, y)
+    pieces = LODPyramid()
+    cuts = np.sort(np.random.default_rng(2).choice(np.arange(1, 5000), 60, replace=False))
+    for part_x, part_y in zip(np.split(x, cuts), np.split(y, cuts)):
+        pieces.extend(part_x, part_y)
+    assert len(pieces.levels) == len(whole.levels)
+    for mine, theirs in zip(pieces.levels, whole.levels):
+        np.testing.assert_array_equal(mine.x.view(), theirs.x.view())
+        np.testing.assert_array_equal(mine.y.view(), theirs.y.view())
+
+
+@pytest.mark.parametrize('count', [100, 1001, 9999])
+@pytest.mark.parametrize('max_points', [50, 300, 2000])
+def test_fetch_keeps_the_peak_and_dip_of_the_series(count, max_points):
+    x, y = series(count, seed=count)
+    fx, fy = LODPyramid(x, y).fetch(max_points=max_points)
+    assert fy.max() == y.max() and fy.min() == y.min()
+    assert np.all(np.diff(fx) >= 0)
+    # The coarsest level, under 4 * MIN_BUCKETS min/max pairs, is the floor
+    assert len(fx) <= max(max_points, 8 * MIN_BUCKETS + 2)
+    np.testing.assert_array_equal(y[fx.astype(int)], fy)
+
+
+def test_fetch_of_a_range_includes_one_point_beyond_each_end():
+    x, y = series(3000)
+    fx, fy = LODPyramid(x, y).fetch(1000, 1100, max_points=2000)
+    np.testing.assert_array_equal(fx, np.arange(999, 1102))
+    np.testing.assert_array_equal(fy, y[999:1102])
+
+
+def test_downsample_of_a_short_series_returns_it_unchanged():
+    x, y = series(200)
+    fx, fy = downsample(x, y, 500)
+    np.testing.assert_array_equal(fx, x)
+    np.testing.assert_array_equal(fy, y)
@@ -0,0 +1,96 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from watermonitoring.metrics import QUANTILES, TIMING_WINDOW, Metrics, ReceiveMeter
+from watermonitoring.parser import parse_buffer
+from watermonitoring.simulator import synthetic_lines
+
+
+def test_counters_from_many_threads_add_up():
+    metrics = Metrics()
+
+    def count():
+        for _ in range(10000):
+            metrics.count('records_total')
+            metrics.count('bytes_received_total', 3)
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.snapshot()['counters'] == {'records_total': 80000, 'bytes_received_total': 240000}
+
+
+@pytest.mark.parametrize('samples', [1, 2, 10, 99, 100, 1000])
+def test_percentiles_are_nearest_rank(samples):
+    values = np.random.default_rng(samples).permutation(np.arange(1, samples + 1) / 1000.0)
+    metrics = Metrics()
+    for value in values:
+        metrics.observe('parse_seconds', float(value))
+    summary = metrics.snapshot()['timings']['parse_seconds']
+    for q in QUANTILES:
+        assert summary[f'p{int(q * 100)}'] == np.percentile(values, q * 100, method='inverted_cdf')
+    assert summary['count'] == samples and summary['max'] == values.max()
+    assert summary['sum'] == pytest.approx(values.sum())
+
+
+def test_percentiles_follow_the_recent_samples_and_totals_all_of_them():
+    metrics = Metrics()
+    for _ in range(5000):
+        metrics.observe('render_seconds', 10.0)
+    for _ in range(TIMING_WINDOW):
+        metrics.observe('render_seconds', 0.01)
+    summary = metrics.snapshot()['timings']['render_seconds']
+    assert summary['p99'] == 0.01 and summary['max'] == 10.0
+    assert summary['count'] == 5000 + TIMING_WINDOW
+    assert summary['sum'] == pytest.approx(50000 + 0.01 * TIMING_WINDOW)
+
+
+def test_exported_files_carry_the_values(tmp_path):
+    metrics = Metrics()
+    metrics.count('records_total', 1234)
+    metrics.set('records_per_second', 56.5)
+    for value in (0.1, 0.2, 0.3, 0.4):
+        metrics.observe('connect_seconds', value)
+
+    path = str(tmp_path / 'wq.prom')
+    metrics.write_prometheus(path)
+    samples = {}
+    with open(path) as f:
+        for line in f:
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+    assert samples == {
+        'wq_records_total': 1234, 'wq_records_per_second': 56.5,
+        'wq_connect_seconds{quantile="0.5"}': 0.2, 'wq_connect_seconds{quantile="0.95"}': 0.4,
+        'wq_connect_seconds{quantile="0.99"}': 0.4, 'wq_connect_seconds_sum': 1.0,
+        'wq_connect_seconds_count': 4,
+    }
+
+    jsonl = tmp_path / 'wq.jsonl'
+    metrics.append_jsonl(str(jsonl), run=0)
+    metrics.count('records_total', 1)
+    metrics.append_jsonl(str(jsonl), run=1)
+    lines = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert [(line['run'], line['counters']['records_total']) for line in lines] == [(0, 1234), (1, 1235)]
+
+
+def test_receive_meter_counts_bytes_records_and_rejected_lines():
+    metrics = Metrics()
+    meter = ReceiveMeter(metrics)
+    lines = synthetic_lines(500, malformed_ratio=0.1, seed=2)
+    for part in (lines[:200], lines[200:]):
+        result = parse_buffer(part)
+        meter.batch(sum(len(line) + 1 for line in part), result)
+    first, second = parse_buffer(lines[:200]), parse_buffer(lines[200:])
+    counters = metrics.snapshot()['counters']
+    assert counters['records_total'] == len(first) + len(second) < 500
+    assert counters['bytes_received_total'] == sum(len(line) + 1 for line in lines)
+    assert (counters['dropped_lines_total'] + counters['malformed_lines_total']
+            == first.short_lines + first.bad_lines + second.short_lines + second.bad_lines > 0)
+    assert metrics.snapshot()['timings']['parse_seconds']['count'] == 2
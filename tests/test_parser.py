@@ -0,0 +1,88 @@
+import random
+
+import numpy as np
+import pytest
+
+from watermonitoring.parser import BLOCK_ROWS, parse_buffer, parse_line
+from watermonitoring.protocol import PARAMETERS, RECORD_TOKENS, SAVE_BITS
+from watermonitoring.simulator import synthetic_lines
+
+BAD_STAMPS = ['1:2:3', '8:0:29:24:11', '24:0:0:0', '1:x:3:4', '', '1:2:3:4.5', '-1:0:0:0',
+              # Numbers to float() but not to int()
+              '8:0:0:0.0', '1e2:0:0:0', '8.0:0:0:0', '8:0:0:1E1',
+              # Numbers to int() as well
+              '+8:0:0:0', '8:0:0:1_0']
+
+
+def reference(lines):
+    """Columns and rejected-line count from parse_line, one line at a time"""
+    rows = []
+    rejected = 0
+    for line in lines:
+        try:
+            rows.append(parse_line(line))
+        except (ValueError, OverflowError):
+            # An infinite save flag or interval cannot be rounded to int
+            rejected += 1
+    columns = {'time_ms': np.array([row[0] for row in rows], dtype=np.int64),
+               'flags': np.array([row[1] for row in rows], dtype=np.uint8),
+               'current': np.array([row[4] for row in rows], dtype=np.float32),
+               'voltage': np.array([row[5] for row in rows], dtype=np.float32)}
+    for i, (_, _, value_key, interval_key) in enumerate(PARAMETERS):
+        columns[value_key] = np.array([row[2][i] for row in rows], dtype=np.float32)
+        columns[interval_key] = np.array([row[3][i] for row in rows], dtype=np.int32)
+    return columns, rejected
+
+
+def assert_same_as_parse_line(lines):
+    result = parse_buffer(lines)
+    columns, rejected = reference(lines)
+    assert result.malformed == rejected
+    for name, column in columns.items():
+        np.testing.assert_array_equal(result.columns[name], column, err_msg=name)
+
+
+def mutate(line, rng):
+    tokens = line.split(';')
+    kind = rng.random()
+    if kind < 0.1:
+        tokens[0] = rng.choice(BAD_STAMPS)
+    elif kind < 0.13:
+        tokens[rng.randrange(1, RECORD_TOKENS)] = rng.choice(['x', '', 'nan', '1e400'])
+    elif kind < 0.15:
+        tokens = tokens[:rng.randrange(1, RECORD_TOKENS)]
+    elif kind < 0.17:
+        tokens.append('7')
+    return ';'.join(tokens)
+
+
+def test_clean_lines():
+    assert_same_as_parse_line(synthetic_lines(3 * BLOCK_ROWS + 17))
+
+
+def test_short_and_long_stamps_in_one_block():
+    # Together their colons add up to those of two good stamps
+    lines = synthetic_lines(BLOCK_ROWS)
+    lines[0] = '1:2:3' + lines[0][lines[0].index(';'):]
+    lines[1] = '8:0:29:24:11' + lines[1][lines[1].index(';'):]
+    assert_same_as_parse_line(lines)
+
+
+@pytest.mark.parametrize('stamp', ['8:0:0:0.0', '1e2:0:0:0', '8.0:0:0:0', '+8:0:0:0', '8:0:0:1_0'])
+def test_stamp_numbers_int_refuses_in_an_otherwise_clean_block(stamp):
+    lines = synthetic_lines(BLOCK_ROWS)
+    lines[7] = stamp + lines[7][lines[7].index(';'):]
+    assert_same_as_parse_line(lines)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_fuzzed_lines(seed):
+    rng = random.Random(seed)
+    lines = [mutate(line, rng) for line in synthetic_lines(2 * BLOCK_ROWS, seed=seed)]
+    assert_same_as_parse_line(lines)
+
+
+def test_save_flags():
+    line = '8:0:0:0;1;7.0;1000;0;25.0;1000;1;6.0;2000;0;1.5;3000;0.1;3.7;0'
+    flags = parse_buffer([line]).columns['flags'][0]
+    assert flags == SAVE_BITS['pH'] | SAVE_BITS['DO']
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from watermonitoring.parser import empty_columns
+from watermonitoring.profile import DepthTimeGrid
+from watermonitoring.protocol import SAVE_BITS, TIME_INVALID
+
+BIN_MS = 60000
+# Epoch ms of a bin boundary
+T0 = 1772323200000
+
+
+def reading_session(rng, start, rows):
+    """(epoch, columns) of readings a few seconds apart, some unsaved or unstamped"""
+    epoch = start + np.cumsum(rng.integers(1000, 20000, rows))
+    columns = empty_columns(rows)
+    columns['time_ms'] = epoch % 86400000
+    columns['time_ms'][rng.random(rows) < 0.05] = TIME_INVALID
+    columns['flags'] = np.where(rng.random(rows) < 0.8, SAVE_BITS['pH'], 0).astype(np.uint8)
+    columns['value_pH'] = rng.uniform(5, 9, rows).astype(np.float32)
+    return epoch, columns
+
+
+def sessions():
+    rng = np.random.default_rng(0)
+    # Depths out of order and a session earlier than the ones before it
+    return [(depth,) + reading_session(rng, T0 + offset, 300)
+            for depth, offset in ((5.0, 3600000), (1.0, 0), (5.0, 7200000), (2.5, -5400000))]
+
+
+def expected_cells(added, factor=1, origin=None):
+    """{(depth, merged bin): values} computed row by row"""
+    cells = {}
+    for depth, epoch, columns in added:
+        for t, stamp, flags, value in zip(epoch, columns['time_ms'], columns['flags'],
+                                          columns['value_pH']):
+            if stamp == TIME_INVALID or not flags & SAVE_BITS['pH']:
+                continue
+            cells.setdefault((depth, (t // BIN_MS - origin) // factor), []).append(float(value))
+    return cells
+
+
+@pytest.mark.parametrize('max_columns', [10000, 40])
+def test_readings_land_in_the_cell_of_their_depth_and_time_bin(max_columns):
+    added = sessions()
+    grid = DepthTimeGrid(bin_ms=BIN_MS)
+    for depth, epoch, columns in added:
+        grid.add(epoch, columns, depth)
+    assert grid.sessions == 4 and grid.depths == [1.0, 2.5, 5.0]
+
+    depths, edges, mean = grid.view('pH', 'mean', max_columns=max_columns)
+    factor = -(-grid.columns // max_columns)
+    assert edges[0] == grid.origin * BIN_MS and np.all(np.diff(edges) == BIN_MS * factor)
+    assert len(edges) - 1 <= max_columns
+    cells = expected_cells(added, factor, grid.origin)
+    count = grid.view('pH', 'count', max_columns=max_columns)[2]
+    low = grid.view('pH', 'min', max_columns=max_columns)[2]
+    high = grid.view('pH', 'max', max_columns=max_columns)[2]
+    assert np.count_nonzero(~np.isnan(mean)) == len(cells)
+    for (depth, column), values in cells.items():
+        row = list(depths).index(depth)
+        assert count[row, column] == len(values)
+        assert mean[row, column] == pytest.approx(np.mean(values))
+        assert low[row, column] == min(values) and high[row, column] == max(values)
+
+
+def test_saved_grid_loads_equal_and_keeps_growing(tmp_path):
+    added = sessions()
+    grid = DepthTimeGrid(bin_ms=BIN_MS)
+    for depth, epoch, columns in added[:2]:
+        grid.add(epoch, columns, depth)
+    path = str(tmp_path / 'profile.npz')
+    grid.save(path)
+
+    loaded = DepthTimeGrid.load(path)
+    assert (loaded.bin_ms, loaded.depths, loaded.origin, loaded.sessions) == \
+        (BIN_MS, grid.depths, grid.origin, 2)
+    for depth, epoch, columns in added[2:]:
+        grid.add(epoch, columns, depth)
+        loaded.add(epoch, columns, depth)
+    for stat in ('mean', 'count', 'min', 'max'):
+        np.testing.assert_array_equal(loaded.view('pH', stat)[2], grid.view('pH', stat)[2])
+
+
+def test_a_session_without_depth_is_counted_but_not_placed(tmp_path):
+    depth, epoch, columns = sessions()[0]
+    grid = DepthTimeGrid(bin_ms=BIN_MS)
+    grid.add(epoch, columns, None)
+    assert grid.sessions == 1 and grid.depths == [] and grid.columns == 0
+    assert DepthTimeGrid.load(str(tmp_path / 'missing.npz')).sessions == 0
@@ -0,0 +1,86 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from watermonitoring import recordlog
+from watermonitoring.parser import empty_columns
+from watermonitoring.recordlog import RecordLogWriter, iter_chunks, load, recover
+
+
+def batch(start, rows):
+    columns = empty_columns(rows)
+    columns['time_ms'] = np.arange(start, start + rows, dtype=np.int64)
+    return columns
+
+
+def logged_times(path):
+    return np.concatenate([columns['time_ms'] for _, columns in iter_chunks(path)])
+
+
+def test_reopening_a_torn_log_drops_the_tail_and_appends_after_it(tmp_path):
+    path = str(tmp_path / 'test.wqlog')
+    writer = RecordLogWriter(path)
+    writer.append(batch(0, 100))
+    writer.close()
+    intact = os.path.getsize(path)
+    # A crash in the middle of the next chunk
+    with open(path, 'ab') as f:
+        f.write(recordlog.encode_chunk(batch(100, 50))[:-7])
+
+    assert recover(path, truncate=False) == (100, intact, os.path.getsize(path) - intact)
+    writer = RecordLogWriter(path)
+    writer.append(batch(200, 10))
+    writer.close()
+    np.testing.assert_array_equal(logged_times(path), np.r_[0:100, 200:210])
+    assert len(load(path)) == 110
+
+
+def test_append_after_close_is_rejected(tmp_path):
+    writer = RecordLogWriter(str(tmp_path / 'test.wqlog'))
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.append(batch(0, 1))
+
+
+def test_write_errors_are_raised_by_append_and_close(tmp_path, monkeypatch):
+    failed = threading.Event()
+
+    def fail(fd):
+        # The disk fills up once the first chunk is written
+        if os.fstat(fd).st_size:
+            failed.set()
+            raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(recordlog.os, 'fsync', fail)
+    writer = RecordLogWriter(str(tmp_path / 'test.wqlog'), flush_interval=0.01, fsync_interval=0.0)
+    writer.append(batch(0, 1))
+    assert failed.wait(5)
+    assert isinstance(writer.error, OSError)
+    with pytest.raises(OSError):
+        writer.append(batch(1, 1))
+    with pytest.raises(OSError):
+        writer.close()
+
+
+def test_append_waits_once_the_queue_is_full(tmp_path, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(recordlog.os, 'fsync', lambda fd: os.fstat(fd).st_size and release.wait(5))
+    writer = RecordLogWriter(str(tmp_path / 'test.wqlog'), flush_interval=0.0,
+                             fsync_interval=0.0, max_pending=2)
+    writer.append(batch(0, 1))
+    # The writer thread is now stuck in fsync, so two more batches fill the queue
+    while writer._queue.qsize():
+        release.wait(0.01)
+    writer.append(batch(1, 1))
+    writer.append(batch(2, 1))
+    blocked = threading.Thread(target=writer.append, args=(batch(3, 1),))
+    blocked.start()
+    blocked.join(0.3)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(5)
+    writer.close()
+    np.testing.assert_array_equal(logged_times(writer.path), [0, 1, 2, 3])
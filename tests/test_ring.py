@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from watermonitoring.ring import RingBuffer
+
+
+def test_wraparound_keeps_the_newest_rows_contiguous():
+    ring = RingBuffer(5, np.int64)
+    for start in range(0, 23, 3):
+        ring.extend(np.arange(start, start + 3))
+    assert (ring.total, ring.first, len(ring)) == (24, 19, 5)
+    view = ring.view()
+    np.testing.assert_array_equal(view, np.arange(19, 24))
+    assert view.base is ring._data
+    np.testing.assert_array_equal(ring.view(22), [22, 23])
+    assert len(ring.view(24)) == 0
+
+
+def test_a_batch_longer_than_the_ring_keeps_its_tail():
+    ring = RingBuffer(4, np.int64)
+    ring.extend([1, 2])
+    ring.extend(np.arange(100, 110))
+    assert ring.total == 12
+    np.testing.assert_array_equal(ring.view(), [106, 107, 108, 109])
+
+
+def test_rows_no_longer_held_are_refused():
+    ring = RingBuffer(4, np.int64)
+    ring.extend(np.arange(10))
+    with pytest.raises(IndexError):
+        ring.view(5)
+    with pytest.raises(IndexError):
+        ring.view(11)
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from watermonitoring import session
+from watermonitoring.errors import ProbeError
+from watermonitoring.session import ConnectionPool, ProbeConnection
+
+
+def test_pool_close_does_not_wait_for_a_running_test(simulator):
+    server = simulator(records=10000, rate=200)
+    pool = ConnectionPool(heartbeat=0)
+    errors = []
+    receiving = threading.Event()
+
+    def run():
+        try:
+            with pool.connection(server.host, server.port) as probe:
+                probe.run_test(1, 60, False, lambda result: receiving.set())
+        except ProbeError as e:
+            errors.append(e)
+
+    test = threading.Thread(target=run)
+    test.start()
+    assert receiving.wait(5)
+    started = time.monotonic()
+    pool.close()
+    assert time.monotonic() - started < 0.5
+    test.join(5)
+    assert not test.is_alive()
+    assert errors
+
+
+def test_unanswered_handshake_is_tried_again(simulator, monkeypatch):
+    server = simulator(records=10)
+    probe = ProbeConnection(server.host, server.port)
+    # As after one handshake that got no answer in time
+    probe.persistent = False
+    probe.hello_failed = time.monotonic()
+    probe.connect()
+    assert not probe.connected
+    monkeypatch.setattr(session, 'HELLO_RETRY_INTERVAL', 0.0)
+    probe.connect()
+    assert probe.persistent and probe.connected
+    probe.close()
+
+
+def test_legacy_firmware_still_runs_tests(simulator):
+    server = simulator(records=100, sessions=False)
+    probe = ProbeConnection(server.host, server.port)
+    rows = []
+    totals = probe.run_test(1, 1, False, lambda result: rows.append(len(result)))
+    assert probe.persistent is False
+    assert totals.finished and sum(rows) == 100
@@ -0,0 +1,63 @@
+import numpy as np
+
+from watermonitoring.parser import empty_columns, parse_buffer
+from watermonitoring.simulator import synthetic_lines
+from watermonitoring.store import DownsampledTier, ReadingStore, RingStore
+
+LINE = '08:05:03:007;1;1234.567;1000;0;25.125;1000;1;6.0;2000;0;0.1;3000;0.151;3.48;0'
+
+
+def test_format_row_reads_back_the_stored_values():
+    store = ReadingStore()
+    store.extend(parse_buffer([LINE]).columns)
+    row = store.format_row(-1)
+    assert row[0] == '8:5:3:7'
+    assert row[2] == '1234.567' and row[13] == '0.151' and row[14] == '3.48'
+    again = parse_buffer([';'.join(row) + ';0']).columns
+    for name, column in store.columns().items():
+        np.testing.assert_array_equal(again[name], column, err_msg=name)
+
+
+def test_format_row_round_trips_random_float32():
+    rng = np.random.default_rng(0)
+    columns = empty_columns(1000)
+    columns['value_pH'] = (rng.standard_normal(1000) * 10.0 ** rng.integers(-6, 7, 1000)).astype(np.float32)
+    store = ReadingStore()
+    store.extend(columns)
+    texts = [store.format_row(i)[2] for i in range(len(store))]
+    np.testing.assert_array_equal(np.array(texts, dtype=np.float32), columns['value_pH'])
+
+
+def test_downsampled_tier_file_matches_the_buckets(tmp_path):
+    path = tmp_path / 'tier.csv'
+    store = RingStore(500, DownsampledTier(bucket_ms=10000, path=str(path)))
+    columns = parse_buffer(synthetic_lines(5000)).columns
+    for lo in range(0, 5000, 256):
+        store.extend({name: column[lo:lo + 256] for name, column in columns.items()})
+    store.tier.close()
+    lines = path.read_text().splitlines()
+    assert lines[0] == ';'.join(store.tier.buckets)
+    written = np.loadtxt(lines[1:], delimiter=';', ndmin=2)
+    buckets = store.tier.columns()
+    assert len(written) == len(store.tier) > 0
+    np.testing.assert_array_equal(written[:, 0], buckets['start_ms'])
+    np.testing.assert_allclose(written[:, 2], buckets['mean_pH'], rtol=1e-5)
+
+
+def test_downsampled_tier_keeps_a_write_error(tmp_path):
+    tier = DownsampledTier(bucket_ms=1000, path=str(tmp_path / 'missing' / 'tier.csv'))
+    store = RingStore(10, tier)
+    store.extend(parse_buffer(synthetic_lines(100)).columns)
+    tier.close()
+    assert isinstance(tier.error, OSError)
+
+
+def test_extend_returns_the_times_of_a_batch_larger_than_the_window():
+    columns = parse_buffer(synthetic_lines(1000)).columns
+    full = ReadingStore()
+    expected = full.extend(columns).copy()
+    ring = RingStore(100)
+    elapsed = np.concatenate([ring.extend({name: column[lo:lo + 256] for name, column in columns.items()}).copy()
+                              for lo in range(0, 1000, 256)])
+    np.testing.assert_array_equal(elapsed, expected)
+    np.testing.assert_array_equal(ring.time_axis.elapsed(), expected[-100:])
@@ -0,0 +1,39 @@
+import numpy as np
+
+from watermonitoring.protocol import TIME_INVALID
+from watermonitoring.timeaxis import DAY_MS, MALFORMED, NON_MONOTONIC, ROLLOVER, TimeAxis
+
+# 23:59:59.000, 23:59:59.500, then past midnight
+STAMPS = [DAY_MS - 1000, DAY_MS - 500, 200, TIME_INVALID, 100, 1500]
+ELAPSED = [DAY_MS - 1000, DAY_MS - 500, DAY_MS + 200, DAY_MS + 200, DAY_MS + 200, DAY_MS + 1500]
+
+
+def test_midnight_rollover_continues_the_axis():
+    axis = TimeAxis()
+    axis.extend(STAMPS)
+    np.testing.assert_array_equal(axis.elapsed(), ELAPSED)
+    assert axis.days == 1
+    assert [kind for _, kind, _, _ in axis.issues] == [ROLLOVER, MALFORMED, NON_MONOTONIC]
+    np.testing.assert_allclose(axis.seconds(), (np.array(ELAPSED) - ELAPSED[0]) / 1000)
+
+
+def test_append_and_batches_across_midnight_agree_with_one_extend():
+    for split in range(1, len(STAMPS)):
+        axis = TimeAxis()
+        axis.extend(STAMPS[:split])
+        axis.extend(STAMPS[split:])
+        np.testing.assert_array_equal(axis.elapsed(), ELAPSED, err_msg=f"split at {split}")
+    axis = TimeAxis()
+    for stamp in STAMPS:
+        axis.append(stamp)
+    np.testing.assert_array_equal(axis.elapsed(), ELAPSED)
+    assert axis.counts() == {MALFORMED: 1, NON_MONOTONIC: 1, ROLLOVER: 1}
+
+
+def test_windowed_axis_keeps_counting_days():
+    axis = TimeAxis(window=3)
+    for _ in range(3):
+        axis.extend(STAMPS)
+    assert axis.days == 3
+    assert axis.first_row == 3 * len(STAMPS) - 3
+    np.testing.assert_array_equal(axis.elapsed(), np.array(ELAPSED[-3:]) + 2 * DAY_MS)
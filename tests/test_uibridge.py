@@ -0,0 +1,100 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from watermonitoring.uibridge import UIBridge
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+
+class FakeRoot:
+    """The part of Tk a UIBridge uses; timers run when the test calls run()"""
+
+    def __init__(self):
+        self.timers = []
+        self.errors = []
+
+    def after(self, ms, fn, *args):
+        self.timers.append((fn, args))
+        return len(self.timers)
+
+    def after_cancel(self, timer):
+        self.timers.clear()
+
+    def report_callback_exception(self, *exc_info):
+        self.errors.append(exc_info[1])
+
+    def run(self):
+        fn, args = self.timers.pop(0)
+        fn(*args)
+
+
+def test_items_of_one_frame_reach_the_consumer_together_and_in_order():
+    root = FakeRoot()
+    frames = []
+    bridge = UIBridge(root, on_frame=lambda: frames.append(len(seen)))
+    bridge.limit = 10
+    seen = []
+    events = []
+    consume = seen.append
+    bridge.push(consume, 1)
+    bridge.push(consume, 2)
+    bridge.post(events.append, 'done')
+    bridge.push(consume, 3)
+    root.run()
+    assert seen == [[1, 2], [3]] and events == ['done']
+    assert frames == [2] and len(bridge) == 0
+
+
+def test_push_blocks_while_the_tk_thread_is_behind():
+    root = FakeRoot()
+    bridge = UIBridge(root, max_pending=2)
+    seen = []
+    consume = seen.extend
+    bridge.push(consume, 1)
+    bridge.push(consume, 2)
+    worker = threading.Thread(target=bridge.push, args=(consume, 3))
+    worker.start()
+    worker.join(0.2)
+    assert worker.is_alive()
+
+    while worker.is_alive():
+        root.run()
+        worker.join(0.05)
+    while len(bridge):
+        root.run()
+    assert seen == [1, 2, 3]
+
+
+def test_close_releases_blocked_workers():
+    bridge = UIBridge(FakeRoot(), max_pending=1)
+    bridge.push(print, None)
+    results = []
+    worker = threading.Thread(target=lambda: results.append(bridge.push(print, None)))
+    worker.start()
+    bridge.close()
+    worker.join(5)
+    assert results == [False]
+
+
+def test_a_failing_consumer_does_not_stop_the_frame():
+    root = FakeRoot()
+    bridge = UIBridge(root)
+    events = []
+    bridge.post(lambda: 1 / 0)
+    bridge.post(events.append, 'after')
+    root.run()
+    assert events == ['after'] and isinstance(root.errors[0], ZeroDivisionError)
+
+
+@pytest.mark.skipif(not os.environ.get('DISPLAY') and shutil.which('Xvfb') is None,
+                    reason="needs $DISPLAY or Xvfb")
+def test_gui_event_loop_lag_stays_under_50_ms():
+    result = subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'bench_ui_lag.py'),
+                             '--records', '50000', '--max-lag-ms', '50'],
+                            capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
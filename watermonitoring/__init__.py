@@ -0,0 +1,32 @@
+"""Acquisition and data handling for the water quality monitoring app
+
+The names below are imported on first access, so `watermonitoring.protocol`
+can be used without loading numpy.
+"""
+
+import importlib
+
+# Exported name -> submodule defining it
+_EXPORTS = {
+    'HEADERS': 'protocol',
+    'PARAMETERS': 'protocol',
+    'parse_waktu': 'protocol',
+    'format_waktu': 'protocol',
+    'ReadingStore': 'store',
+    'RingStore': 'store',
+    'RunningStats': 'store',
+    'ParseResult': 'parser',
+    'parse_buffer': 'parser',
+    'parse_line': 'parser',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,5 @@
+"""python -m watermonitoring: headless acquisition (see cli.py)"""
+
+from .cli import main
+
+main()
@@ -0,0 +1,323 @@
+"""Streaming threshold and anomaly alerts on incoming readings
+
+AlertEngine.process() runs on every parsed batch. Each source (a sensor
+parameter, or the probe's current and voltage) has a list of detectors:
+
+    ThresholdRule   value outside a fixed [low, high] range
+    RateRule        value changing faster than a limit per second
+    ZScoreRule      value far from the mean of the previous `window` values
+    EwmaRule        value far from an exponentially weighted mean/variance
+
+Detectors keep O(1) state between batches and evaluate a whole batch with
+NumPy. An alert is raised when a detector starts firing; it stays active
+without new alerts until CLEAR_AFTER values in a row pass the detector, so
+a value hovering around a limit does not raise an alert per crossing.
+"""
+
+import collections
+
+import numpy as np
+
+from .protocol import PARAMETERS, SAVE_BITS, TIME_INVALID, format_waktu
+from .textlog import TextLogWriter
+from .timeaxis import TimeAxis
+
+# Static limits per source as (low, high); None leaves a side open
+THRESHOLDS = {
+    'pH': (6.5, 8.5),
+    'temp': (0.0, 35.0),
+    'DO': (4.0, None),
+    'turb': (None, 25.0),
+    'current': (None, 0.5),
+    'voltage': (3.1, None),
+}
+
+# Largest plausible change per second of each sensor
+RATE_LIMITS = {'pH': 1.0, 'temp': 2.0, 'DO': 2.0, 'turb': 20.0}
+
+ZSCORE_WINDOW = 60
+ZSCORE_LIMIT = 4.0
+EWMA_ALPHA = 0.05
+EWMA_LIMIT = 4.0
+# Values a statistical detector needs before it may fire
+WARMUP = 20
+# Quiet values after which an active alert clears
+CLEAR_AFTER = 30
+
+# Alerts kept in memory for display
+ALERT_HISTORY = 100
+
+# First line of an alert log
+ALERT_LOG_HEADER = "baris;waktu;kedalaman;sumber;jenis;nilai;pesan\n"
+
+# Rows per step of the blocked EWMA recurrence
+_EWM_BLOCK = 64
+
+LABELS = {
+    'pH': ("pH", ""),
+    'temp': ("Suhu", " °C"),
+    'DO': ("Oksigen terlarut", " mg/L"),
+    'turb': ("Turbidity", " NTU"),
+    'current': ("Arus", " A"),
+    'voltage': ("Tegangan baterai", " V"),
+}
+
+
+class Alert:
+    """One alert raised by a detector"""
+
+    def __init__(self, row, time_ms, depth, source, kind, value, message):
+        self.row = row
+        self.time_ms = time_ms
+        self.depth = depth
+        self.source = source
+        self.kind = kind
+        self.value = value
+        self.message = message
+
+    def __str__(self):
+        depth = f" (kedalaman {self.depth})" if self.depth is not None else ""
+        return f"{format_waktu(self.time_ms) or '-'} {self.message}{depth}"
+
+
+class ThresholdRule:
+    kind = 'threshold'
+
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
+
+    def check(self, values, elapsed):
+        fired = np.zeros(len(values), dtype=bool)
+        if self.low is not None:
+            fired |= values < self.low
+        if self.high is not None:
+            fired |= values > self.high
+        return fired, values
+
+    def describe(self, label, unit, value, score):
+        if self.low is not None and value < self.low:
+            return f"{label} di bawah batas {self.low:g}{unit}: {value:.2f}{unit}"
+        return f"{label} di atas batas {self.high:g}{unit}: {value:.2f}{unit}"
+
+
+class RateRule:
+    kind = 'rate'
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._last = None
+
+    def check(self, values, elapsed):
+        if self._last is None:
+            self._last = (values[0], elapsed[0])
+        last_value, last_time = self._last
+        previous = np.concatenate(([last_value], values[:-1]))
+        previous_time = np.concatenate(([last_time], elapsed[:-1]))
+        seconds = (elapsed - previous_time) / 1000.0
+        rate = np.zeros(len(values))
+        step = seconds > 0
+        rate[step] = np.abs(values[step] - previous[step]) / seconds[step]
+        self._last = (values[-1], elapsed[-1])
+        return rate > self.limit, rate
+
+    def describe(self, label, unit, value, score):
+        return f"{label} berubah terlalu cepat: {score:.2f}{unit}/detik"
+
+
+class ZScoreRule:
+    kind = 'zscore'
+
+    def __init__(self, window=ZSCORE_WINDOW, limit=ZSCORE_LIMIT, warmup=WARMUP):
+        self.window = window
+        self.limit = limit
+        self.warmup = min(warmup, window)
+        self._history = np.empty(0)
+
+    def check(self, values, elapsed):
+        series = np.concatenate((self._history, values))
+        # Sums over the previous `window` values of every new one; shifting
+        # by the first value keeps the sum of squares well conditioned
+        shifted = series - series[0]
+        sums = np.concatenate(([0.0], np.cumsum(shifted)))
+        squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+        ends = np.arange(len(self._history), len(series))
+        starts = np.maximum(ends - self.window, 0)
+        counts = ends - starts
+        total = sums[ends] - sums[starts]
+        total_sq = squares[ends] - squares[starts]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / counts
+            std = np.sqrt(np.maximum(total_sq / counts - mean * mean, 0.0))
+            z = np.abs(shifted[ends] - mean) / std
+        fired = (counts >= self.warmup) & (std > 0) & (z > self.limit)
+        self._history = series[-self.window:]
+        return fired, np.where(std > 0, z, 0.0)
+
+    def describe(self, label, unit, value, score):
+        return f"{label} menyimpang dari rata-rata bergulir: {value:.2f}{unit} (z={score:.1f})"
+
+
+class EwmaRule:
+    kind = 'ewma'
+
+    def __init__(self, alpha=EWMA_ALPHA, limit=EWMA_LIMIT, warmup=WARMUP):
+        self.alpha = alpha
+        self.limit = limit
+        self.warmup = warmup
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def check(self, values, elapsed):
+        if self.count == 0:
+            self.mean = float(values[0])
+        mean = _ewm(values, self.alpha, self.mean)
+        previous_mean = np.concatenate(([self.mean], mean[:-1]))
+        deviation = values - previous_mean
+        # Exponentially weighted variance: v = (1 - a) * (v + a * d^2)
+        var = _ewm((1 - self.alpha) * deviation * deviation, self.alpha, self.var)
+        previous_std = np.sqrt(np.concatenate(([self.var], var[:-1])))
+        seen = self.count + np.arange(len(values))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = np.where(previous_std > 0, np.abs(deviation) / previous_std, 0.0)
+        fired = (seen >= self.warmup) & (score > self.limit)
+        self.count += len(values)
+        self.mean = float(mean[-1])
+        self.var = float(var[-1])
+        return fired, score
+
+    def describe(self, label, unit, value, score):
+        return f"{label} menyimpang dari tren EWMA: {value:.2f}{unit} ({score:.1f} sd)"
+
+
+def _ewm(values, alpha, start):
+    """s[i] = (1 - alpha) * s[i - 1] + alpha * values[i] with s[-1] = start
+
+    Solved in closed form over short blocks so the powers of (1 - alpha)
+    stay well inside float64 range.
+    """
+    out = np.empty(len(values))
+    powers = (1 - alpha) ** np.arange(1, _EWM_BLOCK + 1)
+    for lo in range(0, len(values), _EWM_BLOCK):
+        block = values[lo:lo + _EWM_BLOCK]
+        scale = powers[:len(block)]
+        out[lo:lo + len(block)] = scale * (start + alpha * np.cumsum(block / scale))
+        start = out[lo + len(block) - 1]
+    return out
+
+
+def default_rules():
+    """Detectors per source built from the module defaults"""
+    rules = {}
+    for source, (low, high) in THRESHOLDS.items():
+        rules[source] = [ThresholdRule(low, high)]
+    for name, _, _, _ in PARAMETERS:
+        rules[name] += [RateRule(RATE_LIMITS[name]), ZScoreRule(), EwmaRule()]
+    return rules
+
+
+class AlertEngine:
+    """Evaluate detectors on parsed batches and collect the alerts
+
+    `on_alert` is called with each new Alert; with `log_path` every alert is
+    also appended to that file as a ;-delimited line, written on a
+    background thread (see TextLogWriter) until close(). A failing log
+    write is kept in `error` instead of interrupting the acquisition.
+    """
+
+    def __init__(self, rules=None, depth=None, on_alert=None, log_path=None):
+        self.rules = rules if rules is not None else default_rules()
+        self.depth = depth
+        self.on_alert = on_alert
+        self.log_path = log_path
+        self._log = TextLogWriter(log_path, ALERT_LOG_HEADER) if log_path is not None else None
+        self.rows = 0
+        self.total = 0
+        self.error = None
+        self.alerts = collections.deque(maxlen=ALERT_HISTORY)
+        # Values since each detector last fired, capped at CLEAR_AFTER
+        self._quiet = {(source, i): CLEAR_AFTER
+                       for source, detectors in self.rules.items()
+                       for i in range(len(detectors))}
+        self._time_axis = TimeAxis()
+
+    @property
+    def active(self):
+        """(source, kind) of detectors with an alert that has not cleared"""
+        return [(source, self.rules[source][i].kind)
+                for (source, i), quiet in self._quiet.items() if quiet < CLEAR_AFTER]
+
+    def process(self, columns, elapsed=None):
+        """Check a batch; `elapsed` is its unwrapped TimeAxis time if known
+
+        Returns the alerts raised by this batch.
+        """
+        count = len(columns['time_ms'])
+        if count == 0:
+            return []
+        if elapsed is None:
+            self._time_axis.extend(columns['time_ms'])
+            elapsed = self._time_axis.elapsed()[-count:]
+        elapsed = np.asarray(elapsed, dtype=np.float64)
+        raised = []
+        for source, detectors in self.rules.items():
+            if source in SAVE_BITS:
+                rows = np.flatnonzero(columns['flags'] & SAVE_BITS[source])
+                values = np.asarray(columns['value_' + source], dtype=np.float64)[rows]
+            else:
+                rows = np.arange(count)
+                values = np.asarray(columns[source], dtype=np.float64)
+            # Readings without a usable time cannot be placed on the axis
+            timed = elapsed[rows] != TIME_INVALID
+            rows, values = rows[timed], values[timed]
+            if not len(rows):
+                continue
+            order = np.arange(len(rows))
+            for i, detector in enumerate(detectors):
+                fired, score = detector.check(values, elapsed[rows])
+                if not fired.any():
+                    self._quiet[source, i] = min(self._quiet[source, i] + len(rows), CLEAR_AFTER)
+                    continue
+                # Position of the latest firing value at or before each value
+                last = np.maximum.accumulate(np.where(fired, order, -1 - self._quiet[source, i]))
+                active = order - last < CLEAR_AFTER
+                was_active = np.concatenate(([self._quiet[source, i] < CLEAR_AFTER], active[:-1]))
+                for j in np.flatnonzero(fired & ~was_active):
+                    raised.append(self._alert(int(rows[j]), columns, source, detector,
+                                              float(values[j]), float(score[j])))
+                self._quiet[source, i] = int(min(order[-1] - last[-1], CLEAR_AFTER))
+        raised.sort(key=lambda alert: alert.row)
+        self.rows += count
+        self._emit(raised)
+        return raised
+
+    def _alert(self, row, columns, source, detector, value, score):
+        label, unit = LABELS[source]
+        return Alert(self.rows + row, int(columns['time_ms'][row]), self.depth, source,
+                     detector.kind, value, detector.describe(label, unit, value, score))
+
+    def close(self):
+        """Write the alerts still queued for the log and stop its thread"""
+        if self._log is not None:
+            try:
+                self._log.close()
+            except OSError as e:
+                self.error = e
+
+    def _emit(self, raised):
+        if not raised:
+            return
+        self.total += len(raised)
+        self.alerts.extend(raised)
+        if self._log is not None and self.error is None:
+            try:
+                self._log.append(''.join(
+                    f"{alert.row};{format_waktu(alert.time_ms)};{alert.depth};"
+                    f"{alert.source};{alert.kind};{alert.value:.6g};{alert.message}\n"
+                    for alert in raised))
+            except OSError as e:
+                self.error = e
+        if self.on_alert is not None:
+            for alert in raised:
+                self.on_alert(alert)
@@ -0,0 +1,207 @@
+"""Batch statistics over many sessions, computed on a process pool
+
+    python -m watermonitoring.analytics arsip --workers 8
+    python -m watermonitoring.analytics log_data/water_quality_*.csv --depth 5
+
+Sources are CSV files written by save_data and archive directories. The
+work is split into tasks, one CSV file or up to TASK_ROWS rows of an
+archive session, which run on a process pool. Workers open their own
+memory maps of the archive column files, so rows reach them through the
+page cache without being copied or pickled, and send back only small
+aggregates: count, mean and M2 (see RunningStats) of the values and
+sampling intervals per depth and parameter. These merge exactly in any
+order, so the report does not depend on the number of workers.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .archive import Archive, read_csv
+from .protocol import PARAMETERS, SAVE_BITS, TIME_INVALID
+from .store import RunningStats
+
+# Most archive rows one task reads
+TASK_ROWS = 256 * 1024
+
+# Tasks handed to a worker at a time, per worker, to keep IPC small but
+# the load balanced
+TASKS_PER_SUBMIT = 4
+
+# Columns a task needs
+_COLUMNS = ['time_ms', 'flags'] + [key for _, _, value_key, interval_key in PARAMETERS
+                                   for key in (value_key, interval_key)]
+
+# Archives opened by this worker process, by path
+_archives = {}
+
+
+class Aggregate:
+    """Mergeable statistics of one parameter at one depth"""
+
+    def __init__(self):
+        self.values = RunningStats()
+        # Sampling intervals in seconds
+        self.intervals = RunningStats()
+        # Rows looked at, valid or not
+        self.rows = 0
+        self.sessions = set()
+
+    def merge(self, other):
+        self.values.merge(other.values)
+        self.intervals.merge(other.intervals)
+        self.rows += other.rows
+        self.sessions |= other.sessions
+
+    def to_dict(self):
+        def stats(running):
+            return {'count': running.count, 'mean': running.mean if running.count else None,
+                    'std': running.std, 'min': running.min, 'max': running.max}
+
+        return {'sessions': len(self.sessions), 'rows': self.rows,
+                'values': stats(self.values), 'intervals_s': stats(self.intervals)}
+
+
+def summarize(columns, depth, session):
+    """{(depth, parameter): Aggregate} of one block of rows"""
+    flags = np.asarray(columns['flags'])
+    stamped = np.asarray(columns['time_ms']) != TIME_INVALID
+    partial = {}
+    for name, _, value_key, interval_key in PARAMETERS:
+        aggregate = partial[(depth, name)] = Aggregate()
+        aggregate.rows = len(flags)
+        aggregate.sessions.add(session)
+        valid = ((flags & SAVE_BITS[name]) != 0) & stamped
+        aggregate.values.add_many(np.asarray(columns[value_key])[valid])
+        aggregate.intervals.add_many(np.asarray(columns[interval_key])[valid] / 1000.0)
+    return partial
+
+
+def _run_task(task):
+    kind, path, depth, session, start, stop = task
+    if kind == 'csv':
+        columns = read_csv(path)
+    else:
+        archive = _archives.get(path)
+        if archive is None:
+            archive = _archives[path] = Archive(path)
+        # Read-only memory maps: the slices are views of the page cache
+        columns = {name: archive._column(name)[start:stop] for name in _COLUMNS}
+    return summarize(columns, depth, session)
+
+
+def plan(sources, depth=None, task_rows=TASK_ROWS):
+    """Tasks for CSV files and archive directories; CSV sessions get `depth`"""
+    tasks = []
+    for source in sources:
+        if os.path.isdir(source):
+            for session in Archive(source).sessions:
+                key = f"{source}#{session['id']}"
+                for start in range(0, session['rows'], task_rows):
+                    stop = min(start + task_rows, session['rows'])
+                    tasks.append(('archive', source, session['depth'], key,
+                                  session['offset'] + start, session['offset'] + stop))
+        else:
+            tasks.append(('csv', source, depth, source, 0, 0))
+    return tasks
+
+
+def analyze(sources, depth=None, workers=None, task_rows=TASK_ROWS):
+    """Merged {(depth, parameter): Aggregate} over all sources
+
+    `workers` defaults to the number of CPUs; with 1 the tasks run in this
+    process.
+    """
+    tasks = plan(sources, depth, task_rows)
+    workers = workers or os.cpu_count() or 1
+    report = {}
+
+    def merge(partial):
+        for key, aggregate in partial.items():
+            if key in report:
+                report[key].merge(aggregate)
+            else:
+                report[key] = aggregate
+
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            merge(_run_task(task))
+        return report
+    chunksize = max(1, len(tasks) // (workers * TASKS_PER_SUBMIT))
+    with ProcessPoolExecutor(workers) as pool:
+        for partial in pool.map(_run_task, tasks, chunksize=chunksize):
+            merge(partial)
+    return report
+
+
+def by_parameter(report):
+    """{parameter: Aggregate} merged over all depths"""
+    totals = {name: Aggregate() for name, _, _, _ in PARAMETERS}
+    for (_, name), aggregate in report.items():
+        totals[name].merge(aggregate)
+    return totals
+
+
+def _depth_order(depth):
+    return (depth is None, depth or 0.0)
+
+
+def format_report(report):
+    """Text table: one block per depth, then all depths together"""
+
+    def line(name, aggregate):
+        values, intervals = aggregate.values, aggregate.intervals
+        if not values.count:
+            return f"  {name:<5} no valid readings"
+        std = f" ± {values.std:.4g}" if values.std is not None else ""
+        return (f"  {name:<5} n={values.count:<9} mean {values.mean:.4g}{std}  "
+                f"[{values.min:.4g} .. {values.max:.4g}]  interval {intervals.mean:.3f} s")
+
+    lines = []
+    depths = sorted({depth for depth, _ in report}, key=_depth_order)
+    for depth in depths:
+        sessions = len(report[(depth, PARAMETERS[0][0])].sessions)
+        label = "no depth" if depth is None else f"depth {depth:g} m"
+        lines.append(f"{label}: {sessions} sessions")
+        lines.extend(line(name, report[(depth, name)]) for name, _, _, _ in PARAMETERS)
+    totals = by_parameter(report)
+    lines.append(f"all depths: {len(totals[PARAMETERS[0][0]].sessions)} sessions")
+    lines.extend(line(name, totals[name]) for name, _, _, _ in PARAMETERS)
+    return '\n'.join(lines)
+
+
+def report_dict(report):
+    """JSON-ready form of a report"""
+    depths = sorted({depth for depth, _ in report}, key=_depth_order)
+    return {
+        'depths': [{'depth': depth,
+                    'parameters': {name: report[(depth, name)].to_dict()
+                                   for name, _, _, _ in PARAMETERS}}
+                   for depth in depths],
+        'all': {name: aggregate.to_dict() for name, aggregate in by_parameter(report).items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-depth statistics of many sessions")
+    parser.add_argument('sources', nargs='+', help="save_data CSV files and archive directories")
+    parser.add_argument('--depth', type=float, help="depth of the CSV files")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPUs)")
+    parser.add_argument('--json', help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = analyze(args.sources, args.depth, args.workers)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report_dict(report), f, indent=1)
+    print(f"done in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""Memory-mapped archive of many test sessions
+
+An archive is a directory holding one flat file per column (all sessions
+appended back to back), a sparse time index and a JSON list of sessions:
+
+    sessions.json       per-session metadata: device, depth, duration, rows
+    epoch_ms.col        absolute time of every row (ms since the Unix epoch)
+    <column>.col        the ReadingStore columns
+    index_min.col       per block of INDEX_STRIDE rows: smallest epoch_ms
+    index_max.col       ... and largest epoch_ms
+    profile.npz         depth x time grid of every parameter (see profile.py)
+    archive.lock        held by the writer adding a session
+
+The GUI, the headless CLI and campaigns may all add to one archive.
+add_session() takes an exclusive lock on archive.lock (flock) and rereads
+the metadata under it, so writers in other processes and threads append
+one after another. Where fcntl is missing (Windows) only the threads of
+one process are kept apart; run one writing process per archive there.
+
+Queries read the small index and metadata first and then only touch the
+memory-mapped pages of the blocks that overlap the requested time range.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, see the single-writer note above
+    fcntl = None
+
+from .parser import parse_buffer
+from .profile import DepthTimeGrid
+from .protocol import PARAMETERS, SAVE_BITS, TIME_INVALID
+from .store import COLUMN_DTYPES
+from .timeaxis import DAY_MS, TimeAxis
+
+# Rows summarised by one entry of the sparse time index
+INDEX_STRIDE = 4096
+
+ARCHIVE_COLUMNS = dict(COLUMN_DTYPES, epoch_ms=np.int64)
+
+_CSV_NAME = re.compile(r'(\d{8})_(\d{6})')
+
+# Writers of this process; flock keeps other processes out
+_WRITE_LOCK = threading.Lock()
+
+
+def epoch_ms(time_ms, day_start, time_axis=None):
+    """Turn ms-since-midnight stamps into absolute epoch ms
+
+    `day_start` is the epoch ms of midnight of the first reading's day.
+    Rollovers and bad stamps are handled as in TimeAxis; pass the store's
+    `time_axis` to reuse the axis decoded at ingest. Rows before the first
+    decodable stamp take its time.
+    """
+    if time_axis is None:
+        time_axis = TimeAxis()
+        time_axis.extend(time_ms)
+    elapsed = time_axis.elapsed()[:len(time_ms)]
+    if time_axis.first is None:
+        return np.full(len(elapsed), day_start, dtype=np.int64)
+    return day_start + np.where(elapsed == TIME_INVALID, time_axis.first, elapsed)
+
+
+def read_csv(csv_path):
+    """Columns of a CSV file written by save_data"""
+    with open(csv_path) as f:
+        lines = f.read().splitlines()[1:]
+    # CSV rows lack the sd_card_finished token the parser expects
+    return parse_buffer([line + ';0' for line in lines if line]).columns
+
+
+def _midnight_ms(moment):
+    midnight = datetime(moment.year, moment.month, moment.day)
+    return int(midnight.timestamp() * 1000)
+
+
+class Archive:
+    """Append sessions to an archive directory and query them lazily"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.sessions = []
+        self._load_sessions()
+        self._maps = {}
+        self._profile = None
+
+    def _load_sessions(self):
+        meta = os.path.join(self.path, 'sessions.json')
+        if os.path.exists(meta):
+            with open(meta) as f:
+                self.sessions = json.load(f)
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold the write lock, with the sessions other writers added loaded"""
+        with _WRITE_LOCK, open(os.path.join(self.path, 'archive.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load_sessions()
+            yield
+
+    @property
+    def rows(self):
+        return sum(session['rows'] for session in self.sessions)
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.col')
+
+    def _column(self, name, dtype=None):
+        """Read-only memory map of a column file, reopened after appends"""
+        dtype = dtype or ARCHIVE_COLUMNS[name]
+        path = self._file(name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self._maps.get(name)
+        if cached is None or cached.nbytes != size:
+            if size == 0:
+                cached = np.empty(0, dtype=dtype)
+            else:
+                cached = np.memmap(path, dtype=dtype, mode='r')
+            self._maps[name] = cached
+        return cached
+
+    def _save_sessions(self):
+        meta = os.path.join(self.path, 'sessions.json')
+        tmp = meta + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.sessions, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, meta)
+
+    def _append(self, name, expected_size, data):
+        with open(self._file(name), 'ab') as f:
+            # Drop rows of an earlier add_session that crashed before its
+            # metadata was saved
+            if f.tell() > expected_size:
+                f.truncate(expected_size)
+            f.write(data.tobytes())
+
+    def add_session(self, columns, started, depth=None, duration=None, device=None, source=None,
+                    time_axis=None):
+        """Append one session's columns; `started` is a datetime on its first day
+
+        `time_axis` is the TimeAxis of the columns when already decoded.
+        Returns the new session's metadata.
+        """
+        epoch = epoch_ms(columns['time_ms'], _midnight_ms(started), time_axis)
+        with self._writing():
+            return self._add(columns, epoch, depth, duration, device, source)
+
+    def _add(self, columns, epoch, depth, duration, device, source):
+        rows = len(epoch)
+        offset = self.rows
+        index_offset = sum(session['index_count'] for session in self.sessions)
+
+        starts = np.arange(0, rows, INDEX_STRIDE)
+        if rows:
+            index_min = np.minimum.reduceat(epoch, starts)
+            index_max = np.maximum.reduceat(epoch, starts)
+        else:
+            index_min = index_max = np.empty(0, dtype=np.int64)
+
+        for name, dtype in ARCHIVE_COLUMNS.items():
+            data = epoch if name == 'epoch_ms' else columns[name]
+            self._append(name, offset * np.dtype(dtype).itemsize,
+                         np.ascontiguousarray(data, dtype=dtype))
+        for name, data in (('index_min', index_min), ('index_max', index_max)):
+            self._append(name, index_offset * 8, data)
+
+        session = {
+            'id': len(self.sessions),
+            'device': device,
+            'depth': depth,
+            'duration': duration,
+            'source': source,
+            'offset': offset,
+            'rows': rows,
+            'index_offset': index_offset,
+            'index_count': len(starts),
+            'start_ms': int(epoch.min()) if rows else None,
+            'end_ms': int(epoch.max()) if rows else None,
+        }
+        # Metadata is written last, so a crash leaves at most unreferenced rows
+        self.sessions.append(session)
+        self._save_sessions()
+        if self._profile is not None and self._profile.sessions == len(self.sessions) - 1:
+            # Fold the columns at hand into a loaded grid instead of reading them back
+            self._profile.add(epoch, columns, depth)
+            self._profile.save(self._profile_path())
+        else:
+            self._update_profile()
+        return session
+
+    def _profile_path(self):
+        return os.path.join(self.path, 'profile.npz')
+
+    def profile(self):
+        """The depth x time grid of all sessions
+
+        Sessions added since the grid was last saved (an archive from before
+        the grid existed, or a crash in between) are folded in first.
+        """
+        if self._profile is None:
+            self._profile = DepthTimeGrid.load(self._profile_path())
+        if self._profile.sessions < len(self.sessions):
+            # The grid file is written under the lock like the sessions
+            with self._writing():
+                self._update_profile()
+        return self._profile
+
+    def _update_profile(self):
+        if self._profile is None:
+            self._profile = DepthTimeGrid.load(self._profile_path())
+        grid = self._profile
+        if grid.sessions < len(self.sessions):
+            names = ['epoch_ms', 'time_ms', 'flags'] + [value_key for _, _, value_key, _ in PARAMETERS]
+            for session in self.sessions[grid.sessions:]:
+                rows = slice(session['offset'], session['offset'] + session['rows'])
+                columns = {name: self._column(name)[rows] for name in names}
+                grid.add(columns['epoch_ms'], columns, session['depth'])
+            grid.save(self._profile_path())
+
+    def import_csv(self, csv_path, depth=None, duration=None, device=None):
+        """Add a save_data CSV file as a session
+
+        The date comes from the water_quality_YYYYMMDD_HHMMSS name (the
+        moment the file was saved) or else from the file's modification time.
+        """
+        columns = read_csv(csv_path)
+
+        match = _CSV_NAME.search(os.path.basename(csv_path))
+        if match:
+            saved = datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M%S')
+        else:
+            saved = datetime.fromtimestamp(os.path.getmtime(csv_path))
+        # Walk back from the save date over the rollovers inside the run
+        saved_day = datetime(saved.year, saved.month, saved.day)
+        relative = epoch_ms(columns['time_ms'], 0)
+        last_day, last_tod = divmod(int(relative[-1]), DAY_MS) if len(relative) else (0, 0)
+        saved_tod = (saved - saved_day).total_seconds() * 1000
+        if last_tod > saved_tod:
+            last_day += 1
+        started = saved_day - timedelta(days=last_day)
+        return self.add_session(columns, started, depth, duration, device,
+                                source=os.path.basename(csv_path))
+
+    def find_sessions(self, start=None, end=None, depth=None, device=None):
+        """Sessions overlapping [start, end] epoch ms with matching tags"""
+        found = []
+        for session in self.sessions:
+            if not session['rows']:
+                continue
+            if depth is not None and (session['depth'] is None
+                                      or abs(session['depth'] - depth) > 1e-6):
+                continue
+            if device is not None and session['device'] != device:
+                continue
+            if start is not None and session['end_ms'] < start:
+                continue
+            if end is not None and session['start_ms'] > end:
+                continue
+            found.append(session)
+        return found
+
+    def query(self, column, start=None, end=None, depth=None, device=None, valid_only=True):
+        """Return (epoch_ms, values) of `column` within [start, end]
+
+        `start`/`end` are epoch ms or datetimes. For value columns of a
+        sensor only rows with its save flag set are returned when
+        `valid_only` is true.
+        """
+        if isinstance(start, datetime):
+            start = int(start.timestamp() * 1000)
+        if isinstance(end, datetime):
+            end = int(end.timestamp() * 1000)
+        lo = np.iinfo(np.int64).min if start is None else start
+        hi = np.iinfo(np.int64).max if end is None else end
+
+        save_bit = None
+        for name, _, value_key, interval_key in PARAMETERS:
+            if column in (value_key, interval_key):
+                save_bit = SAVE_BITS[name]
+
+        index_min = self._column('index_min', np.int64)
+        index_max = self._column('index_max', np.int64)
+        epoch = self._column('epoch_ms')
+        time_ms = self._column('time_ms')
+        values = self._column(column)
+        flags = self._column('flags')
+        times_out = []
+        values_out = []
+        for session in self.find_sessions(start, end, depth, device):
+            first = session['index_offset']
+            blocks = slice(first, first + session['index_count'])
+            hits = np.flatnonzero((index_max[blocks] >= lo) & (index_min[blocks] <= hi))
+            for block in hits:
+                row = session['offset'] + block * INDEX_STRIDE
+                stop = min(row + INDEX_STRIDE, session['offset'] + session['rows'])
+                times = np.asarray(epoch[row:stop])
+                mask = (times >= lo) & (times <= hi) & (np.asarray(time_ms[row:stop]) != TIME_INVALID)
+                if valid_only and save_bit is not None:
+                    mask &= (np.asarray(flags[row:stop]) & save_bit) != 0
+                times_out.append(times[mask])
+                values_out.append(np.asarray(values[row:stop])[mask])
+        if not times_out:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=ARCHIVE_COLUMNS[column])
+        return np.concatenate(times_out), np.concatenate(values_out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import CSV files into an archive and query it")
+    parser.add_argument('archive', help="archive directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('import', help="add save_data CSV files as sessions")
+    add.add_argument('csv', nargs='+')
+    add.add_argument('--depth', type=float)
+    add.add_argument('--device')
+    commands.add_parser('sessions', help="list archived sessions")
+    ask = commands.add_parser('query', help="print values of a column")
+    ask.add_argument('column', help="e.g. value_turb")
+    ask.add_argument('--start', help="YYYY-MM-DD[THH:MM:SS]")
+    ask.add_argument('--end', help="YYYY-MM-DD[THH:MM:SS]")
+    ask.add_argument('--depth', type=float)
+    ask.add_argument('--device')
+    heat = commands.add_parser('profile', help="depth x time grid of a parameter")
+    heat.add_argument('parameter', choices=[name for name, _, _, _ in PARAMETERS])
+    heat.add_argument('--stat', choices=('mean', 'min', 'max', 'count'), default='mean')
+    heat.add_argument('--png', help="render the heatmap to this file instead of printing")
+    args = parser.parse_args()
+
+    archive = Archive(args.archive)
+    if args.command == 'import':
+        for path in args.csv:
+            session = archive.import_csv(path, depth=args.depth, device=args.device)
+            print(f"{path}: session {session['id']}, {session['rows']} rows")
+    elif args.command == 'profile':
+        grid = archive.profile()
+        if args.png:
+            from matplotlib.figure import Figure
+            from .profile import plot_profile
+            figure = Figure(figsize=(12, 5))
+            plot_profile(figure, grid, args.parameter, args.stat)
+            figure.savefig(args.png, dpi=100)
+        else:
+            depths, edges, matrix = grid.view(args.parameter, args.stat)
+            for depth, row in zip(depths, matrix):
+                cells = row[~np.isnan(row)]
+                summary = (f"{cells.min():.6g}..{cells.max():.6g} over {len(cells)} bins"
+                           if len(cells) else "-")
+                print(f"depth {depth:g}: {summary}")
+    elif args.command == 'sessions':
+        for session in archive.sessions:
+            start = datetime.fromtimestamp(session['start_ms'] / 1000) if session['rows'] else '-'
+            print(f"{session['id']:>5} {str(start):<26} {session['rows']:>9} rows  "
+                  f"depth={session['depth']} device={session['device']} {session['source'] or ''}")
+    else:
+        start = datetime.fromisoformat(args.start) if args.start else None
+        end = datetime.fromisoformat(args.end) if args.end else None
+        times, values = archive.query(args.column, start, end, args.depth, args.device)
+        for t, value in zip(times, values):
+            print(f"{datetime.fromtimestamp(t / 1000).isoformat(timespec='milliseconds')};{value:.6g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Resumable retrieval of the records stored on a probe's SD card
+
+Every record a probe saves has a sequence number, its position in the
+stored log. The log is fetched CHUNK_RECORDS at a time over a session (see
+session.py); each chunk is handed on and its end recorded in a Cursor
+before the next one is asked for. A broken link or a restart therefore
+costs at most one chunk, and memory is bounded by the chunk size however
+large the log is.
+
+A resumed transfer starts one record early, at the last record already
+received. Its timestamp must match the one kept in the cursor, and the
+record is then dropped as a duplicate. A mismatch, or a log shorter than
+the cursor, means the card was cleared or swapped; the transfer then
+starts over from sequence 0.
+
+    python -m watermonitoring.backlog probe1=192.168.1.100:80
+
+A test run with the save flag whose reply breaks off is completed the same
+way from the stored log, see run_saved_test().
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import sys
+import time
+from datetime import datetime
+
+from .cli import LOG_DIR, _terminate
+from .client import StreamTotals, is_finished
+from .engine import Device
+from .errors import ProbeDisconnected, ProbeError, ProbeTimeout, ProtocolError
+from .metrics import Metrics
+from .parser import parse_buffer
+from .protocol import TIME_INVALID, parse_waktu
+from .recordlog import encode_chunk
+from .session import ProbeConnection
+
+# Records asked for per fetch; bounds the memory of a transfer
+CHUNK_RECORDS = 2000
+# Broken fetches in a row that are resumed before giving up
+MAX_RESUMES = 5
+# Seconds before a broken transfer is resumed
+RESUME_DELAY = 1.0
+# Seconds between fetches while a running test has not stored more records
+POLL_INTERVAL = 1.0
+
+
+def _line_time(line):
+    """time_ms of a record line, None when it has no valid timestamp"""
+    time_ms = parse_waktu(line.split(';', 1)[0])
+    return None if time_ms == TIME_INVALID else time_ms
+
+
+class Cursor:
+    """Sequence number of the next record to fetch and the time of the one before
+
+    Saved as JSON after every chunk when a path is given.
+    """
+
+    def __init__(self, path=None, sequence=0, last_time_ms=None):
+        self.path = path
+        self.sequence = sequence
+        # time_ms of record sequence - 1 when known, checked on resume
+        self.last_time_ms = last_time_ms
+
+    @classmethod
+    def load(cls, path):
+        """Read a saved cursor; a missing file starts at sequence 0"""
+        cursor = cls(path)
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            cursor.sequence = data['sequence']
+            cursor.last_time_ms = data['last_time_ms']
+        return cursor
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'sequence': self.sequence, 'last_time_ms': self.last_time_ms}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class BacklogTotals(StreamTotals):
+    """StreamTotals of a stored-log transfer plus its chunk, resume and duplicate counts"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = 0
+        self.duplicates = 0
+        self.resumes = 0
+        # Transfers started over because the stored log was replaced
+        self.restarts = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def records_per_second(self):
+        return self.records / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        text = super().summary()
+        if self.resumes:
+            text += f", dilanjutkan {self.resumes} kali"
+        if self.duplicates:
+            text += f", {self.duplicates} duplikat dibuang"
+        return text
+
+
+def retrieve(probe, on_batch, cursor, until_finished=False, chunk_records=CHUNK_RECORDS,
+             max_resumes=MAX_RESUMES, totals=None):
+    """Fetch the stored log of `probe` from `cursor` on, one chunk at a time
+
+    `on_batch(result)` gets every chunk as a ParseResult; the cursor
+    advances and is saved once it returns. Stops when everything the
+    device has stored is read, or with `until_finished` after the next
+    record carrying the finished flag, waiting for a running test to store
+    it. Broken fetches are resumed up to `max_resumes` times in a row.
+    Returns BacklogTotals, continuing `totals` when given.
+    """
+    totals = totals if totals is not None else BacklogTotals()
+    metrics = probe.metrics
+    started = time.perf_counter()
+    failures = 0
+    verify = True
+    idle_since = None
+    while True:
+        overlap = 1 if verify and cursor.sequence and cursor.last_time_ms is not None else 0
+        try:
+            lines, stored = probe.fetch(cursor.sequence - overlap, chunk_records + overlap)
+        except (ProbeDisconnected, ProbeTimeout):
+            failures += 1
+            if failures > max_resumes:
+                raise
+            totals.resumes += 1
+            if metrics is not None:
+                metrics.count('backlog_resumes_total')
+            verify = True
+            time.sleep(RESUME_DELAY)
+            continue
+        failures = 0
+        verify = False
+        if stored < cursor.sequence or overlap and (not lines
+                                                    or _line_time(lines[0]) != cursor.last_time_ms):
+            if until_finished:
+                raise ProtocolError(f"{probe.address}: stored log does not match the test")
+            # The card was cleared or swapped since the cursor was saved
+            cursor.sequence = 0
+            cursor.last_time_ms = None
+            totals.restarts += 1
+            continue
+        if overlap:
+            lines = lines[1:]
+            totals.duplicates += 1
+            if metrics is not None:
+                metrics.count('backlog_duplicates_total')
+        if until_finished:
+            end = next((i for i, line in enumerate(lines) if is_finished(line)), None)
+            if end is not None:
+                lines = lines[:end + 1]
+
+        if lines:
+            idle_since = None
+            result = parse_buffer(lines)
+            on_batch(result)
+            cursor.sequence += len(lines)
+            cursor.last_time_ms = _line_time(lines[-1])
+            cursor.save()
+            totals.add(result)
+            totals.chunks += 1
+            totals.bytes += sum(map(len, lines)) + len(lines)
+            if metrics is not None:
+                metrics.count('backlog_records_total', len(result))
+                metrics.observe('parse_seconds', result.elapsed)
+                metrics.set('backlog_records_per_second',
+                            totals.records / (time.perf_counter() - started + totals.seconds))
+            if until_finished and is_finished(lines[-1]):
+                totals.finished = True
+                break
+        elif until_finished:
+            # The test is still running and has not stored more yet
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > probe.timeout:
+                raise ProbeTimeout(f"{probe.address}: stored test records stopped growing")
+            time.sleep(POLL_INTERVAL)
+        if not until_finished and cursor.sequence >= stored:
+            totals.finished = True
+            break
+    totals.seconds += time.perf_counter() - started
+    return totals
+
+
+def run_saved_test(probe, depth, duration, on_batch, binary=False, max_resumes=MAX_RESUMES):
+    """Run a test with the save flag; a reply that breaks off is completed from the stored log
+
+    The device writes the test's records to its log after the records it
+    held before, so whatever did not arrive is fetched from there on. A
+    reply cut mid-line loses only that line (see read_records). Firmware
+    without sessions has no access to the stored log and runs the test
+    once as before. Returns BacklogTotals (StreamTotals for old firmware).
+    """
+    probe.connect()
+    stored = probe.status().get('stored') if probe.persistent else None
+    if stored is None:
+        return probe.run_test(depth, duration, True, on_batch, binary=binary)
+    cursor = Cursor(sequence=int(stored))
+    totals = BacklogTotals()
+
+    def received(result):
+        totals.add(result)
+        cursor.sequence += len(result) + result.malformed
+        # Only a batch without rejected lines tells the time of its last line
+        last = int(result.columns['time_ms'][-1]) if len(result) and not result.malformed else None
+        cursor.last_time_ms = None if last == TIME_INVALID else last
+        on_batch(result)
+
+    started = time.perf_counter()
+    try:
+        totals.finished = probe.run_test(depth, duration, True, received, binary=binary).finished
+        totals.seconds = time.perf_counter() - started
+        return totals
+    except (ProbeDisconnected, ProbeTimeout):
+        totals.seconds = time.perf_counter() - started
+        totals.resumes += 1
+        if probe.metrics is not None:
+            probe.metrics.count('backlog_resumes_total')
+    return retrieve(probe, on_batch, cursor, until_finished=True, max_resumes=max_resumes,
+                    totals=totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the records stored on a probe to a reading log")
+    parser.add_argument('device', help="probe as [id=]host[:port]")
+    parser.add_argument('--log-dir', default=LOG_DIR)
+    parser.add_argument('--cursor', help="resume state (default: LOG_DIR/<id>_backlog.json)")
+    parser.add_argument('--chunk', type=int, default=CHUNK_RECORDS, help="records per fetch")
+    parser.add_argument('--resumes', type=int, default=MAX_RESUMES,
+                        help="broken fetches in a row resumed before giving up")
+    parser.add_argument('--read-timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    device = Device.parse(args.device)
+    os.makedirs(args.log_dir, exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', device.device_id)
+    cursor = Cursor.load(args.cursor or os.path.join(args.log_dir, f"{name}_backlog.json"))
+    path = os.path.join(args.log_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_backlog.wqlog")
+    signal.signal(signal.SIGTERM, _terminate)
+
+    probe = ProbeConnection(device.host, device.port, timeout=args.read_timeout, metrics=Metrics())
+    log = open(path, 'ab')
+
+    def write(result):
+        # A chunk is on disk before the cursor moves past it
+        log.write(encode_chunk(result.columns))
+        log.flush()
+        os.fsync(log.fileno())
+
+    try:
+        totals = retrieve(probe, write, cursor, chunk_records=args.chunk, max_resumes=args.resumes)
+    except ProbeError as e:
+        print(f"{device.device_id}: {e} (resume from record {cursor.sequence})", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"stopped at record {cursor.sequence}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        log.close()
+        probe.close()
+        if not os.path.getsize(path):
+            os.remove(path)
+
+    print(f"{device.device_id}: {totals.summary()}, stored log read up to record {cursor.sequence}")
+    print(f"{totals.chunks} chunks, {totals.resumes} resumes, {totals.duplicates} duplicates, "
+          f"{totals.restarts} restarts; {totals.records_per_second:,.0f} records/s, "
+          f"{totals.bytes / max(totals.seconds, 1e-9) / 1e6:.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""Scheduled depth-profiling campaigns
+
+A campaign runs a sequence of depths on one or more probes and repeats it
+on a fixed period:
+
+    python -m watermonitoring.campaign jobs.json add hourly --device probe1=192.168.1.100 \\
+        --depths 1 2 5 --duration 60 --every 3600 --rounds 24
+    python -m watermonitoring.campaign jobs.json run --archive arsip
+    python -m watermonitoring.campaign jobs.json status
+
+Campaigns and their jobs (one test at one depth on one probe) live in a
+JSON queue file that is rewritten atomically after every state change, so
+a stopped scheduler continues where it left off. Each finished job is
+written to its own reading log and archive session. Queue wait (due until
+started) and run time are recorded per job to size how many probes a
+station can serve.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .archive import Archive
+from .cli import LOG_DIR, DeviceRun, _terminate
+from .engine import DONE, AcquisitionEngine, Device
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+# DONE comes from the engine
+FAILED = 'failed'
+
+# Tests one probe runs at the same time; a probe has one sensor string, so
+# its depths are measured one after another
+PER_DEVICE = 1
+# Tests running at the same time over all probes
+MAX_JOBS = 8
+# Runs of a failed job, counting the first
+MAX_RUNS = 3
+# Seconds before a failed job is queued again
+RETRY_DELAY = 60.0
+# Longest sleep (s) of the scheduler while it waits for the next due job
+POLL_INTERVAL = 5.0
+
+
+class JobQueue:
+    """Campaigns and jobs, persisted in one JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.campaigns = []
+        self.jobs = []
+        # Numbers of the last snapshot taken and written; see write()
+        self._taken = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.campaigns = data['campaigns']
+            self.jobs = data['jobs']
+        # Jobs that were running when the scheduler stopped start over
+        for job in self.jobs:
+            if job['state'] == RUNNING:
+                job['state'] = QUEUED
+
+    def save(self):
+        self.write(self.snapshot())
+
+    def snapshot(self):
+        """The queue as it is now, for write() in another thread"""
+        self._taken += 1
+        return self._taken, json.dumps({'campaigns': self.campaigns, 'jobs': self.jobs}, indent=1)
+
+    def write(self, snapshot):
+        """Replace the queue file with a snapshot unless a newer one is already written"""
+        number, text = snapshot
+        with self._lock:
+            if number <= self._written:
+                return
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._written = number
+
+    def add_campaign(self, name, devices, depths, duration, every=None, rounds=1, save=False,
+                     start=None):
+        """Register a campaign; its rounds are queued when they fall due
+
+        `devices` are `[id=]host[:port]` specs, `every` the period of the
+        rounds in seconds and `rounds` their number (0 repeats forever).
+        """
+        if any(campaign['name'] == name for campaign in self.campaigns):
+            raise ValueError(f"campaign {name!r} already exists")
+        if not rounds and not every:
+            raise ValueError("a campaign without --every needs a number of rounds")
+        campaign = {
+            'name': name,
+            'devices': list(devices),
+            'depths': [int(depth) for depth in depths],
+            'duration': int(duration),
+            'save': bool(save),
+            'every': every,
+            'rounds': rounds,
+            'next_round': 0,
+            'next_due': time.time() if start is None else start,
+            # Rounds skipped because the scheduler was not running in time
+            'missed': 0,
+        }
+        self.campaigns.append(campaign)
+        self.save()
+        return campaign
+
+    def queue_due_rounds(self, now):
+        """Queue the jobs of every campaign round due by `now`; returns the new jobs"""
+        added = []
+        for campaign in self.campaigns:
+            while self._round_pending(campaign) and campaign['next_due'] <= now:
+                due = campaign['next_due']
+                if campaign['every'] and due + campaign['every'] <= now:
+                    # A later round is already due, a stale profile is not worth queueing
+                    campaign['next_round'] += 1
+                    campaign['next_due'] = due + campaign['every']
+                    campaign['missed'] += 1
+                    continue
+                # Depths in the given order, probes side by side
+                for depth in campaign['depths']:
+                    for spec in campaign['devices']:
+                        added.append(self._add_job(campaign, campaign['next_round'], spec, depth, due))
+                campaign['next_round'] += 1
+                if campaign['every']:
+                    campaign['next_due'] = due + campaign['every']
+        if added:
+            self.save()
+        return added
+
+    def _round_pending(self, campaign):
+        return not campaign['rounds'] or campaign['next_round'] < campaign['rounds']
+
+    def _add_job(self, campaign, round_, spec, depth, due):
+        device = Device.parse(spec)
+        job = {
+            'id': len(self.jobs),
+            'campaign': campaign['name'],
+            'round': round_,
+            'device': device.device_id,
+            'spec': spec,
+            'depth': depth,
+            'duration': campaign['duration'],
+            'save': campaign['save'],
+            'state': QUEUED,
+            'runs': 0,
+            'due': due,
+            'started': None,
+            'finished': None,
+            'queue_wait': None,
+            'run_time': None,
+            'rows': 0,
+            'log': None,
+            'session': None,
+            'error': None,
+        }
+        self.jobs.append(job)
+        return job
+
+    def ready(self, now):
+        """Queued jobs due by `now`, oldest first"""
+        return sorted((job for job in self.jobs if job['state'] == QUEUED and job['due'] <= now),
+                      key=lambda job: (job['due'], job['id']))
+
+    def next_due(self):
+        """Earliest time a queued job or campaign round becomes due, None if there is none"""
+        times = [job['due'] for job in self.jobs if job['state'] == QUEUED]
+        times += [campaign['next_due'] for campaign in self.campaigns
+                  if self._round_pending(campaign)]
+        return min(times) if times else None
+
+
+class CampaignScheduler:
+    """Run the jobs of a JobQueue within per-probe and total concurrency limits"""
+
+    def __init__(self, queue, log_dir, archive=None, per_device=PER_DEVICE, max_jobs=MAX_JOBS,
+                 max_runs=MAX_RUNS, retry_delay=RETRY_DELAY, on_job=None, **session_options):
+        self.queue = queue
+        self.log_dir = log_dir
+        self.archive = archive
+        self.per_device = per_device
+        self.max_jobs = max_jobs
+        self.max_runs = max_runs
+        self.retry_delay = retry_delay
+        self.on_job = on_job
+        self.session_options = session_options
+
+    async def run(self, until=None):
+        """Run due jobs until nothing is left to schedule or `until` (epoch s) has passed"""
+        running = {}
+        busy = {}
+        try:
+            while True:
+                now = time.time()
+                if until is None or now < until:
+                    self.queue.queue_due_rounds(now)
+                    for job in self.queue.ready(now):
+                        if len(running) >= self.max_jobs:
+                            break
+                        if busy.get(job['device'], 0) >= self.per_device:
+                            continue
+                        busy[job['device']] = busy.get(job['device'], 0) + 1
+                        job['state'] = RUNNING
+                        running[asyncio.create_task(self._run_job(job))] = job
+
+                next_due = self.queue.next_due()
+                stopping = until is not None and now >= until
+                if not running and (next_due is None or stopping):
+                    return
+                timeout = POLL_INTERVAL
+                if next_due is not None and not stopping:
+                    timeout = min(timeout, max(0.0, next_due - now))
+                if until is not None and not stopping:
+                    timeout = min(timeout, max(0.0, until - now))
+                if running:
+                    done, _ = await asyncio.wait(running, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    done = ()
+                    await asyncio.sleep(timeout)
+                for task in done:
+                    job = running.pop(task)
+                    busy[job['device']] -= 1
+                    task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            # Cancelled jobs run again next time
+            for job in running.values():
+                if job['state'] == RUNNING:
+                    job['state'] = QUEUED
+            self.queue.save()
+
+    async def _save(self):
+        # The snapshot is taken on the loop, the fsync waits in a worker thread
+        await asyncio.to_thread(self.queue.write, self.queue.snapshot())
+
+    async def _run_job(self, job):
+        started = datetime.now()
+        job['runs'] += 1
+        job['started'] = time.time()
+        job['finished'] = None
+        job['queue_wait'] = job['started'] - job['due']
+        await self._save()
+        try:
+            await self._test(job, started)
+        except OSError as e:
+            # A reading log or archive that cannot be written fails this job
+            # only; the other jobs go on
+            job['state'] = FAILED
+            job['error'] = str(e)
+            if job['finished'] is None:
+                job['finished'] = time.time()
+                job['run_time'] = job['finished'] - job['started']
+        await self._save()
+        if self.on_job is not None:
+            self.on_job(job)
+
+    async def _test(self, job, started):
+        device = Device.parse(job['spec'], depth=job['depth'], duration=job['duration'],
+                              save=job['save'])
+        run = DeviceRun(device, started, self.log_dir,
+                        name=f"{job['campaign']}_job{job['id']}_{device.device_id}")
+        job['log'] = run.log.path
+        engine = AcquisitionEngine([device], **self.session_options)
+        try:
+            async for batch in engine.stream():
+                run.add(batch.columns)
+        finally:
+            await asyncio.to_thread(run.close)
+        session = engine.sessions[device.device_id]
+
+        job['finished'] = time.time()
+        job['run_time'] = job['finished'] - job['started']
+        job['rows'] = len(run.store)
+        if session.state == DONE:
+            job['state'] = DONE
+            # A finished test whose files could not all be written keeps the reason
+            job['error'] = '; '.join(f"gagal menulis {path}: {error}"
+                                     for path, error in run.write_errors()) or None
+            if self.archive is not None and len(run.store):
+                archived = await asyncio.to_thread(
+                    self.archive.add_session, run.store.columns(), started, depth=device.depth,
+                    duration=device.duration, device=device.device_id, source=f"campaign:{job['campaign']}/job{job['id']}",
+                    time_axis=run.store.time_axis)
+                job['session'] = archived['id']
+        else:
+            job['error'] = str(session.error)
+            if job['runs'] < self.max_runs:
+                job['state'] = QUEUED
+                job['due'] = job['finished'] + self.retry_delay
+            else:
+                job['state'] = FAILED
+
+
+def _percentiles(values):
+    if not values:
+        return "-"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50 {p50:.1f} s, p95 {p95:.1f} s, max {max(values):.1f} s"
+
+
+def metrics(queue):
+    """Summary lines: job states, queue wait and run time, busy share per probe"""
+    jobs = queue.jobs
+    states = {}
+    for job in jobs:
+        states[job['state']] = states.get(job['state'], 0) + 1
+    finished = [job for job in jobs if job['finished'] is not None]
+    lines = [
+        "jobs: " + (", ".join(f"{state} {count}" for state, count in sorted(states.items())) or "-"),
+        "queue wait: " + _percentiles([job['queue_wait'] for job in finished]),
+        "run time: " + _percentiles([job['run_time'] for job in finished]),
+        f"missed rounds: {sum(campaign['missed'] for campaign in queue.campaigns)}",
+    ]
+    if finished:
+        # Share of the scheduler's active span each probe spent running tests
+        start = min(job['started'] for job in finished)
+        span = max(job['finished'] for job in finished) - start
+        busy = {}
+        for job in finished:
+            busy[job['device']] = busy.get(job['device'], 0.0) + job['run_time']
+        for device_id, seconds in sorted(busy.items()):
+            share = seconds / span if span > 0 else 1.0
+            lines.append(f"{device_id}: {seconds:.1f} s busy ({share:.0%})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduled depth-profiling campaigns")
+    parser.add_argument('queue', help="JSON file holding campaigns and jobs")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="add a campaign")
+    add.add_argument('name')
+    add.add_argument('--device', action='append', required=True,
+                     help="probe as [id=]host[:port]; repeat for several probes")
+    add.add_argument('--depths', type=int, nargs='+', required=True,
+                     help="depths of one round, in order")
+    add.add_argument('--duration', type=int, required=True)
+    add.add_argument('--save', action='store_true', help="let the probe save to its SD card")
+    add.add_argument('--every', type=float, help="seconds between rounds")
+    add.add_argument('--rounds', type=int, default=1, help="number of rounds, 0 repeats forever")
+    run = commands.add_parser('run', help="run due jobs until none are left")
+    run.add_argument('--log-dir', default=LOG_DIR)
+    run.add_argument('--archive', help="archive directory finished jobs are added to")
+    run.add_argument('--per-device', type=int, default=PER_DEVICE)
+    run.add_argument('--max-jobs', type=int, default=MAX_JOBS)
+    run.add_argument('--max-runs', type=int, default=MAX_RUNS,
+                     help="runs of a failing job before it is given up")
+    run.add_argument('--retry-delay', type=float, default=RETRY_DELAY)
+    run.add_argument('--for', dest='run_for', type=float,
+                     help="stop starting jobs after this many seconds")
+    run.add_argument('--retries', type=int, default=5, help="connection attempts per run")
+    run.add_argument('--connect-timeout', type=float, default=5.0)
+    run.add_argument('--read-timeout', type=float, default=30.0)
+    commands.add_parser('status', help="print job states and timing metrics")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    if args.command == 'add':
+        try:
+            queue.add_campaign(args.name, args.device, args.depths, args.duration,
+                               every=args.every, rounds=args.rounds, save=args.save)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.command == 'run':
+        def on_job(job):
+            detail = f"{job['rows']} data" if job['state'] == DONE else job['error']
+            if job['state'] == DONE and job['error']:
+                detail += f", {job['error']}"
+            print(f"job {job['id']} {job['device']} depth {job['depth']}: {job['state']}, "
+                  f"wait {job['queue_wait']:.1f} s, run {job['run_time']:.1f} s, {detail}",
+                  file=sys.stderr, flush=True)
+
+        os.makedirs(args.log_dir, exist_ok=True)
+        scheduler = CampaignScheduler(
+            queue, args.log_dir, Archive(args.archive) if args.archive else None,
+            per_device=args.per_device, max_jobs=args.max_jobs, max_runs=args.max_runs,
+            retry_delay=args.retry_delay, on_job=on_job, max_attempts=args.retries,
+            connect_timeout=args.connect_timeout, read_timeout=args.read_timeout)
+        until = time.time() + args.run_for if args.run_for else None
+        signal.signal(signal.SIGTERM, _terminate)
+        try:
+            asyncio.run(scheduler.run(until))
+        except KeyboardInterrupt:
+            print("stopped", file=sys.stderr)
+        print('\n'.join(metrics(queue)))
+    else:
+        print('\n'.join(metrics(queue)))
+        for job in queue.jobs:
+            if job['state'] != DONE:
+                due = datetime.fromtimestamp(job['due']).isoformat(timespec='seconds')
+                print(f"{job['id']:>5} {job['campaign']:<12} {job['device']:<12} "
+                      f"depth {job['depth']:>4} {job['state']:<8} due {due} {job['error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
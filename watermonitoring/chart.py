@@ -0,0 +1,61 @@
+"""Plot-ready series of a ReadingStore, kept current as readings arrive
+
+ChartData turns store rows into per-parameter LOD pyramids of values and
+sampling intervals (in seconds) against seconds since the first reading.
+update() only converts the rows added since the previous call, so a live
+chart can follow a streaming test without re-reading the whole store.
+Over a RingStore the series are rebuilt from the rows it holds whenever
+they have grown to twice that, which keeps them bounded as well.
+"""
+
+from .lod import LODPyramid
+from .protocol import PARAMETERS, SAVE_BITS
+
+
+class ChartData:
+    """Incrementally updated value and interval pyramids per parameter"""
+
+    def __init__(self, store):
+        self.store = store
+        self.reset()
+
+    def reset(self):
+        """Forget all series, e.g. when a new test clears the store"""
+        self.values = {name: LODPyramid() for name, _, _, _ in PARAMETERS}
+        self.intervals = {name: LODPyramid() for name, _, _, _ in PARAMETERS}
+        self._restart(0)
+
+    def _restart(self, row):
+        """Empty the series in place and take rows from `row` on"""
+        for pyramid in (*self.values.values(), *self.intervals.values()):
+            pyramid.clear()
+        self._interval_sums = dict.fromkeys(self.values, 0.0)
+        # First and next row of the store in the series
+        self.start = self.rows = row
+
+    def update(self):
+        """Take in rows added to the store; returns True when there were any"""
+        rows = len(self.store)
+        if rows < self.rows:
+            self.reset()
+        first = self.store.first
+        if first > self.start and (first > self.rows or first - self.start >= rows - first):
+            self._restart(first)
+        if rows == self.rows:
+            return False
+        # The store's time axis is already decoded and unwrapped at ingest
+        seconds = self.store.time_axis.seconds(self.rows)
+        flags = self.store.column('flags', self.rows)
+        for name, _, value_key, interval_key in PARAMETERS:
+            valid = (flags & SAVE_BITS[name]) != 0
+            intervals = self.store.column(interval_key, self.rows)[valid] / 1000.0
+            self.values[name].extend(seconds[valid], self.store.column(value_key, self.rows)[valid])
+            self.intervals[name].extend(seconds[valid], intervals)
+            self._interval_sums[name] += float(intervals.sum())
+        self.rows = rows
+        return True
+
+    def mean_interval(self, name):
+        """Average sampling interval of a parameter in seconds, or None"""
+        count = len(self.intervals[name])
+        return self._interval_sums[name] / count if count else None
@@ -0,0 +1,207 @@
+"""Headless acquisition for unattended stations
+
+    python -m watermonitoring acquire --device probe1=192.168.1.100:80 --depth 5 --duration 10
+
+Runs tests without Tk or matplotlib. Readings of every device go to a
+crash-safe reading log (and optionally the archive) and to stdout, alerts
+and per-run summaries to stderr. With --every the tests are repeated on a
+fixed schedule until the process is interrupted or terminated. With
+--window a test can run for days: only the newest rows stay in memory
+(see RingStore), older ones are summarized per minute into a
+*_downsampled.csv next to the reading log, which keeps every row.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import signal
+import sys
+import time
+from datetime import datetime
+
+from .alerts import AlertEngine
+from .archive import Archive
+from .engine import DONE, AcquisitionEngine, Device
+from .health import HealthMonitor
+from .metrics import Capture, Metrics
+from .recordlog import RecordLogWriter
+from .store import DownsampledTier, ReadingStore, RingStore, format_rows
+
+# Default folders, shared with the GUI
+LOG_DIR = "log_data"
+
+OUTPUT_MODES = ('rows', 'summary', 'none')
+
+
+class DeviceRun:
+    """Store, reading log, alert rules and health of one device during one run"""
+
+    def __init__(self, device, started, log_dir, on_alert=None, name=None, window=None):
+        self.device = device
+        self.started = started
+        # File names default to the device id
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', name or device.device_id)
+        base = os.path.join(log_dir, f"{name}_{started.strftime('%Y%m%d_%H%M%S')}")
+        if window:
+            self.store = RingStore(window, DownsampledTier(path=base + '_downsampled.csv'))
+        else:
+            self.store = ReadingStore()
+        self.log = RecordLogWriter(base + '.wqlog')
+        # Why the reading log stopped, if it did; the readings still go on
+        self.log_error = None
+        self.alerts = AlertEngine(depth=device.depth, on_alert=on_alert,
+                                  log_path=base + '_alerts.csv')
+        self.health = HealthMonitor(device.device_id)
+
+    def add(self, columns):
+        elapsed = self.store.extend(columns)
+        if self.log_error is None:
+            try:
+                self.log.append(columns)
+            except OSError as e:
+                self.log_error = e
+        self.alerts.process(columns, elapsed)
+        self.health.process(columns, elapsed)
+
+    def close(self):
+        try:
+            self.log.close()
+        except OSError as e:
+            self.log_error = self.log_error or e
+        self.alerts.close()
+        if self.store.first:
+            self.store.tier.close()
+
+    def write_errors(self):
+        """(file, error) of every file of this run that could not be written"""
+        errors = [(self.log.path, self.log_error), (self.alerts.log_path, self.alerts.error)]
+        if self.store.first:
+            errors.append((self.store.tier.path, self.store.tier.error))
+        return [(path, error) for path, error in errors if error is not None]
+
+
+async def acquire(devices, log_dir, output='rows', archive=None, out=sys.stdout,
+                  err=sys.stderr, window=None, **session_options):
+    """Run one test on every device; returns the finished AcquisitionEngine
+
+    With `window` each device keeps only its newest `window` rows in memory.
+    """
+    started = datetime.now()
+    os.makedirs(log_dir, exist_ok=True)
+
+    def on_alert(alert):
+        print(f"ALERT {alert}", file=err, flush=True)
+
+    runs = {device.device_id: DeviceRun(device, started, log_dir, on_alert, window=window)
+            for device in devices}
+    engine = AcquisitionEngine(devices, **session_options)
+    try:
+        async for batch in engine.stream():
+            run = runs[batch.device_id]
+            run.add(batch.columns)
+            if output == 'rows':
+                # From the batch itself: a window smaller than the batch
+                # already holds only its newest rows
+                lines = [f"{batch.device_id};" + ';'.join(row) for row in format_rows(batch.columns)]
+                if lines:
+                    out.write('\n'.join(lines) + '\n')
+                    out.flush()
+            elif output == 'summary':
+                print(f"{batch.device_id}: +{len(batch)} data ({len(run.store)} total)",
+                      file=out, flush=True)
+    finally:
+        for run in runs.values():
+            run.close()
+
+    for device_id, session in engine.sessions.items():
+        run = runs[device_id]
+        state = session.state if session.state == DONE else f"{session.state}: {session.error}"
+        score, _ = run.health.score()
+        print(f"{device_id}: {session.totals.summary()}, {run.alerts.total} peringatan, "
+              f"kesehatan {score:.0f}/100, {state}",
+              file=err, flush=True)
+        for path, error in run.write_errors():
+            print(f"{device_id}: GAGAL menulis {path}: {error}", file=err, flush=True)
+        if archive is not None and session.state == DONE and run.store.first:
+            # The archive takes a session in one piece; the reading log has it
+            print(f"{device_id}: tidak diarsipkan, {run.store.first} data tertua hanya ada di "
+                  f"{run.log.path}", file=err, flush=True)
+        elif archive is not None and session.state == DONE and len(run.store):
+            device = run.device
+            archive.add_session(run.store.columns(), run.started, depth=device.depth,
+                                duration=device.duration, device=device_id,
+                                time_axis=run.store.time_axis)
+    return engine
+
+
+def _terminate(signum, frame):
+    # SIGTERM from a service manager unwinds like Ctrl-C so logs get closed
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m watermonitoring",
+                                     description="Headless water quality acquisition")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('acquire', help="run tests on one or more probes")
+    run.add_argument('--device', action='append', required=True,
+                     help="probe as [id=]host[:port]; repeat for several probes")
+    run.add_argument('--depth', type=int, required=True)
+    run.add_argument('--duration', type=int, required=True)
+    run.add_argument('--save', action='store_true', help="let the probe save to its SD card")
+    run.add_argument('--log-dir', default=LOG_DIR)
+    run.add_argument('--archive', help="archive directory finished tests are added to")
+    run.add_argument('--output', choices=OUTPUT_MODES, default='rows',
+                     help="what to print to stdout per batch (default: every row)")
+    run.add_argument('--every', type=float, help="repeat the tests every this many seconds")
+    run.add_argument('--window', type=int, metavar='ROWS',
+                     help="keep only the newest ROWS rows per device in memory, for long tests")
+    run.add_argument('--runs', type=int,
+                     help="number of runs (default 1, or unlimited with --every)")
+    run.add_argument('--retries', type=int, default=5, help="connection attempts per test")
+    run.add_argument('--connect-timeout', type=float, default=5.0)
+    run.add_argument('--read-timeout', type=float, default=30.0)
+    run.add_argument('--metrics', help="Prometheus text file rewritten after every run")
+    run.add_argument('--metrics-jsonl', help="file a metrics snapshot is appended to per run")
+    run.add_argument('--profile', metavar='BASE',
+                     help="profile the first run into BASE.prof and BASE_memory.txt")
+    args = parser.parse_args()
+
+    runs = args.runs if args.runs is not None else (0 if args.every else 1)
+    archive = Archive(args.archive) if args.archive else None
+    signal.signal(signal.SIGTERM, _terminate)
+
+    metrics = Metrics()
+    done = 0
+    failed = False
+    try:
+        while True:
+            # Fresh Device objects each run; they only describe the request
+            devices = [Device.parse(spec, depth=args.depth, duration=args.duration, save=args.save)
+                       for spec in args.device]
+            run_started = time.monotonic()
+            run = acquire(devices, args.log_dir, args.output, archive, window=args.window,
+                          max_attempts=args.retries, connect_timeout=args.connect_timeout,
+                          read_timeout=args.read_timeout, metrics=metrics)
+            if args.profile and not done:
+                with Capture(args.profile):
+                    engine = asyncio.run(run)
+            else:
+                engine = asyncio.run(run)
+            states = engine.states().values()
+            failed = any(state != DONE for state in states)
+            metrics.count('tests_total', len(states))
+            metrics.count('test_failures_total', sum(state != DONE for state in states))
+            if args.metrics:
+                metrics.write_prometheus(args.metrics)
+            if args.metrics_jsonl:
+                metrics.append_jsonl(args.metrics_jsonl, run=done)
+            done += 1
+            if runs and done >= runs:
+                break
+            if args.every:
+                time.sleep(max(0.0, run_started + args.every - time.monotonic()))
+    except KeyboardInterrupt:
+        print("stopped", file=sys.stderr)
+    sys.exit(1 if failed else 0)
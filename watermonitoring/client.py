@@ -0,0 +1,226 @@
+"""Request packing and streaming response reading for the ESP32 link"""
+
+import socket
+import struct
+import time
+
+from .metrics import ReceiveMeter
+from .parser import BINARY_RECORD, parse_binary, parse_buffer, summarize
+from .protocol import BINARY_MAGIC, PROTOCOL_BINARY, PROTOCOL_TEXT, RECORD_TOKENS
+
+# Lines collected before a batch is parsed and handed on
+BATCH_LINES = 256
+# Longest time (s) a received line waits before its batch is flushed
+FLUSH_INTERVAL = 0.2
+# Largest read while receiving binary records
+BINARY_READ_SIZE = 64 * 1024
+
+
+def build_request(depth, duration, save, version=PROTOCOL_TEXT):
+    """Pack the ABC + depth + duration + save request header
+
+    A version byte is appended only for non-text modes, so text requests
+    stay identical to what existing firmware expects.
+    """
+    # Create byte array with signature and data
+    data = bytearray()
+
+    # Add signature "ABC" (3 bytes)
+    data.extend(b'ABC')
+
+    # Add depth as integer (4 bytes)
+    data.extend(struct.pack('i', int(depth)))
+
+    # Add duration as integer (4 bytes)
+    data.extend(struct.pack('i', int(duration)))
+
+    # Add save status (1 byte)
+    data.extend(struct.pack('B', 1 if save else 0))
+
+    # Ask for another response format (1 byte)
+    if version != PROTOCOL_TEXT:
+        data.extend(struct.pack('B', version))
+    return bytes(data)
+
+
+def is_finished(line):
+    """True if the line carries the sd_card_finished flag"""
+    # Last token is the sd_card_finished flag
+    return ';' in line and line.rsplit(';', 1)[-1] == '1'
+
+
+class StreamTotals:
+    """Running counts of a streamed response"""
+
+    def __init__(self):
+        self.records = 0
+        self.short_lines = 0
+        self.bad_lines = 0
+        self.batches = 0
+        self.finished = False
+
+    @property
+    def malformed(self):
+        return self.short_lines + self.bad_lines
+
+    @property
+    def lines(self):
+        """Record lines received, malformed ones included"""
+        return self.records + self.malformed
+
+    def add(self, result):
+        self.records += len(result)
+        self.short_lines += result.short_lines
+        self.bad_lines += result.bad_lines
+        self.batches += 1
+
+    def summary(self):
+        return summarize(self.records, self.malformed)
+
+
+def read_records(sock_file, on_batch, batch_lines=BATCH_LINES, flush_interval=FLUSH_INTERVAL,
+                 metrics=None):
+    """Parse lines from `sock_file` in small batches as they arrive
+
+    Every parsed batch is passed to `on_batch(result)` right away, so only
+    the current batch of raw lines is ever held in memory. Reading stops at
+    the `;1` finished flag or when the peer closes the connection; a last
+    line cut off by the close is dropped, so every line counted in the
+    totals arrived whole. Bytes, records and parse times are counted into
+    `metrics` when given.
+    """
+    totals = StreamTotals()
+    batch = []
+    last_flush = time.monotonic()
+    meter = ReceiveMeter(metrics) if metrics is not None else None
+    received = 0
+
+    def flush():
+        nonlocal received
+        result = parse_buffer(batch)
+        batch.clear()
+        totals.add(result)
+        if meter is not None:
+            meter.batch(received, result)
+            received = 0
+        on_batch(result)
+
+    while not totals.finished:
+        raw = sock_file.readline()
+        received += len(raw)
+        line = raw.strip()
+        if isinstance(line, bytes):
+            line = line.decode('ascii', errors='replace')
+        if not line:
+            break
+
+        # Check if this is the last line
+        finished = is_finished(line)
+        if raw[-1:] not in (b'\n', '\n') and not (
+                finished and line.count(';') == RECORD_TOKENS - 1):
+            # Torn by a dropped connection
+            break
+        totals.finished = finished
+        batch.append(line)
+
+        now = time.monotonic()
+        if len(batch) >= batch_lines or now - last_flush >= flush_interval:
+            flush()
+            last_flush = now
+
+    if batch:
+        flush()
+    return totals
+
+
+def read_binary_records(sock_file, on_batch, read_size=BINARY_READ_SIZE, metrics=None):
+    """Decode fixed-size binary records as they arrive
+
+    Whatever whole records are available after each read are decoded in one
+    np.frombuffer call and passed to `on_batch(result)`.
+    """
+    totals = StreamTotals()
+    size = BINARY_RECORD.itemsize
+    pending = bytearray()
+    meter = ReceiveMeter(metrics) if metrics is not None else None
+    received = 0
+    while not totals.finished:
+        chunk = sock_file.read1(read_size)
+        if not chunk:
+            break
+        pending += chunk
+        received += len(chunk)
+        usable = len(pending) - len(pending) % size
+        if not usable:
+            continue
+        result = parse_binary(bytes(pending[:usable]))
+        del pending[:usable]
+        totals.finished = result.finished
+        totals.add(result)
+        if meter is not None:
+            meter.batch(received, result)
+            received = 0
+        on_batch(result)
+    return totals
+
+
+class _PushbackReader:
+    """readline() over bytes already consumed followed by the rest of a file"""
+
+    def __init__(self, prefix, raw):
+        self.prefix = prefix
+        self.raw = raw
+
+    def readline(self):
+        if not self.prefix:
+            return self.raw.readline()
+        line, newline, rest = self.prefix.partition(b'\n')
+        self.prefix = rest
+        if newline:
+            return line + newline
+        return line + self.raw.readline()
+
+
+def request_test(host, port, depth, duration, save, on_batch, timeout=30, binary=False,
+                 metrics=None):
+    """Send one test request to a probe and stream its reply into `on_batch`
+
+    With `binary` the device is asked for binary records; a device that
+    answers without the BINARY_MAGIC preamble is read as text instead.
+    Connect time, time to first byte and the receive counts go to
+    `metrics` when given. Network failures propagate as socket exceptions;
+    returns StreamTotals.
+    """
+    version = PROTOCOL_BINARY if binary else PROTOCOL_TEXT
+    started = time.perf_counter()
+    # Timeout covers the connect and every wait for data
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        if metrics is not None:
+            metrics.observe('connect_seconds', time.perf_counter() - started)
+        # Send signature, depth, duration and save status
+        sock.sendall(build_request(depth, duration, save, version))
+        sent = time.perf_counter()
+
+        # Create file-like object for reading the response
+        with sock.makefile('rb') as sock_file:
+            return read_response(sock_file, on_batch, binary, metrics, sent)
+
+
+def read_response(sock_file, on_batch, binary=False, metrics=None, sent=None):
+    """Read one test response from a buffered socket file
+
+    `binary` tells whether binary records were asked for; the reply is read
+    as text when the BINARY_MAGIC preamble is missing. With `metrics` and
+    `sent` (perf_counter() when the request went out) the time to first
+    byte is recorded.
+    """
+    if metrics is not None and sent is not None:
+        # Blocks until the first byte is buffered without consuming it
+        sock_file.peek(1)
+        metrics.observe('ttfb_seconds', time.perf_counter() - sent)
+    if binary:
+        preamble = sock_file.read(len(BINARY_MAGIC) + 1)
+        if preamble == BINARY_MAGIC + bytes([PROTOCOL_BINARY]):
+            return read_binary_records(sock_file, on_batch, metrics=metrics)
+        sock_file = _PushbackReader(preamble, sock_file)
+    return read_records(sock_file, on_batch, metrics=metrics)
@@ -0,0 +1,244 @@
+"""asyncio acquisition engine driving many ESP32 probes at once"""
+
+import asyncio
+import random
+import time
+
+from .client import BATCH_LINES, FLUSH_INTERVAL, StreamTotals, build_request, is_finished
+from .metrics import ReceiveMeter
+from .parser import ParseResult, parse_buffer
+from .protocol import RECORD_TOKENS
+
+# Device session states
+IDLE = 'idle'
+CONNECTING = 'connecting'
+RECEIVING = 'receiving'
+BACKOFF = 'backoff'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Device:
+    """One probe: where it is reachable and which test it should run"""
+
+    def __init__(self, device_id, host, port=80, depth=0, duration=1, save=False):
+        self.device_id = device_id
+        self.host = host
+        self.port = int(port)
+        self.depth = int(depth)
+        self.duration = int(duration)
+        self.save = bool(save)
+
+    def __repr__(self):
+        return f"Device({self.device_id!r}, {self.host}:{self.port}, depth={self.depth})"
+
+    @classmethod
+    def parse(cls, spec, **test):
+        """Build a device from `id=host:port` (id and port are optional)"""
+        device_id, _, address = spec.rpartition('=')
+        host, _, port = address.partition(':')
+        return cls(device_id or address, host, port or 80, **test)
+
+
+class TaggedBatch:
+    """Parsed readings of one batch, tagged with the probe that sent them
+
+    `attempt` is the attempt of the session the rows came from, 1 unless
+    the connection broke and the test was run again.
+    """
+
+    def __init__(self, device_id, depth, result, attempt=1):
+        self.device_id = device_id
+        self.depth = depth
+        self.result = result
+        self.attempt = attempt
+
+    @property
+    def columns(self):
+        return self.result.columns
+
+    def __len__(self):
+        return len(self.result)
+
+
+class DeviceSession:
+    """State machine running one test on one device with reconnects
+
+    Every batch goes to the output as soon as it is parsed. A retry asks the
+    probe for the whole test again; its first rows, as many as earlier
+    attempts delivered, are dropped, so the output continues from the last
+    row received and holds every row of the test once. `totals` counts the
+    rows delivered.
+    """
+
+    def __init__(self, device, output, connect_timeout=5.0, read_timeout=30.0,
+                 max_attempts=5, backoff_base=0.5, backoff_max=30.0, metrics=None):
+        self.device = device
+        self.output = output
+        # Shared Metrics of the engine, or None
+        self.metrics = metrics
+        self._meter = None
+        self._received = 0
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.state = IDLE
+        self.attempts = 0
+        self.error = None
+        self.totals = StreamTotals()
+        # Rows delivered over all attempts, and rows parsed in the current one
+        self._delivered = 0
+        self._attempt_rows = 0
+
+    def backoff_delay(self):
+        """Exponential backoff with full jitter for the current attempt"""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** (self.attempts - 1))
+        return random.uniform(0, ceiling)
+
+    async def run(self):
+        while self.attempts < self.max_attempts:
+            self.attempts += 1
+            try:
+                await self._attempt()
+                self.state = DONE
+                return
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.error = e
+            if self.attempts < self.max_attempts:
+                self.state = BACKOFF
+                await asyncio.sleep(self.backoff_delay())
+        self.state = FAILED
+
+    async def _attempt(self):
+        device = self.device
+        self.state = CONNECTING
+        self._meter = None
+        self._attempt_rows = 0
+        started = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(device.host, device.port), self.connect_timeout)
+        if self.metrics is not None:
+            self.metrics.observe('connect_seconds', time.perf_counter() - started)
+        try:
+            writer.write(build_request(device.depth, device.duration, device.save))
+            await writer.drain()
+            self.state = RECEIVING
+            await self._receive(reader)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _receive(self, reader):
+        batch = []
+        last_flush = time.monotonic()
+        finished = False
+        sent = time.perf_counter()
+        try:
+            while not finished:
+                try:
+                    raw = await asyncio.wait_for(reader.readline(), self.read_timeout)
+                except (asyncio.LimitOverrunError, ValueError):
+                    # A line past the stream limit is garbage, like a torn one
+                    raise ConnectionResetError("line longer than the stream limit") from None
+                if self.metrics is not None:
+                    if self._meter is None:
+                        # StreamReader has no peek, the first line stands in for the first byte
+                        self.metrics.observe('ttfb_seconds', time.perf_counter() - sent)
+                        self._meter = ReceiveMeter(self.metrics)
+                    self._received += len(raw)
+                if not raw:
+                    # Peer closed before the finished flag, retry the test
+                    raise ConnectionResetError("connection closed before finished flag")
+                line = raw.decode('ascii', errors='replace').strip()
+                if not line:
+                    continue
+                finished = is_finished(line)
+                if not raw.endswith(b'\n') and not (finished and line.count(';') == RECORD_TOKENS - 1):
+                    # Torn by a dropped connection; a cut-off save flag can look like the finished flag
+                    raise ConnectionResetError("connection closed inside a line")
+                batch.append(line)
+                now = time.monotonic()
+                if len(batch) >= BATCH_LINES or now - last_flush >= FLUSH_INTERVAL:
+                    await self._flush(batch)
+                    last_flush = now
+        except (OSError, asyncio.TimeoutError):
+            # Lines that arrived whole are delivered; a retry continues after them
+            if batch:
+                await self._flush(batch)
+            raise
+        if batch:
+            await self._flush(batch)
+        self.totals.finished = finished
+
+    async def _flush(self, batch):
+        result = parse_buffer(batch)
+        batch.clear()
+        if self._meter is not None:
+            self._meter.batch(self._received, result)
+            self._received = 0
+        # Rows of a retry that an earlier attempt already delivered
+        skip = self._delivered - self._attempt_rows
+        self._attempt_rows += len(result)
+        if skip > 0:
+            if skip >= len(result):
+                return
+            result = ParseResult({name: column[skip:] for name, column in result.columns.items()},
+                                 result.short_lines, result.bad_lines, result.elapsed)
+        self._delivered += len(result)
+        self.totals.add(result)
+        await self.output.put(TaggedBatch(self.device.device_id, self.device.depth, result,
+                                          self.attempts))
+
+
+class AcquisitionEngine:
+    """Run tests on many devices concurrently and merge their readings
+
+    Iterate `stream()` to receive TaggedBatch objects from all devices in
+    arrival order; it ends when every session is done or failed.
+    """
+
+    def __init__(self, devices, queue_size=1024, **session_options):
+        self.output = asyncio.Queue(queue_size)
+        self.sessions = {device.device_id: DeviceSession(device, self.output, **session_options)
+                         for device in devices}
+
+    def states(self):
+        return {device_id: session.state for device_id, session in self.sessions.items()}
+
+    async def stream(self):
+        tasks = [asyncio.create_task(session.run()) for session in self.sessions.values()]
+        pending = set(tasks)
+        getter = None
+        try:
+            while pending or not self.output.empty():
+                if not self.output.empty():
+                    yield self.output.get_nowait()
+                    continue
+                getter = asyncio.ensure_future(self.output.get())
+                done, _ = await asyncio.wait(pending | {getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                else:
+                    getter.cancel()
+                getter = None
+                pending = {task for task in pending if not task.done()}
+        finally:
+            if getter is not None:
+                getter.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def acquire_all(devices, on_batch=None, **session_options):
+    """Run `devices` to completion, returning the engine for its totals"""
+    engine = AcquisitionEngine(devices, **session_options)
+    async for batch in engine.stream():
+        if on_batch is not None:
+            on_batch(batch)
+    return engine
@@ -0,0 +1,42 @@
+"""Exceptions raised by the connections to a probe
+
+All derive from ProbeError, so callers can catch one type and show its
+message. The underlying socket error is kept as __cause__.
+"""
+
+import socket
+
+
+class ProbeError(Exception):
+    """A probe could not be reached or did not answer as expected"""
+
+
+class ProbeUnreachable(ProbeError):
+    """The connection was refused or could not be opened"""
+
+
+class ProbeTimeout(ProbeError):
+    """Connecting or waiting for the reply took longer than the timeout"""
+
+
+class ProbeDisconnected(ProbeError):
+    """The connection broke or the reply ended early"""
+
+
+class ProtocolError(ProbeError):
+    """The probe answered with something that does not fit the protocol"""
+
+
+class SessionUnsupported(ProbeError):
+    """The command needs firmware with keep-alive sessions"""
+
+
+def probe_error(error, address, connecting=False):
+    """Typed ProbeError for a socket exception raised while talking to `address`"""
+    if isinstance(error, socket.timeout):
+        return ProbeTimeout(f"{address}: ESP32 response timeout")
+    if isinstance(error, ConnectionRefusedError):
+        return ProbeUnreachable(f"{address}: Connection refused (ESP32 offline?)")
+    if connecting:
+        return ProbeUnreachable(f"{address}: {error}")
+    return ProbeDisconnected(f"{address}: {error}")
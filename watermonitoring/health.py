@@ -0,0 +1,313 @@
+"""Sampling and power health of a probe, updated batch by batch
+
+HealthMonitor.process() takes the same parsed batches as AlertEngine and
+keeps, for every sensor parameter:
+
+    valid ratio   rows with the save flag set, of all rows
+    jitter        reported interval minus the nominal interval, counted in
+                  a histogram of JITTER_BIN_MS bins that percentiles are
+                  read from
+    drift         exponentially weighted mean interval relative to nominal
+
+and for the probe as a whole the gaps in the row stream (steps longer than
+GAP_FACTOR nominal steps, and the rows they lost) and the power drawn.
+Nominal intervals and the nominal row step are the medians of the first
+NOMINAL_SAMPLES values. The probe reports one current and voltage for all
+sensors, so the draw of a sensor is estimated as the mean power of rows in
+which it took a reading minus that of rows in which it did not.
+
+score() folds the parts into a 0-100 health score and lists the penalty of
+each, so a probe with a dying sensor, a drifting clock or a weak battery
+stands out before it is sent on a deployment. All state is O(1) per
+parameter and every batch is evaluated with NumPy.
+
+    python -m watermonitoring.health log_data/probe1_20240101_120000.wqlog
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from .alerts import THRESHOLDS, _ewm
+from .protocol import PARAMETERS, SAVE_BITS, TIME_INVALID
+from .store import RunningStats
+from .timeaxis import TimeAxis
+
+# Values whose median becomes the nominal interval or row step
+NOMINAL_SAMPLES = 100
+
+# Bin width and half range of the jitter histogram (ms); bins are centred
+# on multiples of the width, so no jitter reads as 0, and larger
+# deviations are counted in the end bins
+JITTER_BIN_MS = 5
+JITTER_RANGE_MS = 1000
+_BINS = 2 * JITTER_RANGE_MS // JITTER_BIN_MS + 1
+
+# A step between rows longer than this many nominal steps is a gap
+GAP_FACTOR = 1.5
+
+# Weight of the newest interval in the mean the drift is measured on
+DRIFT_ALPHA = 0.01
+
+# Penalty per part of the score as (weight, level at which all of it applies)
+PENALTIES = {
+    'valid': (40, 1.0),    # share of rows without a valid reading, worst sensor
+    'jitter': (20, 0.10),  # 95th percentile |jitter| / nominal interval, worst sensor
+    'gaps': (20, 0.05),    # share of rows lost in gaps
+    'drift': (10, 0.10),   # |drift| / nominal interval, worst sensor
+    'power': (10, 0.10),   # share of rows outside the current and voltage limits
+}
+
+PENALTY_LABELS = {
+    'valid': "data tidak valid",
+    'jitter': "jitter interval",
+    'gaps': "celah data",
+    'drift': "drift interval",
+    'power': "arus/tegangan di luar batas",
+}
+
+# Lowest score of each status
+STATUS = ((80, "baik"), (50, "perlu dicek"), (0, "buruk"))
+
+
+def _median_after_warmup(pending, values):
+    """(nominal or None, values to use, new pending) once NOMINAL_SAMPLES are seen"""
+    values = np.concatenate((pending, values))
+    if len(values) < NOMINAL_SAMPLES:
+        return None, None, values
+    return float(np.median(values[:NOMINAL_SAMPLES])), values, np.empty(0)
+
+
+class SensorHealth:
+    """Validity, interval jitter and drift and power of one sensor"""
+
+    def __init__(self):
+        self.rows = 0
+        self.valid = 0
+        # Nominal interval (ms), None until NOMINAL_SAMPLES were seen
+        self.nominal = None
+        # Reported intervals in seconds
+        self.intervals = RunningStats()
+        self.histogram = np.zeros(_BINS, dtype=np.int64)
+        # Exponentially weighted mean interval (ms)
+        self.recent_interval = None
+        # Probe power (W) of rows with and without a reading of this sensor
+        self.power_on = RunningStats()
+        self.power_off = RunningStats()
+        self._pending = np.empty(0)
+
+    @property
+    def valid_ratio(self):
+        return self.valid / self.rows if self.rows else None
+
+    @property
+    def drift(self):
+        """Recent mean interval relative to nominal, e.g. 0.05 for 5 % slower"""
+        if not self.nominal or self.recent_interval is None:
+            return None
+        return (self.recent_interval - self.nominal) / self.nominal
+
+    @property
+    def power_draw(self):
+        """Estimated extra power (W) of rows in which the sensor reads"""
+        if not self.power_on.count or not self.power_off.count:
+            return None
+        return self.power_on.mean - self.power_off.mean
+
+    def jitter_percentiles(self, quantiles=(0.05, 0.5, 0.95)):
+        """{quantile: jitter ms} read from the histogram (bin centres)"""
+        total = self.histogram.sum()
+        if not total:
+            return None
+        cumulative = np.cumsum(self.histogram)
+        bins = np.searchsorted(cumulative, np.array(quantiles) * total)
+        values = -JITTER_RANGE_MS + np.minimum(bins, _BINS - 1) * JITTER_BIN_MS
+        return dict(zip(quantiles, values.tolist()))
+
+    def add(self, rows, intervals, power_on, power_off):
+        """Count `rows` rows, of which `intervals` (ms) are the valid readings"""
+        self.rows += rows
+        self.valid += len(intervals)
+        self.intervals.add_many(intervals / 1000.0)
+        self.power_on.add_many(power_on)
+        self.power_off.add_many(power_off)
+        if self.nominal is None:
+            self.nominal, intervals, self._pending = _median_after_warmup(self._pending, intervals)
+            if self.nominal is None:
+                return
+        if not len(intervals):
+            return
+        jitter = intervals - self.nominal
+        bins = np.clip(np.rint((jitter + JITTER_RANGE_MS) / JITTER_BIN_MS), 0, _BINS - 1).astype(np.int64)
+        self.histogram += np.bincount(bins, minlength=_BINS)
+        start = self.nominal if self.recent_interval is None else self.recent_interval
+        self.recent_interval = float(_ewm(intervals, DRIFT_ALPHA, start)[-1])
+
+
+class HealthMonitor:
+    """Health of one probe, updated from every parsed batch"""
+
+    def __init__(self, device=None):
+        self.device = device
+        self.rows = 0
+        self.sensors = {name: SensorHealth() for name, _, _, _ in PARAMETERS}
+        # Nominal step between rows (ms), None until NOMINAL_SAMPLES were seen
+        self.step = None
+        self.gaps = 0
+        # Rows estimated missing in the gaps
+        self.lost = 0
+        self.longest_gap = 0
+        self.power = RunningStats()
+        self.voltage = RunningStats()
+        self.current = RunningStats()
+        self.out_of_limits = 0
+        self._last = None
+        self._pending = np.empty(0)
+        self._time_axis = TimeAxis()
+
+    def process(self, columns, elapsed=None):
+        """Fold in a batch; `elapsed` is its unwrapped TimeAxis time if known"""
+        count = len(columns['time_ms'])
+        if count == 0:
+            return
+        if elapsed is None:
+            self._time_axis.extend(columns['time_ms'])
+            elapsed = self._time_axis.elapsed()[-count:]
+        flags = np.asarray(columns['flags'])
+        current = np.asarray(columns['current'], dtype=np.float64)
+        voltage = np.asarray(columns['voltage'], dtype=np.float64)
+        power = current * voltage
+        self.rows += count
+        self.power.add_many(power)
+        self.voltage.add_many(voltage)
+        self.current.add_many(current)
+        low, high = THRESHOLDS['voltage'][0], THRESHOLDS['current'][1]
+        self.out_of_limits += int(np.count_nonzero((voltage < low) | (current > high)))
+        for name, _, _, interval_key in PARAMETERS:
+            valid = (flags & SAVE_BITS[name]) != 0
+            intervals = np.asarray(columns[interval_key], dtype=np.float64)[valid]
+            self.sensors[name].add(count, intervals, power[valid], power[~valid])
+        elapsed = np.asarray(elapsed, dtype=np.int64)
+        self._add_times(elapsed[elapsed != TIME_INVALID])
+
+    def _add_times(self, times):
+        if not len(times):
+            return
+        previous = times[:1] if self._last is None else [self._last]
+        steps = np.diff(np.concatenate((previous, times))).astype(np.float64)
+        self._last = int(times[-1])
+        # Held stamps (see TimeAxis) are no step at all
+        steps = steps[steps > 0]
+        if self.step is None:
+            self.step, steps, self._pending = _median_after_warmup(self._pending, steps)
+            if self.step is None:
+                return
+        gaps = steps[steps > GAP_FACTOR * self.step]
+        if len(gaps):
+            self.gaps += len(gaps)
+            self.lost += int(np.rint(gaps / self.step).sum()) - len(gaps)
+            self.longest_gap = max(self.longest_gap, int(gaps.max()))
+
+    def levels(self):
+        """Measured level of every score part, before weighting"""
+        sensors = [sensor for sensor in self.sensors.values() if sensor.rows]
+        jitter = []
+        drift = []
+        for sensor in sensors:
+            percentiles = sensor.jitter_percentiles((0.05, 0.95))
+            if percentiles and sensor.nominal:
+                jitter.append(max(abs(value) for value in percentiles.values()) / sensor.nominal)
+            if sensor.drift is not None:
+                drift.append(abs(sensor.drift))
+        return {
+            'valid': 1 - min(sensor.valid_ratio for sensor in sensors) if sensors else 0.0,
+            'jitter': max(jitter, default=0.0),
+            'gaps': self.lost / (self.rows + self.lost) if self.rows else 0.0,
+            'drift': max(drift, default=0.0),
+            'power': self.out_of_limits / self.rows if self.rows else 0.0,
+        }
+
+    def score(self):
+        """(0-100 score, {part: penalty})"""
+        penalties = {}
+        for part, level in self.levels().items():
+            weight, full = PENALTIES[part]
+            penalties[part] = weight * min(1.0, level / full)
+        return max(0.0, 100 - sum(penalties.values())), penalties
+
+    def status(self):
+        score, _ = self.score()
+        return next(label for lowest, label in STATUS if score >= lowest)
+
+    def summary(self):
+        """Short Indonesian text for the UI"""
+        if not self.rows:
+            return "Kesehatan probe: belum ada data"
+        score, penalties = self.score()
+        text = f"Kesehatan probe: {score:.0f}/100 ({self.status()})"
+        worst = sorted((penalty, part) for part, penalty in penalties.items() if penalty >= 1)
+        if worst:
+            text += "; " + ", ".join(f"{PENALTY_LABELS[part]} -{penalty:.0f}"
+                                     for penalty, part in reversed(worst[-2:]))
+        return text
+
+    def report(self):
+        """JSON-ready details of every part"""
+        score, penalties = self.score()
+        sensors = {}
+        for name, sensor in self.sensors.items():
+            percentiles = sensor.jitter_percentiles()
+            sensors[name] = {
+                'valid_ratio': sensor.valid_ratio,
+                'nominal_interval_ms': sensor.nominal,
+                'mean_interval_s': sensor.intervals.mean if sensor.intervals.count else None,
+                'jitter_ms': ({f"p{int(q * 100)}": value for q, value in percentiles.items()}
+                              if percentiles else None),
+                'drift': sensor.drift,
+                'power_draw_w': sensor.power_draw,
+            }
+        return {
+            'device': self.device,
+            'score': score,
+            'status': self.status(),
+            'penalties': penalties,
+            'rows': self.rows,
+            'row_step_ms': self.step,
+            'gaps': self.gaps,
+            'lost_rows': self.lost,
+            'longest_gap_ms': self.longest_gap,
+            'power_w': self.power.mean if self.power.count else None,
+            'voltage_min': self.voltage.min,
+            'current_max': self.current.max,
+            'sensors': sensors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Health score of the probes that wrote reading logs")
+    parser.add_argument('logs', nargs='+', help="reading logs (.wqlog) or save_data CSV files")
+    parser.add_argument('--json', action='store_true', help="print the full reports as JSON")
+    args = parser.parse_args()
+
+    from .archive import read_csv
+    from .recordlog import iter_chunks
+
+    reports = []
+    for path in args.logs:
+        monitor = HealthMonitor(path)
+        if path.endswith('.csv'):
+            monitor.process(read_csv(path))
+        else:
+            for _, columns in iter_chunks(path):
+                monitor.process(columns)
+        if args.json:
+            reports.append(monitor.report())
+        else:
+            print(f"{path}: {monitor.summary()}")
+    if args.json:
+        print(json.dumps(reports, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Level-of-detail min/max pyramids for plotting long series
+
+Level 0 is the raw series. Level k keeps, for every bucket of 2**k raw
+points, the smallest and the largest point in their original order, so
+peaks and dips survive at every zoom level. Points can be appended at any
+time; each append only builds the buckets it completes, so keeping the
+pyramid current costs O(new points).
+"""
+
+import numpy as np
+
+# A new level is added once the top level has this many buckets twice over
+MIN_BUCKETS = 64
+
+
+class _Buffer:
+    """Growable float64 array"""
+
+    def __init__(self, capacity=1024):
+        self._data = np.empty(capacity)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._size = 0
+
+    def extend(self, values):
+        end = self._size + len(values)
+        if end > len(self._data):
+            grown = np.empty(max(end, 2 * len(self._data)))
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:end] = values
+        self._size = end
+
+    def view(self):
+        return self._data[:self._size]
+
+
+class _Level:
+    """Complete buckets of one pyramid level"""
+
+    def __init__(self, size):
+        self.size = size
+        self.xmin, self.ymin, self.xmax, self.ymax = _Buffer(), _Buffer(), _Buffer(), _Buffer()
+        # Bucket minima and maxima interleaved in x order, ready to plot
+        self.x, self.y = _Buffer(), _Buffer()
+
+    def __len__(self):
+        return len(self.xmin)
+
+    def append(self, xmin, ymin, xmax, ymax):
+        self.xmin.extend(xmin)
+        self.ymin.extend(ymin)
+        self.xmax.extend(xmax)
+        self.ymax.extend(ymax)
+        x, y = _interleave(xmin, ymin, xmax, ymax)
+        self.x.extend(x)
+        self.y.extend(y)
+
+
+class LODPyramid:
+    """Appendable min/max pyramid over a series with non-decreasing x"""
+
+    def __init__(self, x=(), y=()):
+        self.raw_x, self.raw_y = _Buffer(), _Buffer()
+        self.levels = []
+        self.extend(x, y)
+
+    def __len__(self):
+        return len(self.raw_x)
+
+    def clear(self):
+        """Drop all points but keep the raw buffers"""
+        self.raw_x.clear()
+        self.raw_y.clear()
+        self.levels = []
+
+    def extend(self, x, y):
+        """Append points and complete whatever buckets they fill"""
+        self.raw_x.extend(np.asarray(x, dtype=np.float64))
+        self.raw_y.extend(np.asarray(y, dtype=np.float64))
+        below = (self.raw_x.view(), self.raw_y.view(), self.raw_x.view(), self.raw_y.view())
+        for level in self.levels:
+            self._complete(level, below)
+            below = (level.xmin.view(), level.ymin.view(), level.xmax.view(), level.ymax.view())
+        while len(below[0]) >= 2 * MIN_BUCKETS:
+            level = _Level(2 ** (len(self.levels) + 1))
+            self.levels.append(level)
+            self._complete(level, below)
+            below = (level.xmin.view(), level.ymin.view(), level.xmax.view(), level.ymax.view())
+
+    @staticmethod
+    def _complete(level, below):
+        """Build the buckets of `level` made of whole pairs of buckets `below`"""
+        done = len(level)
+        target = len(below[0]) // 2
+        if target > done:
+            pairs = slice(2 * done, 2 * target)
+            level.append(*_merge_pairs(*(a[pairs] for a in below)))
+
+    def fetch(self, x0=None, x1=None, max_points=2000):
+        """Points within [x0, x1], from the finest level that fits `max_points`
+
+        One point on each side of the range is included so lines run to the
+        axes edges when zoomed in. Raw points not yet in a complete bucket
+        are summarised by their own minimum and maximum.
+        """
+        raw_x, raw_y = self.raw_x.view(), self.raw_y.view()
+        candidates = [(raw_x, raw_y, len(raw_x))]
+        candidates += [(level.x.view(), level.y.view(), len(level) * level.size)
+                       for level in self.levels]
+        for i, (x, y, covered) in enumerate(candidates):
+            tail_x, tail_y = _tail(raw_x[covered:], raw_y[covered:])
+            x = np.concatenate((x, tail_x)) if len(tail_x) else x
+            y = np.concatenate((y, tail_y)) if len(tail_y) else y
+            lo = 0 if x0 is None else max(np.searchsorted(x, x0, 'left') - 1, 0)
+            hi = len(x) if x1 is None else min(np.searchsorted(x, x1, 'right') + 1, len(x))
+            if hi - lo <= max_points or i == len(candidates) - 1:
+                return x[lo:hi], y[lo:hi]
+
+
+def _merge_pairs(xmin, ymin, xmax, ymax):
+    """Combine neighbouring buckets (0 with 1, 2 with 3, ...)"""
+    a, b = slice(0, None, 2), slice(1, None, 2)
+    take_a = ymin[a] <= ymin[b]
+    new_xmin = np.where(take_a, xmin[a], xmin[b])
+    new_ymin = np.where(take_a, ymin[a], ymin[b])
+    take_a = ymax[a] >= ymax[b]
+    new_xmax = np.where(take_a, xmax[a], xmax[b])
+    new_ymax = np.where(take_a, ymax[a], ymax[b])
+    return new_xmin, new_ymin, new_xmax, new_ymax
+
+
+def _interleave(xmin, ymin, xmax, ymax):
+    """Flatten bucket minima and maxima into one x-ordered series"""
+    min_first = xmin <= xmax
+    x = np.empty(2 * len(xmin))
+    y = np.empty(2 * len(xmin))
+    x[0::2] = np.where(min_first, xmin, xmax)
+    y[0::2] = np.where(min_first, ymin, ymax)
+    x[1::2] = np.where(min_first, xmax, xmin)
+    y[1::2] = np.where(min_first, ymax, ymin)
+    return x, y
+
+
+def _tail(x, y):
+    """Minimum and maximum point of a short unbucketed tail"""
+    if len(x) <= 2:
+        return x, y
+    i, j = sorted((int(np.argmin(y)), int(np.argmax(y))))
+    return x[[i, j]], y[[i, j]]
+
+
+def downsample(x, y, max_points):
+    """One-shot min/max downsampling of a series to about `max_points`"""
+    return LODPyramid(x, y).fetch(max_points=max_points)
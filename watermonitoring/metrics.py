@@ -0,0 +1,214 @@
+"""Run-time counters and timings of acquisition, parsing and rendering
+
+A Metrics object collects:
+
+    counters  totals that only grow, e.g. bytes received
+    gauges    the latest value, e.g. the receive rate of the running test
+    timings   durations; the recent TIMING_WINDOW samples give percentiles
+
+It is safe to update from the receive thread while the UI reads it. The
+state can be written as a Prometheus text file (for node_exporter's
+textfile collector) or appended to a JSONL file, one snapshot per line.
+"""
+
+import cProfile
+import json
+import math
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+# Samples per timing kept for percentiles
+TIMING_WINDOW = 1024
+
+# Prefix of every exported metric name
+PROMETHEUS_PREFIX = 'wq_'
+
+# Known metrics: kind and description
+METRICS = {
+    'connect_seconds': ('timing', "TCP connect time to the probe"),
+    'ttfb_seconds': ('timing', "Time from sending the request to the first response byte"),
+    'bytes_received_total': ('counter', "Response bytes received"),
+    'records_total': ('counter', "Records parsed from responses"),
+    'bytes_per_second': ('gauge', "Receive rate of the current or last response"),
+    'records_per_second': ('gauge', "Record rate of the current or last response"),
+    'parse_seconds': ('timing', "Parse time per batch"),
+    'dropped_lines_total': ('counter', "Lines dropped for having too few fields"),
+    'malformed_lines_total': ('counter', "Lines rejected for unparseable fields"),
+    'tk_loop_lag_seconds': ('timing', "Lateness of a periodic Tk event-loop probe"),
+    'render_seconds': ('timing', "Graph update and draw time"),
+    'ui_frame_seconds': ('timing', "Tk time of one UI bridge frame: coalesced ingest and widget update"),
+    'ui_backpressure_seconds': ('timing', "Time a receive thread waited for the UI to catch up"),
+    'ui_events_total': ('counter', "Events handed from worker threads to the Tk thread"),
+    'ui_queue_depth': ('gauge', "Data events still queued for the Tk thread after a frame"),
+    'connections_opened_total': ('counter', "Connections opened to probes"),
+    'connections_reused_total': ('counter', "Times the pool handed out an already open session"),
+    'reconnects_total': ('counter', "Sessions found dead and reopened for a command"),
+    'heartbeat_seconds': ('timing', "Round trip of a session heartbeat"),
+    'backlog_records_total': ('counter', "Stored records retrieved from probe logs"),
+    'backlog_duplicates_total': ('counter', "Stored records received again and dropped"),
+    'backlog_resumes_total': ('counter', "Stored-log transfers resumed after a broken link"),
+    'backlog_records_per_second': ('gauge', "Record rate of the current or last stored-log transfer"),
+    'tests_total': ('counter', "Tests started"),
+    'test_failures_total': ('counter', "Tests that ended with an error"),
+}
+
+# Quantiles reported for timings
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Allocation sites listed by a tracemalloc capture
+MEMORY_TOP = 30
+
+
+class _Timing:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=TIMING_WINDOW)
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self.recent)
+        summary = {'count': self.count, 'sum': self.sum, 'max': self.max}
+        for q in QUANTILES:
+            # Nearest rank: the smallest sample with at least q of them at or below it
+            summary[f'p{int(q * 100)}'] = (ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+                                           if ordered else 0.0)
+        return summary
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = _Timing()
+            timing.add(seconds)
+
+    def snapshot(self):
+        """Plain dict of the current values, timings summarised"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'timings': {name: timing.summary() for name, timing in self.timings.items()},
+            }
+
+    def to_prometheus(self):
+        """Prometheus text exposition format; timings become summaries"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def header(name, kind):
+            help_text = METRICS.get(name, (kind, name))[1]
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+
+        for name, value in sorted(snapshot['counters'].items()):
+            header(name, 'counter')
+            lines.append(f"{PROMETHEUS_PREFIX}{name} {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            header(name, 'gauge')
+            lines.append(f"{PROMETHEUS_PREFIX}{name} {value:.6g}")
+        for name, summary in sorted(snapshot['timings'].items()):
+            header(name, 'summary')
+            for q in QUANTILES:
+                value = summary[f'p{int(q * 100)}']
+                lines.append(f'{PROMETHEUS_PREFIX}{name}{{quantile="{q}"}} {value:.6g}')
+            lines.append(f"{PROMETHEUS_PREFIX}{name}_sum {summary['sum']:.6g}")
+            lines.append(f"{PROMETHEUS_PREFIX}{name}_count {summary['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Replace `path` atomically, as the textfile collector expects"""
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    def append_jsonl(self, path, **labels):
+        """Append one timestamped snapshot line, tagged with `labels`"""
+        record = {'time': datetime.now().isoformat(timespec='milliseconds'), **labels,
+                  **self.snapshot()}
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+class ReceiveMeter:
+    """Feeds the batches of one streamed response into Metrics"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.records = 0
+
+    def batch(self, received, result):
+        """Count `received` new bytes and the parsed batch `result`"""
+        metrics = self.metrics
+        self.bytes += received
+        self.records += len(result)
+        metrics.count('bytes_received_total', received)
+        metrics.count('records_total', len(result))
+        metrics.count('dropped_lines_total', result.short_lines)
+        metrics.count('malformed_lines_total', result.bad_lines)
+        metrics.observe('parse_seconds', result.elapsed)
+        elapsed = time.perf_counter() - self.started
+        if elapsed > 0:
+            metrics.set('bytes_per_second', self.bytes / elapsed)
+            metrics.set('records_per_second', self.records / elapsed)
+
+
+class Capture:
+    """cProfile and tracemalloc capture around one run
+
+    Writes `<base>.prof` (open with pstats or snakeviz) and
+    `<base>_memory.txt` listing the top allocation sites. cProfile only
+    sees the thread the capture was entered on.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        tracemalloc.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.profiler.dump_stats(self.base + '.prof')
+        with open(self.base + '_memory.txt', 'w') as f:
+            f.write(f"current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n")
+            for stat in snapshot.statistics('lineno')[:MEMORY_TOP]:
+                f.write(f"{stat}\n")
+        return False
@@ -0,0 +1,251 @@
+"""Parsers turning ESP32 response lines into ReadingStore columns"""
+
+import io
+import re
+import time
+
+import numpy as np
+
+from .protocol import (FINISHED_BIT, PARAMETERS, RECORD_TOKENS, SAVE_BITS, TIME_INVALID,
+                       WAKTU_LIMITS, WAKTU_UNITS, parse_waktu)
+from .store import COLUMN_DTYPES
+from .timeaxis import DAY_MS
+
+# Little-endian record of the binary response mode (37 bytes)
+BINARY_RECORD = np.dtype([
+    ('time_ms', '<u4'),
+    ('flags', 'u1'),
+    ('value_pH', '<f4'), ('value_temp', '<f4'), ('value_DO', '<f4'), ('value_turb', '<f4'),
+    ('interval_pH', '<u2'), ('interval_temp', '<u2'), ('interval_DO', '<u2'), ('interval_turb', '<u2'),
+    ('current', '<f4'),
+    ('voltage', '<f4'),
+])
+
+# Binary time_ms value standing for TIME_INVALID
+TIME_UNSET = 0xFFFFFFFF
+
+# Rows converted per block by parse_buffer; a block holding a bad line is
+# re-parsed token by token so one malformed line does not slow the whole dump
+BLOCK_ROWS = 256
+
+# A record whose stamp has anything but digits and colons, e.g. 8:0:0:0.0 or
+# 1e2:0:0:0, which the float reader of _parse_block takes and parse_waktu does not
+ODD_STAMP = re.compile(r'^[^;\n]*[^0-9:;\n]', re.MULTILINE)
+
+
+class ParseResult:
+    """Columns parsed from a response plus counts of rejected lines"""
+
+    def __init__(self, columns, short_lines=0, bad_lines=0, elapsed=0.0, finished=False):
+        self.columns = columns
+        self.short_lines = short_lines
+        self.bad_lines = bad_lines
+        # Seconds spent parsing
+        self.elapsed = elapsed
+        # Set by parse_binary when the finished record was seen
+        self.finished = finished
+
+    def __len__(self):
+        return len(self.columns['time_ms'])
+
+    @property
+    def malformed(self):
+        return self.short_lines + self.bad_lines
+
+    def summary(self):
+        return summarize(len(self), self.malformed)
+
+
+def summarize(records, malformed):
+    """Short Indonesian status text for the UI"""
+    if not malformed:
+        return f"{records} data"
+    return f"{records} data, {malformed} baris rusak"
+
+
+def empty_columns(count=0):
+    return {name: np.zeros(count, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+
+
+def concat_columns(parts):
+    """One set of columns holding the rows of `parts` in order"""
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMN_DTYPES}
+
+
+def parse_line(line):
+    """Parse one record line into the arguments of ReadingStore.append
+
+    Raises ValueError for lines with too few tokens or non-numeric fields.
+    """
+    tokens = line.split(';')
+    if len(tokens) < RECORD_TOKENS:
+        raise ValueError(f"expected {RECORD_TOKENS} tokens, got {len(tokens)}")
+    flags = 0
+    values = []
+    intervals = []
+    for i, (name, _, _, _) in enumerate(PARAMETERS):
+        base = 1 + 3 * i
+        if int(round(float(tokens[base]))) == 1:
+            flags |= SAVE_BITS[name]
+        values.append(float(tokens[base + 1]))
+        intervals.append(int(round(float(tokens[base + 2]))))
+    return parse_waktu(tokens[0]), flags, values, intervals, float(tokens[13]), float(tokens[14])
+
+
+def _split_lines(response):
+    if isinstance(response, (bytes, bytearray, memoryview)):
+        response = bytes(response).decode('ascii', errors='replace')
+    if isinstance(response, str):
+        return response.splitlines()
+    return list(response)
+
+
+def _waktu_from_parts(parts):
+    """Vectorized parse_waktu over an (n, 4) integer array of H, M, S, ms"""
+    in_range = ((parts >= 0) & (parts < np.array(WAKTU_LIMITS))).all(axis=1)
+    return np.where(in_range, parts @ np.array(WAKTU_UNITS, dtype=np.int64), TIME_INVALID)
+
+
+def _decode_waktu(waktu):
+    """Bulk parse_waktu over a list of H:M:S:ms strings"""
+    if not waktu:
+        return np.empty(0, dtype=np.int64)
+    # Fast path only when every stamp has exactly four integer parts; a
+    # total colon count could be met by a short and a long stamp together
+    if all(w.count(':') == 3 for w in waktu):
+        try:
+            parts = np.fromiter(map(int, ':'.join(waktu).split(':')), dtype=np.int64,
+                                count=4 * len(waktu))
+            return _waktu_from_parts(parts.reshape(-1, 4))
+        except ValueError:
+            pass
+    return np.fromiter(map(parse_waktu, waktu), dtype=np.int64, count=len(waktu))
+
+
+def _parse_fallback(records):
+    """Token-wise conversion of a block, rejecting individual bad rows"""
+    split = [record.partition(';') for record in records]
+    flat = ';'.join([tail for _, _, tail in split]).split(';')
+    rows = len(records)
+    try:
+        numbers = np.fromiter(map(float, flat), dtype=np.float64, count=rows * 15)
+        numbers = numbers.reshape(rows, 15)[:, :14]
+        ok = np.ones(rows, dtype=bool)
+    except ValueError:
+        numbers = np.full((rows, 14), np.nan)
+        ok = np.ones(rows, dtype=bool)
+        for r in range(rows):
+            try:
+                numbers[r] = [float(token) for token in flat[15 * r:15 * r + 14]]
+            except ValueError:
+                ok[r] = False
+    return _decode_waktu([head for head, _, _ in split]), numbers, ok
+
+
+def _parse_block(records):
+    """Parse a block of 16-token records to (time_ms, 14 numeric columns, ok mask)
+
+    The fast path hands the whole block to NumPy's C text reader with the
+    waktu colons turned into field separators; any irregular row sends the
+    block to _parse_fallback instead.
+    """
+    block = '\n'.join(records)
+    text = block.replace(':', ';')
+    try:
+        table = np.loadtxt(io.StringIO(text), delimiter=';', comments=None,
+                           dtype=np.float64, ndmin=2)
+    except ValueError:
+        return _parse_fallback(records)
+    if table.shape != (len(records), 4 + RECORD_TOKENS - 1):
+        return _parse_fallback(records)
+    hms = table[:, :4]
+    if not np.array_equal(hms, np.trunc(hms)):
+        return _parse_fallback(records)
+    if ODD_STAMP.search(block):
+        time_ms = _decode_waktu([record.partition(';')[0] for record in records])
+    else:
+        time_ms = _waktu_from_parts(hms.astype(np.int64))
+    return time_ms, table[:, 4:18], np.ones(len(records), dtype=bool)
+
+
+def parse_buffer(response):
+    """Parse a whole response (text, bytes or list of lines) in one pass
+
+    Gives the same rows as calling parse_line on every line, but converts
+    whole blocks of lines with NumPy instead of per-token Python calls.
+    """
+    started = time.perf_counter()
+    lines = [line for line in _split_lines(response) if line]
+    if not lines:
+        return ParseResult(empty_columns())
+
+    separators = [line.count(';') for line in lines]
+    records = [line for line, count in zip(lines, separators) if count == RECORD_TOKENS - 1]
+    if len(records) != len(lines):
+        # Longer records keep their first 16 tokens so every row splits evenly
+        records = [line if count == RECORD_TOKENS - 1
+                   else ';'.join(line.split(';', RECORD_TOKENS)[:RECORD_TOKENS])
+                   for line, count in zip(lines, separators) if count >= RECORD_TOKENS - 1]
+    short_lines = len(lines) - len(records)
+    del lines, separators
+
+    rows = len(records)
+    time_ms = np.empty(rows, dtype=np.int64)
+    numbers = np.empty((rows, 14))
+    ok = np.ones(rows, dtype=bool)
+    for start in range(0, rows, BLOCK_ROWS):
+        block = slice(start, start + BLOCK_ROWS)
+        time_ms[block], numbers[block], ok[block] = _parse_block(records[block])
+    # Save flags and intervals are rounded to int, which fails for NaN/inf
+    ok &= np.isfinite(numbers[:, [0, 2, 3, 5, 6, 8, 9, 11]]).all(axis=1)
+    if not ok.all():
+        time_ms = time_ms[ok]
+        numbers = numbers[ok]
+
+    columns = {'time_ms': time_ms}
+    flags = np.zeros(len(numbers), dtype=np.uint8)
+    for i, (name, _, value_key, interval_key) in enumerate(PARAMETERS):
+        base = 3 * i
+        flags |= np.where(np.rint(numbers[:, base]) == 1, SAVE_BITS[name], 0).astype(np.uint8)
+        columns[value_key] = numbers[:, base + 1].astype(np.float32)
+        columns[interval_key] = np.rint(numbers[:, base + 2]).astype(np.int32)
+    columns['flags'] = flags
+    columns['current'] = numbers[:, 12].astype(np.float32)
+    columns['voltage'] = numbers[:, 13].astype(np.float32)
+    return ParseResult(columns, short_lines, int(np.count_nonzero(~ok)),
+                       time.perf_counter() - started)
+
+
+def parse_binary(buffer):
+    """Decode whole binary records from a bytes-like buffer without copying
+
+    `buffer` must hold a multiple of BINARY_RECORD.itemsize bytes. Records
+    after the one carrying the finished bit are ignored.
+    """
+    started = time.perf_counter()
+    records = np.frombuffer(buffer, dtype=BINARY_RECORD)
+    finished = records['flags'] & FINISHED_BIT != 0
+    if finished.any():
+        records = records[:np.argmax(finished) + 1]
+    columns = {name: records[name] for name in BINARY_RECORD.names}
+    columns['time_ms'] = records['time_ms'].astype(np.int64)
+    # Unset stamps and anything past the end of the day cannot be placed
+    columns['time_ms'][records['time_ms'] >= DAY_MS] = TIME_INVALID
+    columns['flags'] = records['flags'] & ~np.uint8(FINISHED_BIT)
+    return ParseResult(columns, elapsed=time.perf_counter() - started, finished=bool(finished.any()))
+
+
+def encode_binary(columns, finished=True):
+    """Pack store columns as binary records, marking the last one finished"""
+    records = np.zeros(len(columns['time_ms']), dtype=BINARY_RECORD)
+    for name in BINARY_RECORD.names:
+        if name.startswith('interval_'):
+            records[name] = np.clip(columns[name], 0, 0xFFFF)
+        else:
+            records[name] = columns[name]
+    records['time_ms'] = np.where(columns['time_ms'] < 0, TIME_UNSET, columns['time_ms'])
+    if finished and len(records):
+        records['flags'][-1] |= FINISHED_BIT
+    return records.tobytes()
@@ -0,0 +1,189 @@
+"""Depth x time grid of the archive, aggregated as sessions are added
+
+For every parameter the grid keeps count, sum, min and max of the valid
+readings per (depth, time bin). Depth rows are the distinct session depths
+in ascending order, time bins are PROFILE_BIN_MS wide and aligned to the
+epoch. The grid grows in both directions as sessions arrive, so adding a
+session only touches the cells it falls into and a heatmap over months of
+data is drawn from a few thousand cells instead of the raw readings.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+
+from .protocol import PARAMETERS, SAVE_BITS, TIME_INVALID
+
+# Width of one time bin of the grid (ms)
+PROFILE_BIN_MS = 3600000
+
+# Most time columns a heatmap draws; wider grids are merged into coarser bins
+PROFILE_MAX_COLUMNS = 1500
+
+# Colour bar labels of the heatmap
+PROFILE_LABELS = {
+    'pH': "pH",
+    'temp': "Suhu (°C)",
+    'DO': "Oksigen terlarut (mg/L)",
+    'turb': "Kekeruhan (NTU)",
+}
+
+# Sums are merged by adding, extremes by min/max; mean is sum / count
+STATS = ('count', 'sum', 'min', 'max')
+_EMPTY = {'count': 0.0, 'sum': 0.0, 'min': np.inf, 'max': -np.inf}
+
+
+class DepthTimeGrid:
+    """Per-parameter count/sum/min/max of readings per depth and time bin"""
+
+    def __init__(self, bin_ms=PROFILE_BIN_MS):
+        self.bin_ms = bin_ms
+        self.depths = []
+        # Epoch bin number of column 0
+        self.origin = 0
+        # Archive sessions aggregated so far, in archive order
+        self.sessions = 0
+        self.cells = {name: {stat: np.full((0, 0), _EMPTY[stat]) for stat in STATS}
+                      for name, _, _, _ in PARAMETERS}
+
+    @property
+    def columns(self):
+        return self.cells[PARAMETERS[0][0]]['count'].shape[1]
+
+    @classmethod
+    def load(cls, path):
+        """Read a grid saved with save(); a missing file gives an empty grid"""
+        grid = cls()
+        if not os.path.exists(path):
+            return grid
+        with np.load(path) as data:
+            grid.bin_ms = int(data['bin_ms'])
+            grid.depths = data['depths'].tolist()
+            grid.origin = int(data['origin'])
+            grid.sessions = int(data['sessions'])
+            for name, stats in grid.cells.items():
+                for stat in STATS:
+                    stats[stat] = data[f'{name}_{stat}']
+        return grid
+
+    def save(self, path):
+        arrays = {f'{name}_{stat}': data for name, stats in self.cells.items()
+                  for stat, data in stats.items()}
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, bin_ms=self.bin_ms, depths=np.array(self.depths, dtype=np.float64),
+                     origin=self.origin, sessions=self.sessions, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _fit(self, depth, first_bin, last_bin):
+        """Grow the arrays to hold `depth` and bins first_bin..last_bin; returns the depth row"""
+        if depth not in self.depths:
+            row = int(np.searchsorted(self.depths, depth))
+            self.depths.insert(row, depth)
+            for stats in self.cells.values():
+                for stat, data in stats.items():
+                    stats[stat] = np.insert(data, row, _EMPTY[stat], axis=0)
+        if not self.columns:
+            self.origin = first_bin
+        before = max(0, self.origin - first_bin)
+        after = max(0, last_bin + 1 - (self.origin + self.columns))
+        if before or after:
+            for stats in self.cells.values():
+                for stat, data in stats.items():
+                    stats[stat] = np.pad(data, ((0, 0), (before, after)),
+                                         constant_values=_EMPTY[stat])
+            self.origin -= before
+        return self.depths.index(depth)
+
+    def add(self, epoch, columns, depth):
+        """Fold one session into the grid
+
+        `epoch` holds the absolute ms of every row of `columns`. Sessions
+        without a depth are counted but not placed.
+        """
+        self.sessions += 1
+        ok = np.asarray(columns['time_ms']) != TIME_INVALID
+        if depth is None or not ok.any():
+            return
+        bins = np.asarray(epoch)[ok] // self.bin_ms
+        first, last = int(bins.min()), int(bins.max())
+        row = self._fit(float(depth), first, last)
+        lo = first - self.origin
+        span = slice(lo, lo + last - first + 1)
+        flags = np.asarray(columns['flags'])[ok]
+        for name, _, value_key, _ in PARAMETERS:
+            valid = (flags & SAVE_BITS[name]) != 0
+            if not valid.any():
+                continue
+            index = bins[valid] - first
+            values = np.asarray(columns[value_key])[ok][valid].astype(np.float64)
+            stats = self.cells[name]
+            size = last - first + 1
+            stats['count'][row, span] += np.bincount(index, minlength=size)
+            stats['sum'][row, span] += np.bincount(index, weights=values, minlength=size)
+            np.minimum.at(stats['min'][row, span], index, values)
+            np.maximum.at(stats['max'][row, span], index, values)
+
+    def view(self, name, stat='mean', max_columns=PROFILE_MAX_COLUMNS):
+        """(depths, bin edges in epoch ms, depths x bins matrix) for a heatmap
+
+        `stat` is 'mean', 'count', 'min' or 'max'; empty cells are NaN.
+        Neighbouring bins are merged until at most `max_columns` remain.
+        """
+        stats = self.cells[name]
+        factor = max(1, -(-self.columns // max_columns))
+        merged = {}
+        if factor > 1:
+            pad = -self.columns % factor
+            for key, reduce in (('count', np.sum), ('sum', np.sum), ('min', np.min),
+                                ('max', np.max)):
+                data = np.pad(stats[key], ((0, 0), (0, pad)), constant_values=_EMPTY[key])
+                merged[key] = reduce(data.reshape(len(self.depths), -1, factor), axis=2)
+        else:
+            merged = stats
+        count = merged['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if stat == 'mean':
+                matrix = merged['sum'] / count
+            else:
+                matrix = merged[stat].astype(np.float64)
+        matrix = np.where(count > 0, matrix, np.nan)
+        bin_ms = self.bin_ms * factor
+        edges = (self.origin * self.bin_ms) + np.arange(count.shape[1] + 1) * bin_ms
+        return np.array(self.depths), edges, matrix
+
+
+def depth_edges(depths):
+    """Row boundaries for a heatmap: halfway between neighbouring depths"""
+    depths = np.asarray(depths, dtype=np.float64)
+    if len(depths) == 1:
+        return np.array([depths[0] - 0.5, depths[0] + 0.5])
+    middle = (depths[1:] + depths[:-1]) / 2
+    return np.concatenate(([2 * depths[0] - middle[0]], middle, [2 * depths[-1] - middle[-1]]))
+
+
+def plot_profile(figure, grid, name, stat='mean'):
+    """Draw the heatmap of one parameter onto a matplotlib Figure
+
+    Only the aggregated cells are drawn, never the raw readings.
+    """
+    figure.clear()
+    ax = figure.add_subplot(1, 1, 1)
+    depths, edges, matrix = grid.view(name, stat)
+    if not len(depths):
+        ax.text(0.5, 0.5, "Belum ada data dengan kedalaman", ha='center', va='center',
+                transform=ax.transAxes)
+        return ax
+    # Local time, like the rest of the app
+    times = [datetime.fromtimestamp(edge / 1000) for edge in edges]
+    mesh = ax.pcolormesh(times, depth_edges(depths), np.ma.masked_invalid(matrix),
+                         shading='flat', cmap='viridis')
+    ax.invert_yaxis()
+    ax.set_ylabel("Kedalaman (m)")
+    ax.set_title(f"{PROFILE_LABELS[name]} ({stat})")
+    figure.colorbar(mesh, ax=ax, label=PROFILE_LABELS[name])
+    figure.autofmt_xdate()
+    return ax
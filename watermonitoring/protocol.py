@@ -0,0 +1,91 @@
+"""Field layout of the ESP32 semicolon protocol"""
+
+import struct
+
+# Define headers
+HEADERS = [
+    'waktu', 'save_pH', 'value_pH', 'interval_pH',
+    'save_temp', 'value_temp', 'interval_temp',
+    'save_DO', 'value_DO', 'interval_DO',
+    'save_turb', 'value_turb', 'interval_turb',
+    'current', 'voltage'
+]
+
+# Sensor parameters as (name, save key, value key, interval key)
+PARAMETERS = [
+    ('pH', 'save_pH', 'value_pH', 'interval_pH'),
+    ('temp', 'save_temp', 'value_temp', 'interval_temp'),
+    ('DO', 'save_DO', 'value_DO', 'interval_DO'),
+    ('turb', 'save_turb', 'value_turb', 'interval_turb'),
+]
+
+# Bit of each parameter in the packed save-flag mask
+SAVE_BITS = {name: 1 << i for i, (name, _, _, _) in enumerate(PARAMETERS)}
+SAVE_BITS.update({save_key: 1 << i for i, (_, save_key, _, _) in enumerate(PARAMETERS)})
+
+# Number of tokens in a record line (15 fields + sd_card_finished flag)
+RECORD_TOKENS = 16
+
+# Timestamp stored for a record whose waktu could not be decoded
+TIME_INVALID = -1
+
+# Milliseconds per unit and exclusive upper bound of the H, M, S, ms parts
+WAKTU_UNITS = (3600000, 60000, 1000, 1)
+WAKTU_LIMITS = (24, 60, 60, 1000)
+
+# Response format selected by the optional version byte after the request
+# header; requests without it get the text protocol
+PROTOCOL_TEXT = 0
+PROTOCOL_BINARY = 1
+
+# Preamble a device sends before binary records to confirm the mode
+BINARY_MAGIC = b'WQB'
+
+# Bit in a binary record's flag byte marking the sd_card_finished record
+FINISHED_BIT = 0x80
+
+# Session handshake: a client opens with SESSION_MAGIC + PROTOCOL_SESSION
+# and firmware that keeps connections open echoes the same four bytes.
+# Firmware without sessions waits for a full request header and never
+# answers, so it is used one request per connection as before.
+PROTOCOL_SESSION = 2
+SESSION_MAGIC = b'WQS'
+
+# Commands on a session: one opcode byte and its fixed-size arguments
+CMD_PING = b'P'    # reply: b'P\n'
+CMD_STATUS = b'S'  # reply: one key=value;key=value line
+CMD_TEST = b'T'    # TEST_ARGS; reply: a test response, text or binary
+CMD_FETCH = b'F'   # FETCH_ARGS; reply: b'N=<count>;T=<stored>\n' and count stored record lines
+CMD_QUIT = b'Q'    # no reply, the device closes the connection
+
+# depth, duration, save, response format (PROTOCOL_TEXT/PROTOCOL_BINARY)
+TEST_ARGS = struct.Struct('<iiBB')
+# sequence number of the first stored record to send, most records to send
+# (0: all). Stored records are numbered from 0 in the order the device
+# wrote them to its SD card; T in the reply is the number stored so far.
+FETCH_ARGS = struct.Struct('<II')
+
+
+def parse_waktu(text):
+    """Convert an H:M:S:ms string to milliseconds since midnight
+
+    Stamps that do not split into four in-range integers give TIME_INVALID.
+    """
+    parts = text.split(':')
+    if len(parts) != 4:
+        return TIME_INVALID
+    try:
+        parts = [int(part) for part in parts]
+    except ValueError:
+        return TIME_INVALID
+    if not all(0 <= part < limit for part, limit in zip(parts, WAKTU_LIMITS)):
+        return TIME_INVALID
+    return sum(part * unit for part, unit in zip(parts, WAKTU_UNITS))
+
+
+def format_waktu(ms):
+    """Convert milliseconds since midnight back to H:M:S:ms"""
+    if ms < 0:
+        return ""
+    ms = int(ms)
+    return f"{ms // 3600000}:{ms // 60000 % 60}:{ms // 1000 % 60}:{ms % 1000}"
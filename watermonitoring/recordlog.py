@@ -0,0 +1,244 @@
+"""Append-only, crash-safe on-disk log of parsed readings
+
+A log file is a sequence of chunks. Each chunk is a 16-byte header
+(magic, row count, payload length, CRC32 of the payload) followed by the
+store columns of those rows, one after another in COLUMN_DTYPES order.
+A torn write can only damage the last chunk, which recovery drops.
+
+Usage: python -m watermonitoring.recordlog export LOG [CSV]
+       python -m watermonitoring.recordlog recover LOG
+"""
+
+import argparse
+import csv
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from .protocol import HEADERS
+from .store import COLUMN_DTYPES, ReadingStore, format_rows
+
+CHUNK_MAGIC = b'WQC1'
+CHUNK_HEADER = struct.Struct('<4sIII')
+ROW_SIZE = sum(np.dtype(dtype).itemsize for dtype in COLUMN_DTYPES.values())
+
+# Writer defaults: seconds between chunk writes and between fsyncs
+FLUSH_INTERVAL = 1.0
+FSYNC_INTERVAL = 5.0
+# Rows that trigger a chunk write before the flush interval is up
+CHUNK_ROWS = 8192
+# Batches queued before append() waits for the writer thread
+LOG_QUEUE_BATCHES = 1024
+
+
+def encode_chunk(columns):
+    """Serialize equally long columns into one chunk"""
+    rows = len(columns['time_ms'])
+    payload = b''.join(np.ascontiguousarray(columns[name], dtype=dtype).tobytes()
+                       for name, dtype in COLUMN_DTYPES.items())
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, rows, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_chunk(payload, rows):
+    """Turn a chunk payload back into columns (views into `payload`)"""
+    columns = {}
+    offset = 0
+    for name, dtype in COLUMN_DTYPES.items():
+        columns[name] = np.frombuffer(payload, dtype=dtype, count=rows, offset=offset)
+        offset += rows * np.dtype(dtype).itemsize
+    return columns
+
+
+def iter_chunks(path):
+    """Yield (offset, columns) for every intact chunk, stopping at damage"""
+    with open(path, 'rb') as f:
+        offset = 0
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            magic, rows, length, crc = CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC or length != rows * ROW_SIZE:
+                return
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield offset, decode_chunk(payload, rows)
+            offset += CHUNK_HEADER.size + length
+
+
+def recover(path, truncate=True):
+    """Check a log and optionally cut off a torn tail
+
+    Returns (rows, intact bytes, damaged bytes).
+    """
+    rows = 0
+    good = 0
+    for offset, columns in iter_chunks(path):
+        rows += len(columns['time_ms'])
+        good = offset + CHUNK_HEADER.size + len(columns['time_ms']) * ROW_SIZE
+    damaged = os.path.getsize(path) - good
+    if truncate and damaged:
+        with open(path, 'r+b') as f:
+            f.truncate(good)
+            f.flush()
+            os.fsync(f.fileno())
+    return rows, good, damaged
+
+
+def load(path, store=None):
+    """Read every intact chunk of a log into a ReadingStore"""
+    store = store if store is not None else ReadingStore()
+    for _, columns in iter_chunks(path):
+        store.extend(columns)
+    return store
+
+
+def export_csv(path, csv_path):
+    """Write a log as the ;-delimited CSV layout of save_data"""
+    rows = 0
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=';')
+        writer.writerow(HEADERS)
+        for _, columns in iter_chunks(path):
+            writer.writerows(format_rows(columns))
+            rows += len(columns['time_ms'])
+    return rows
+
+
+class RecordLogWriter:
+    """Write-behind appender running on its own thread
+
+    append() only queues the columns, so the caller (Tk loop or socket
+    reader) never waits for the disk. The thread merges queued batches into
+    chunks every `flush_interval` seconds or CHUNK_ROWS rows and fsyncs at
+    most every `fsync_interval` seconds, plus once on close().
+
+    At most `max_pending` batches are queued; beyond that append() waits
+    for the disk instead of letting memory grow. A failed write or fsync
+    stops the log, as chunks after a torn one could not be read back. The
+    error is kept in `error` and raised again by append() and close(), so
+    a caller cannot go on believing its readings are logged. append()
+    after close() raises ValueError.
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, fsync_interval=FSYNC_INTERVAL,
+                 chunk_rows=CHUNK_ROWS, max_pending=LOG_QUEUE_BATCHES):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.error = None
+        self._queue = queue.Queue(max_pending)
+        self._closed = False
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            # New chunks must follow the last intact one to stay readable
+            recover(path)
+        self._file = open(path, 'ab')
+        self._thread = threading.Thread(target=self._run, name="record-log", daemon=True)
+        self._thread.start()
+
+    def append(self, columns):
+        """Queue columns for the log; raises the error that stopped the writer"""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"{self.path} is closed")
+            if self.error is not None:
+                raise self.error
+            if len(columns['time_ms']):
+                self._queue.put(columns)
+
+    def close(self):
+        """Write everything still queued, fsync and stop the thread
+
+        Raises the error that stopped the writer, if any.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        pending = []
+        pending_rows = 0
+        last_flush = last_fsync = time.monotonic()
+        closing = False
+        while not closing:
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is None:
+                    closing = True
+                else:
+                    pending.append(item)
+                    pending_rows += len(item['time_ms'])
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if pending and (closing or pending_rows >= self.chunk_rows
+                            or now - last_flush >= self.flush_interval):
+                self._write(pending)
+                pending = []
+                pending_rows = 0
+            if pending_rows == 0:
+                last_flush = now
+            if closing or now - last_fsync >= self.fsync_interval:
+                self._sync()
+                last_fsync = now
+        self._file.close()
+
+    def _write(self, batches):
+        if self.error is not None:
+            return
+        columns = {name: np.concatenate([batch[name] for batch in batches])
+                   for name in COLUMN_DTYPES}
+        try:
+            self._file.write(encode_chunk(columns))
+            self._file.flush()
+            self.rows_written += len(columns['time_ms'])
+            self.chunks_written += 1
+        except OSError as e:
+            self.error = e
+
+    def _sync(self):
+        if self.error is not None:
+            return
+        try:
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            self.error = e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or export a reading log")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="write the log as CSV")
+    export.add_argument('log')
+    export.add_argument('csv', nargs='?')
+    check = commands.add_parser('recover', help="drop a torn tail left by a crash")
+    check.add_argument('log')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        csv_path = args.csv or os.path.splitext(args.log)[0] + '.csv'
+        rows = export_csv(args.log, csv_path)
+        print(f"{rows} rows written to {csv_path}")
+    else:
+        rows, good, damaged = recover(args.log)
+        print(f"{rows} rows intact ({good} bytes), {damaged} damaged bytes removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Fixed-capacity arrays that keep the newest rows of an endless series
+
+A RingBuffer is allocated once and never grows. Every row is written
+twice, at `row % capacity` and `capacity` places further on, so the rows
+it holds are always one contiguous slice of the underlying array and can
+be handed out as zero-copy views. Rows are numbered from the first one
+ever added; `first` is the oldest one still held.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    """The newest `capacity` values of a 1-D series, preallocated"""
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = max(int(capacity), 1)
+        self._data = np.empty(2 * self.capacity, dtype=dtype)
+        # Rows ever added
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def first(self):
+        """Row number of the oldest value held"""
+        return self.total - len(self)
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def clear(self):
+        self.total = 0
+
+    def extend(self, values):
+        """Add values; only the newest `capacity` of a longer batch are kept"""
+        values = np.asarray(values)
+        count = len(values)
+        if count > self.capacity:
+            self.total += count - self.capacity
+            values = values[-self.capacity:]
+            count = self.capacity
+        if count == 0:
+            return
+        start = self.total % self.capacity
+        head = min(count, self.capacity - start)
+        for offset in (0, self.capacity):
+            self._data[offset + start:offset + start + head] = values[:head]
+            self._data[offset:offset + count - head] = values[head:]
+        self.total += count
+
+    def view(self, start=None):
+        """Zero-copy view of the held rows from row number `start` on"""
+        first = self.first
+        start = first if start is None else start
+        if not first <= start <= self.total:
+            raise IndexError(f"row {start} is not held (rows {first} to {self.total - 1})")
+        offset = start % self.capacity if start < self.total else 0
+        return self._data[offset:offset + self.total - start]
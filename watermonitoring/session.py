@@ -0,0 +1,356 @@
+"""Persistent connections to ESP32 probes
+
+A ProbeConnection negotiates a keep-alive session once and then sends any
+number of commands (ping, status, test, fetch stored data) over the same
+socket. Firmware that does not answer the session handshake is treated
+as legacy and gets one connection per test as before; the handshake is
+tried again after HELLO_RETRY_INTERVAL, as one slow answer on a weak
+Wi-Fi link looks just the same. ConnectionPool keeps
+one connection per probe, pings idle sessions so dead links are noticed
+before the next test, and reopens them.
+
+    pool = ConnectionPool()
+    with pool.connection('192.168.1.100', 80) as probe:
+        print(probe.status())
+        totals = probe.run_test(depth=5, duration=10, save=True, on_batch=store.extend)
+
+Failures are raised as ProbeError subclasses (see errors.py).
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from .client import read_response, request_test
+from .errors import ProbeDisconnected, ProtocolError, SessionUnsupported, probe_error
+from .protocol import (CMD_FETCH, CMD_PING, CMD_QUIT, CMD_STATUS, CMD_TEST, FETCH_ARGS,
+                       PROTOCOL_BINARY, PROTOCOL_SESSION, PROTOCOL_TEXT, SESSION_MAGIC, TEST_ARGS)
+
+# Seconds allowed for connecting
+CONNECT_TIMEOUT = 5.0
+# Seconds allowed for every wait for reply data
+READ_TIMEOUT = 30.0
+# Seconds a device gets to answer the session handshake before it is
+# treated as firmware without sessions
+HELLO_TIMEOUT = 1.0
+# Seconds after an unanswered handshake before it is tried again
+HELLO_RETRY_INTERVAL = 300.0
+# Idle seconds after which the pool pings a session
+HEARTBEAT_INTERVAL = 15.0
+
+_HELLO = SESSION_MAGIC + bytes([PROTOCOL_SESSION])
+
+
+class ProbeConnection:
+    """One probe, reached over a persistent session when its firmware allows
+
+    Not thread-safe by itself; ConnectionPool hands it to one user at a
+    time.
+    """
+
+    def __init__(self, host, port, timeout=READ_TIMEOUT, connect_timeout=CONNECT_TIMEOUT,
+                 metrics=None):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics
+        # None until the first handshake, then whether sessions are supported
+        self.persistent = None
+        # When the last handshake went unanswered (time.monotonic())
+        self.hello_failed = None
+        self.connects = 0
+        self.last_used = time.monotonic()
+        self._sock = None
+        self._file = None
+
+    def __repr__(self):
+        return f"ProbeConnection({self.address}, persistent={self.persistent})"
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def _open(self):
+        started = time.perf_counter()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        except OSError as e:
+            raise probe_error(e, self.address, connecting=True) from e
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.connects += 1
+        if self.metrics is not None:
+            self.metrics.observe('connect_seconds', time.perf_counter() - started)
+            self.metrics.count('connections_opened_total')
+        return sock
+
+    def connect(self):
+        """Open the session if it is not open; a no-op for legacy firmware"""
+        if self._sock is not None:
+            return
+        if self.persistent is False and time.monotonic() - self.hello_failed < HELLO_RETRY_INTERVAL:
+            return
+        sock = self._open()
+        try:
+            sock.settimeout(HELLO_TIMEOUT)
+            sock.sendall(_HELLO)
+            reply = b''
+            while len(reply) < len(_HELLO):
+                chunk = sock.recv(len(_HELLO) - len(reply))
+                if not chunk:
+                    break
+                reply += chunk
+        except socket.timeout:
+            reply = b''
+        except OSError as e:
+            sock.close()
+            raise probe_error(e, self.address) from e
+        if reply != _HELLO:
+            # Silence or a hang-up: firmware from before sessions
+            sock.close()
+            self.persistent = False
+            self.hello_failed = time.monotonic()
+            return
+        sock.settimeout(self.timeout)
+        self._sock = sock
+        self._file = sock.makefile('rb')
+        self.persistent = True
+
+    def abort(self):
+        """Shut the session's socket down from another thread
+
+        A command waiting for its reply fails at once and closes the
+        connection itself. The one-off connection of a legacy test is not
+        reached.
+        """
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        """Drop the session; the next command opens a new one"""
+        if self._sock is None:
+            return
+        try:
+            self._sock.sendall(CMD_QUIT)
+        except OSError:
+            pass
+        self._file.close()
+        self._sock.close()
+        self._sock = None
+        self._file = None
+
+    def _command(self, payload, read):
+        """Send one command and return `read(file, sent)` on its reply
+
+        A session that died while idle is noticed when the reply does not
+        start; the command is then sent once more on a new session.
+        Errors after the reply started are raised, as it may be half
+        processed.
+        """
+        for attempt in (1, 2):
+            self.connect()
+            if not self.persistent:
+                raise SessionUnsupported(f"{self.address}: firmware has no session support")
+            try:
+                self._sock.sendall(payload)
+                sent = time.perf_counter()
+                started = bool(self._file.peek(1))
+            except socket.timeout as e:
+                self.close()
+                raise probe_error(e, self.address) from e
+            except OSError as e:
+                started = False
+                if attempt == 2:
+                    self.close()
+                    raise probe_error(e, self.address) from e
+            if not started:
+                self.close()
+                if attempt == 2:
+                    raise ProbeDisconnected(f"{self.address}: session closed by the device")
+                if self.metrics is not None:
+                    self.metrics.count('reconnects_total')
+                continue
+            try:
+                result = read(self._file, sent)
+            except OSError as e:
+                self.close()
+                raise probe_error(e, self.address) from e
+            except ProbeDisconnected:
+                self.close()
+                raise
+            self.last_used = time.monotonic()
+            return result
+
+    def ping(self):
+        """Round trip of a heartbeat in seconds"""
+        started = time.perf_counter()
+
+        def read(file, sent):
+            if file.readline() != b'P\n':
+                raise ProtocolError(f"{self.address}: unexpected ping reply")
+
+        self._command(CMD_PING, read)
+        elapsed = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.observe('heartbeat_seconds', elapsed)
+        return elapsed
+
+    def status(self):
+        """The device's status line as a dict of strings"""
+
+        def read(file, sent):
+            line = file.readline().decode('ascii', errors='replace').strip()
+            if not line:
+                raise ProbeDisconnected(f"{self.address}: session closed during status")
+            return dict(item.partition('=')[::2] for item in line.split(';') if item)
+
+        return self._command(CMD_STATUS, read)
+
+    def run_test(self, depth, duration, save, on_batch, binary=False):
+        """Run one test and stream the reply into `on_batch`; returns StreamTotals"""
+        self.connect()
+        if not self.persistent:
+            try:
+                return request_test(self.host, self.port, depth, duration, save, on_batch,
+                                    timeout=self.timeout, binary=binary, metrics=self.metrics)
+            except OSError as e:
+                raise probe_error(e, self.address) from e
+        version = PROTOCOL_BINARY if binary else PROTOCOL_TEXT
+        payload = CMD_TEST + TEST_ARGS.pack(int(depth), int(duration), 1 if save else 0, version)
+
+        def read(file, sent):
+            totals = read_response(file, on_batch, binary, self.metrics, sent)
+            if not totals.finished:
+                raise ProbeDisconnected(f"{self.address}: reply ended before the finished flag")
+            return totals
+
+        return self._command(payload, read)
+
+    def fetch(self, first=0, limit=0):
+        """Stored record lines from sequence number `first`, at most `limit` (0: all)
+
+        Returns (lines, number of records stored on the device). The lines
+        are returned unparsed so the caller can number them; use a limit
+        to keep large logs out of memory.
+        """
+
+        def read(file, sent):
+            header = file.readline().decode('ascii', errors='replace').strip()
+            if not header:
+                raise ProbeDisconnected(f"{self.address}: session closed during fetch")
+            fields = dict(item.partition('=')[::2] for item in header.split(';') if item)
+            try:
+                count, stored = int(fields['N']), int(fields['T'])
+            except (KeyError, ValueError):
+                raise ProtocolError(f"{self.address}: unexpected fetch reply {header!r}") from None
+            lines = []
+            received = 0
+            for _ in range(count):
+                raw = file.readline()
+                if not raw.endswith(b'\n'):
+                    raise ProbeDisconnected(f"{self.address}: stored data ended early")
+                received += len(raw)
+                lines.append(raw.decode('ascii', errors='replace').strip())
+            if self.metrics is not None:
+                self.metrics.count('bytes_received_total', received)
+            return lines, stored
+
+        return self._command(CMD_FETCH + FETCH_ARGS.pack(first, limit), read)
+
+
+class ConnectionPool:
+    """One ProbeConnection per probe, kept open and checked by a heartbeat
+
+    connection() hands a probe's connection to one caller at a time. A
+    background thread pings sessions idle for `heartbeat` seconds and
+    reopens sessions that dropped, so a test normally starts on a live
+    connection.
+    """
+
+    def __init__(self, timeout=READ_TIMEOUT, connect_timeout=CONNECT_TIMEOUT,
+                 heartbeat=HEARTBEAT_INTERVAL, metrics=None):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.heartbeat = heartbeat
+        self.metrics = metrics
+        self._connections = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def connection(self, host, port):
+        key = (host, int(port))
+        with self._lock:
+            if key not in self._connections:
+                self._connections[key] = ProbeConnection(host, port, self.timeout,
+                                                         self.connect_timeout, self.metrics)
+                self._locks[key] = threading.Lock()
+            if self._thread is None and self.heartbeat:
+                self._thread = threading.Thread(target=self._run_heartbeat, daemon=True)
+                self._thread.start()
+            connection = self._connections[key]
+            lock = self._locks[key]
+        with lock:
+            if connection.connected and self.metrics is not None:
+                self.metrics.count('connections_reused_total')
+            try:
+                yield connection
+            finally:
+                connection.last_used = time.monotonic()
+
+    def _run_heartbeat(self):
+        while not self._stop.wait(self.heartbeat / 2):
+            with self._lock:
+                entries = [(self._connections[key], self._locks[key]) for key in self._connections]
+            for connection, lock in entries:
+                if self._stop.is_set():
+                    return
+                # A connection in use is alive by definition
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not connection.persistent:
+                        continue
+                    if not connection.connected:
+                        connection.connect()
+                    elif time.monotonic() - connection.last_used >= self.heartbeat:
+                        connection.ping()
+                except Exception:
+                    # Retried at the next beat; the error surfaces on real use
+                    connection.close()
+                finally:
+                    if self._stop.is_set():
+                        # The pool was closed while this beat held the connection
+                        connection.close()
+                    lock.release()
+
+    def close(self):
+        """Stop the heartbeat and end every session without waiting
+
+        A connection in use, by a test or a heartbeat, is aborted rather
+        than waited for, so closing the app during a test returns at once.
+        """
+        self._stop.set()
+        with self._lock:
+            entries = [(self._connections[key], self._locks[key]) for key in self._connections]
+            self._connections.clear()
+            self._locks.clear()
+        for connection, lock in entries:
+            if lock.acquire(blocking=False):
+                try:
+                    connection.close()
+                finally:
+                    lock.release()
+            else:
+                connection.abort()
@@ -0,0 +1,291 @@
+"""Synthetic ESP32 records and a local TCP stand-in for the probe
+
+Run `python -m watermonitoring.simulator --port 8080` to serve fake
+readings to the GUI or the benchmarks without hardware.
+"""
+
+import argparse
+import asyncio
+import bisect
+import itertools
+import random
+import struct
+import time
+
+from .parser import encode_binary, parse_buffer
+from .protocol import (BINARY_MAGIC, CMD_FETCH, CMD_PING, CMD_QUIT, CMD_STATUS, CMD_TEST,
+                       FETCH_ARGS, PROTOCOL_BINARY, PROTOCOL_SESSION, SESSION_MAGIC, TEST_ARGS)
+
+# Size of the ABC + depth + duration + save request header
+REQUEST_SIZE = 12
+# How long a binary-capable simulator waits for the optional version byte
+VERSION_WAIT = 0.05
+# How long the simulator waits for the client to close after replying
+LINGER = 5.0
+
+# Malformed lines mixed into synthetic dumps: too few tokens, non-numeric field
+MALFORMED_LINES = (
+    'ERR;sensor',
+    '12:0:0:0;1;x.y;1000;1;25;1000;1;6;2000;1;3;3000;0.1;3.3;0',
+)
+
+
+def format_record(index, rng, finished=False, start_ms=8 * 3600000, step_ms=1000):
+    """Build one 16-token record line like the ESP32 sends it"""
+    ms = start_ms + index * step_ms
+    waktu = f"{ms // 3600000 % 24}:{ms // 60000 % 60}:{ms // 1000 % 60}:{ms % 1000}"
+    fields = [waktu]
+    for mean, spread, interval in ((7.0, 0.5, 1000), (25.0, 2.0, 1000),
+                                   (6.5, 1.0, 2000), (3.0, 1.5, 3000)):
+        fields.append('1' if rng.random() < 0.9 else '0')
+        fields.append(f"{rng.gauss(mean, spread):.2f}")
+        fields.append(str(interval + rng.randint(-20, 20)))
+    fields.append(f"{rng.uniform(0.05, 0.25):.3f}")
+    fields.append(f"{rng.uniform(3.2, 4.2):.2f}")
+    fields.append('1' if finished else '0')
+    return ';'.join(fields)
+
+
+def iter_synthetic_lines(count, seed=0, malformed_ratio=0.0, terminate=True):
+    """Yield `count` record lines, optionally with malformed lines mixed in
+
+    The last line carries the `;1` finished flag when `terminate` is set.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        if malformed_ratio and i < count - 1 and rng.random() < malformed_ratio:
+            yield rng.choice(MALFORMED_LINES)
+            continue
+        yield format_record(i, rng, finished=terminate and i == count - 1)
+
+
+def synthetic_lines(count, seed=0, malformed_ratio=0.0, terminate=True):
+    """List version of iter_synthetic_lines"""
+    return list(iter_synthetic_lines(count, seed, malformed_ratio, terminate))
+
+
+class FakeESP32:
+    """Local asyncio TCP stand-in for an ESP32 probe
+
+    Accepts the ABC + depth + duration + save request and answers with
+    `records` synthetic record lines ending in the `;1` finished flag.
+    Lines are written `chunk_lines` at a time, paced to `rate` records per
+    second when a rate is given. With `binary` the simulator honours the
+    binary version byte; without it, it behaves like firmware that only
+    speaks text and ignores the extra byte. With `sessions` it also accepts
+    the keep-alive session handshake and its commands; tests run with the
+    save flag add their records to the stored log that CMD_FETCH returns;
+    the log starts with `stored` records, as if earlier tests had saved
+    them. `accept_delay` is waited on every new connection, standing in for
+    the connection setup cost of a probe on Wi-Fi. With `drop_every` the
+    connection is cut every that many records sent, halfway through a line.
+    """
+
+    def __init__(self, records=100, rate=None, malformed_ratio=0.0, chunk_lines=256,
+                 host='127.0.0.1', port=0, seed=0, binary=False, sessions=True, accept_delay=0.0,
+                 stored=0, drop_every=None):
+        self.records = records
+        self.binary = binary
+        self.sessions = sessions
+        self.accept_delay = accept_delay
+        self.stored = 0
+        # Start of every test in the stored log; the first `stored` records
+        # are split into whole test dumps
+        self._tests = []
+        for _ in range(0, stored, records):
+            self._store()
+        self.stored = stored
+        self.drop_every = drop_every
+        self.drops = 0
+        self._until_drop = drop_every
+        self.connections = 0
+        self.rate = rate
+        self.malformed_ratio = malformed_ratio
+        self.chunk_lines = chunk_lines
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.requests = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.accept_delay:
+                await asyncio.sleep(self.accept_delay)
+            header = await reader.readexactly(len(SESSION_MAGIC) + 1)
+            if self.sessions and header == SESSION_MAGIC + bytes([PROTOCOL_SESSION]):
+                writer.write(header)
+                await self._session(reader, writer)
+                return
+            # Firmware without sessions reads on to a full request header
+            header += await reader.readexactly(REQUEST_SIZE - len(header))
+            if header[:3] != b'ABC':
+                return
+            depth, duration, save = struct.unpack('<iiB', header[3:])
+            self.requests.append((depth, duration, bool(save)))
+            if save:
+                self._store()
+            version = None
+            if self.binary:
+                try:
+                    version = (await asyncio.wait_for(reader.readexactly(1), VERSION_WAIT))[0]
+                except asyncio.TimeoutError:
+                    pass
+            if version == PROTOCOL_BINARY:
+                writer.write(BINARY_MAGIC + bytes([PROTOCOL_BINARY]))
+            await self._send_records(writer, version == PROTOCOL_BINARY)
+            # Wait for the client to hang up so unread request bytes do not
+            # turn our close into a reset that discards the tail of the reply
+            writer.write_eof()
+            await asyncio.wait_for(reader.read(), LINGER)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _session(self, reader, writer):
+        """Answer commands until the client quits or hangs up"""
+        while True:
+            command = await reader.readexactly(1)
+            if command == CMD_PING:
+                writer.write(b'P\n')
+            elif command == CMD_STATUS:
+                writer.write(f"stored={self.stored};tests={len(self.requests)};"
+                             f"connections={self.connections}\n".encode('ascii'))
+            elif command == CMD_TEST:
+                depth, duration, save, version = TEST_ARGS.unpack(
+                    await reader.readexactly(TEST_ARGS.size))
+                self.requests.append((depth, duration, bool(save)))
+                # The device writes the SD card whether or not the reply gets through
+                if save:
+                    self._store()
+                binary = self.binary and version == PROTOCOL_BINARY
+                if binary:
+                    writer.write(BINARY_MAGIC + bytes([PROTOCOL_BINARY]))
+                await self._send_records(writer, binary)
+            elif command == CMD_FETCH:
+                first, limit = FETCH_ARGS.unpack(await reader.readexactly(FETCH_ARGS.size))
+                count = max(0, self.stored - first)
+                if limit:
+                    count = min(count, limit)
+                writer.write(f"N={count};T={self.stored}\n".encode('ascii'))
+                if count:
+                    await self._send_records(writer, lines=self._stored_lines(first), count=count)
+            elif command == CMD_QUIT:
+                return
+            else:
+                # Unknown command, hang up like the firmware would
+                return
+            await writer.drain()
+
+    def _store(self):
+        """Append the records of one test to the stored log"""
+        self._tests.append(self.stored)
+        self.stored += self.records
+
+    def _stored_lines(self, first):
+        """The stored log from sequence number `first`: one test dump after another"""
+        test = bisect.bisect_right(self._tests, first) - 1
+        offset = first - self._tests[test]
+        for start in self._tests[test:]:
+            yield from itertools.islice(
+                iter_synthetic_lines(self.records, self.seed, self.malformed_ratio), offset, None)
+            offset = 0
+
+    async def _send_records(self, writer, binary=False, lines=None, count=None):
+        """Send `count` of `lines` (default: one test dump of `records` lines)"""
+        if lines is None:
+            lines = iter_synthetic_lines(self.records, self.seed, self.malformed_ratio)
+            count = self.records
+        start = time.monotonic()
+        sent = 0
+        while sent < count:
+            chunk = [line for _, line in zip(range(min(self.chunk_lines, count - sent)), lines)]
+            if not chunk:
+                break
+            if self.drop_every and len(chunk) > self._until_drop:
+                await self._drop(writer, chunk, binary)
+            if self.drop_every:
+                self._until_drop -= len(chunk)
+            if binary:
+                # Malformed lines cannot be framed and are dropped here
+                columns = parse_buffer(chunk).columns
+                writer.write(encode_binary(columns, finished=sent + len(chunk) >= count))
+            else:
+                writer.write(('\n'.join(chunk) + '\n').encode('ascii'))
+            await writer.drain()
+            sent += len(chunk)
+            if self.rate:
+                delay = start + sent / self.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    async def _drop(self, writer, chunk, binary):
+        """Send what fits before the next drop, half a record more, and cut the connection"""
+        whole = chunk[:self._until_drop]
+        torn = chunk[len(whole)]
+        if binary:
+            data = encode_binary(parse_buffer(whole).columns, finished=False)
+            torn = encode_binary(parse_buffer([torn]).columns, finished=False)
+        else:
+            data = ''.join(line + '\n' for line in whole).encode('ascii')
+            torn = torn.encode('ascii')
+        writer.write(data + torn[:len(torn) // 2])
+        await writer.drain()
+        self.drops += 1
+        self._until_drop = self.drop_every
+        # Buffered data still goes out, then the connection ends mid-reply
+        writer.write_eof()
+        raise ConnectionResetError("simulated link loss")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic ESP32 readings over TCP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--records', type=int, default=1000, help="records sent per request")
+    parser.add_argument('--rate', type=float, default=None, help="records per second (default: unpaced)")
+    parser.add_argument('--malformed', type=float, default=0.0, help="fraction of malformed lines")
+    parser.add_argument('--chunk-lines', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--binary', action='store_true', help="support the binary response mode")
+    parser.add_argument('--no-sessions', dest='sessions', action='store_false',
+                        help="behave like firmware without keep-alive sessions")
+    parser.add_argument('--accept-delay', type=float, default=0.0,
+                        help="seconds waited on every new connection")
+    parser.add_argument('--stored', type=int, default=0,
+                        help="records already in the stored log at start")
+    parser.add_argument('--drop-every', type=int, default=None,
+                        help="cut the connection every this many records sent")
+    args = parser.parse_args()
+
+    async def serve():
+        server = await FakeESP32(args.records, args.rate, args.malformed, args.chunk_lines,
+                                 args.host, args.port, args.seed, args.binary, args.sessions,
+                                 args.accept_delay, args.stored, args.drop_every).start()
+        print(f"listening on {server.host}:{server.port}", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
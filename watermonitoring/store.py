@@ -0,0 +1,516 @@
+"""Columnar storage for parsed ESP32 readings"""
+
+import io
+
+import numpy as np
+
+from .protocol import PARAMETERS, SAVE_BITS, TIME_INVALID, format_waktu
+from .ring import RingBuffer
+from .textlog import TextLogWriter
+from .timeaxis import TimeAxis
+
+# Storage type of every numeric column
+COLUMN_DTYPES = {
+    'time_ms': np.int64,
+    'flags': np.uint8,
+    'value_pH': np.float32,
+    'interval_pH': np.int32,
+    'value_temp': np.float32,
+    'interval_temp': np.int32,
+    'value_DO': np.float32,
+    'interval_DO': np.int32,
+    'value_turb': np.float32,
+    'interval_turb': np.int32,
+    'current': np.float32,
+    'voltage': np.float32,
+}
+
+# Smallest number of rows added when the store grows
+GROW_CHUNK = 4096
+
+# Rows a RingStore keeps in memory by default, about a day at one row per second
+WINDOW_ROWS = 100000
+
+# Length (ms) of a DownsampledTier bucket and buckets kept in memory (a week)
+TIER_BUCKET_MS = 60 * 1000
+TIER_BUCKETS = 7 * 24 * 60
+
+# Statistics of every parameter in a DownsampledTier bucket
+TIER_FIELDS = ('count', 'mean', 'min', 'max')
+
+
+def format_rows(columns):
+    """Text fields of every row of `columns`, one tuple of 15 per row, as in HEADERS
+
+    Values are written as the shortest text that reads back to the same
+    float32, e.g. 1234.567 for the probe's 1234.567. Waktu is written
+    unpadded, as the probe sends it (8:5:3:7, also for a stamp that
+    arrived as 08:05:03:007). Each column is converted in one pass.
+    """
+    flags = np.asarray(columns['flags'])
+    fields = [[format_waktu(ms) for ms in np.asarray(columns['time_ms']).tolist()]]
+    for name, _, value_key, interval_key in PARAMETERS:
+        fields.append(np.where(flags & SAVE_BITS[name], '1', '0').tolist())
+        fields.append(np.asarray(columns[value_key], dtype=np.float32).astype(str).tolist())
+        fields.append(np.asarray(columns[interval_key], dtype=np.int64).astype(str).tolist())
+    for key in ('current', 'voltage'):
+        fields.append(np.asarray(columns[key], dtype=np.float32).astype(str).tolist())
+    return list(zip(*fields))
+
+
+class RunningStats:
+    """Count, min, max, mean and variance maintained with Welford updates"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def add_many(self, values):
+        """Fold in a batch at once (Chan et al.'s pairwise form of Welford)"""
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        """Fold in the values counted by another RunningStats, e.g. from another process"""
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self._m2 += other._m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def variance(self):
+        """Sample variance, None below two values"""
+        return self._m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def std(self):
+        variance = self.variance
+        return None if variance is None else variance ** 0.5
+
+
+class ReadingStore:
+    """Typed NumPy columns holding one row per ESP32 reading
+
+    Besides the rows the store keeps, per parameter, the newest valid
+    reading and RunningStats of the valid values, plus a TimeAxis of the
+    stamps with midnight rollovers unwrapped. All are updated as rows are
+    added so readers never have to scan the columns.
+
+    Rows are numbered from the first one added. This store holds all of
+    them; RingStore only the newest, from row `first` on.
+    """
+
+    def __init__(self, capacity=GROW_CHUNK):
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        self._cols = {name: np.empty(self._capacity, dtype=dtype)
+                      for name, dtype in COLUMN_DTYPES.items()}
+        self._latest = {name: None for name, _, _, _ in PARAMETERS}
+        self._stats = {name: RunningStats() for name, _, _, _ in PARAMETERS}
+        self.time_axis = TimeAxis()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def first(self):
+        """Number of the oldest row held"""
+        return 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self._cols.values())
+
+    def clear(self):
+        """Drop all rows but keep the allocated buffers"""
+        self._size = 0
+        self.time_axis.clear()
+        for name in self._latest:
+            self._latest[name] = None
+            self._stats[name].clear()
+
+    def reserve(self, capacity):
+        """Make room for at least `capacity` rows"""
+        if capacity <= self._capacity:
+            return
+        # Grow by at least half of the current size to keep appends amortized O(1)
+        new_capacity = max(capacity, self._capacity + max(self._capacity // 2, GROW_CHUNK))
+        for name, col in self._cols.items():
+            grown = np.empty(new_capacity, dtype=col.dtype)
+            grown[:self._size] = col[:self._size]
+            self._cols[name] = grown
+        self._capacity = new_capacity
+
+    def append(self, time_ms, flags, values, intervals, current, voltage):
+        """Append a single reading
+
+        `values` and `intervals` are ordered like PARAMETERS.
+        """
+        self.reserve(self._size + 1)
+        i = self._size
+        cols = self._cols
+        cols['time_ms'][i] = time_ms
+        cols['flags'][i] = flags
+        for (_, _, value_key, interval_key), value, interval in zip(PARAMETERS, values, intervals):
+            cols[value_key][i] = value
+            cols[interval_key][i] = interval
+        cols['current'][i] = current
+        cols['voltage'][i] = voltage
+        for name, _, value_key, interval_key in PARAMETERS:
+            if flags & SAVE_BITS[name]:
+                self._latest[name] = (float(cols[value_key][i]), int(cols[interval_key][i]))
+                self._stats[name].add(cols[value_key][i])
+        self.time_axis.append(time_ms)
+        self._size += 1
+
+    def extend(self, columns):
+        """Append many readings given as a dict of equally long arrays
+
+        Returns the TimeAxis times of the added rows, valid until the next
+        call; a RingStore may no longer hold all of them.
+        """
+        count = len(columns['time_ms'])
+        if count == 0:
+            return np.empty(0, dtype=np.int64)
+        self.reserve(self._size + count)
+        start, end = self._size, self._size + count
+        for name, col in self._cols.items():
+            col[start:end] = columns[name]
+        self._track({name: col[start:end] for name, col in self._cols.items()})
+        self._size = end
+        return self.time_axis.elapsed(start)
+
+    def _track(self, columns):
+        """Update the newest readings, statistics and time axis with added rows"""
+        flags = columns['flags']
+        for name, _, value_key, interval_key in PARAMETERS:
+            hits = np.flatnonzero(flags & SAVE_BITS[name])
+            if len(hits):
+                last = hits[-1]
+                self._latest[name] = (float(columns[value_key][last]),
+                                      int(columns[interval_key][last]))
+                self._stats[name].add_many(columns[value_key][hits])
+        self.time_axis.extend(columns['time_ms'])
+
+    def _held(self, name):
+        """Zero-copy view of a column over the rows held"""
+        return self._cols[name][:self._size]
+
+    def column(self, name, start=None):
+        """Zero-copy view of a stored column, from row `start` on if given
+
+        Save keys from HEADERS (e.g. 'save_pH') return a boolean mask decoded
+        from the packed flags and are therefore a copy.
+        """
+        if name in SAVE_BITS:
+            column = self.valid(name)
+        else:
+            column = self._held('time_ms' if name == 'waktu' else name)
+        if start is None:
+            return column
+        if start < self.first:
+            raise IndexError(f"row {start} is no longer held")
+        return column[start - self.first:]
+
+    def columns(self):
+        """Zero-copy views of all stored columns, keyed like COLUMN_DTYPES"""
+        return {name: self._held(name) for name in COLUMN_DTYPES}
+
+    def valid(self, param):
+        """Boolean mask of rows whose save flag is set for a parameter"""
+        return (self._held('flags') & SAVE_BITS[param]) != 0
+
+    @staticmethod
+    def _parameter(param):
+        """PARAMETERS entry of a parameter name or save key"""
+        for entry in PARAMETERS:
+            if param in entry[:2]:
+                return entry
+        raise KeyError(param)
+
+    def last_valid(self, param):
+        """Return (value, interval) of the newest valid reading of a parameter"""
+        latest = self._latest[self._parameter(param)[0]]
+        return latest if latest is not None else (None, None)
+
+    def stats(self, param):
+        """RunningStats of the valid values of a parameter"""
+        return self._stats[self._parameter(param)[0]]
+
+    def time_seconds(self):
+        """Seconds since the first decodable timestamp, across midnight
+
+        Undecodable and out-of-order stamps hold the previous time.
+        """
+        return self.time_axis.seconds(self.first)
+
+    def format_row(self, i):
+        """Render row number `i` (negative from the newest) as the 15 text fields of HEADERS"""
+        if i < 0:
+            i += len(self)
+        if not self.first <= i < len(self):
+            raise IndexError(i)
+        i -= self.first
+        return list(format_rows({name: column[i:i + 1]
+                                 for name, column in self.columns().items()})[0])
+
+    def iter_rows(self, chunk_rows=GROW_CHUNK):
+        """Yield every held row formatted like format_row, converted a chunk at a time"""
+        cols = self.columns()
+        for lo in range(0, len(self) - self.first, chunk_rows):
+            yield from format_rows({name: column[lo:lo + chunk_rows]
+                                    for name, column in cols.items()})
+
+
+class DownsampledTier:
+    """Count, mean, min and max of every parameter's valid values per time bucket
+
+    Rows come in with their TimeAxis times, oldest first, e.g. the rows a
+    RingStore drops. Finished buckets are kept in ring buffers of the
+    newest `capacity` buckets and, when `path` is given, appended to that
+    ;-delimited CSV file as well. The file is written on a background
+    thread (see TextLogWriter) until close(); a failing write is kept in
+    `error` instead of interrupting the acquisition.
+    """
+
+    def __init__(self, bucket_ms=TIER_BUCKET_MS, capacity=TIER_BUCKETS, path=None):
+        self.bucket_ms = bucket_ms
+        self.path = path
+        self._log = None
+        self.buckets = {'start_ms': RingBuffer(capacity, np.int64)}
+        for name, _, _, _ in PARAMETERS:
+            for field in TIER_FIELDS:
+                dtype = np.int64 if field == 'count' else np.float64
+                self.buckets[f"{field}_{name}"] = RingBuffer(capacity, dtype)
+        self.clear()
+
+    def __len__(self):
+        return len(self.buckets['start_ms'])
+
+    def clear(self):
+        for ring in self.buckets.values():
+            ring.clear()
+        self.rows = 0
+        self.error = None
+        # Number of the unfinished bucket and its (count, sum, min, max) per parameter
+        self._open = None
+        self._partial = None
+
+    def columns(self):
+        """Zero-copy views of the finished buckets held, keyed like `buckets`"""
+        return {key: ring.view() for key, ring in self.buckets.items()}
+
+    def add(self, columns, elapsed):
+        """Fold in rows; `elapsed` are their TimeAxis times"""
+        elapsed = np.asarray(elapsed, dtype=np.int64)
+        self.rows += len(elapsed)
+        # Rows before the first decodable stamp belong to no bucket
+        stamped = elapsed != TIME_INVALID
+        if not stamped.any():
+            return
+        ids = elapsed[stamped] // self.bucket_ms
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ids = ids[starts]
+        flags = np.asarray(columns['flags'])[stamped]
+        stats = {}
+        for name, _, value_key, _ in PARAMETERS:
+            valid = (flags & SAVE_BITS[name]) != 0
+            values = np.asarray(columns[value_key], dtype=np.float64)[stamped]
+            stats[name] = [np.add.reduceat(valid.astype(np.int64), starts),
+                           np.add.reduceat(np.where(valid, values, 0.0), starts),
+                           np.minimum.reduceat(np.where(valid, values, np.inf), starts),
+                           np.maximum.reduceat(np.where(valid, values, -np.inf), starts)]
+        if self._open is not None:
+            if ids[0] == self._open:
+                for name, (count, total, low, high) in self._partial.items():
+                    parts = stats[name]
+                    parts[0][0] += count
+                    parts[1][0] += total
+                    parts[2][0] = min(parts[2][0], low)
+                    parts[3][0] = max(parts[3][0], high)
+            else:
+                ids = np.r_[self._open, ids]
+                for name, partial in self._partial.items():
+                    stats[name] = [np.r_[value, part] for value, part in zip(partial, stats[name])]
+        self._finish(ids[:-1], {name: [part[:-1] for part in parts] for name, parts in stats.items()})
+        self._open = int(ids[-1])
+        self._partial = {name: tuple(part[-1] for part in parts) for name, parts in stats.items()}
+
+    def flush(self):
+        """Finish the open bucket, e.g. when the stream ends"""
+        if self._open is None:
+            return
+        self._finish(np.array([self._open]),
+                     {name: [np.array([value]) for value in partial]
+                      for name, partial in self._partial.items()})
+        self._open = None
+        self._partial = None
+
+    def close(self):
+        """Finish the open bucket and write what is still queued for the file"""
+        self.flush()
+        self._close_log()
+
+    def _close_log(self):
+        if self._log is not None:
+            log, self._log = self._log, None
+            try:
+                log.close()
+            except OSError as e:
+                self.error = e
+
+    def _write(self, columns):
+        if self._log is not None and self._log.path != self.path:
+            # The tier was pointed at the file of a new test
+            self._close_log()
+        if self._log is None:
+            self._log = TextLogWriter(self.path, ';'.join(self.buckets) + '\n')
+        text = io.StringIO()
+        np.savetxt(text, np.column_stack([columns[key] for key in self.buckets]),
+                   fmt=['%d'] + ['%d' if key.startswith('count_') else '%.6g'
+                                 for key in list(self.buckets)[1:]],
+                   delimiter=';')
+        try:
+            self._log.append(text.getvalue())
+        except OSError as e:
+            self.error = e
+
+    def _finish(self, ids, stats):
+        if not len(ids):
+            return
+        columns = {'start_ms': ids * self.bucket_ms}
+        for name, (count, total, low, high) in stats.items():
+            empty = count == 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = total / count
+            columns[f"count_{name}"] = count
+            columns[f"mean_{name}"] = np.where(empty, np.nan, mean)
+            columns[f"min_{name}"] = np.where(empty, np.nan, low)
+            columns[f"max_{name}"] = np.where(empty, np.nan, high)
+        for key, ring in self.buckets.items():
+            ring.extend(columns[key])
+        if self.path is not None and self.error is None:
+            self._write(columns)
+
+
+class RingStore(ReadingStore):
+    """ReadingStore in fixed memory that holds the newest `window` rows
+
+    Every column and the time axis are preallocated RingBuffers, so rows
+    stream in for days without allocating. Rows pushed out of the window
+    are folded into `tier` (a DownsampledTier) and passed to
+    `on_evict(columns, elapsed)` when given. The newest readings and the
+    RunningStats still cover every row ever added. The complete rows are
+    meant to go to a reading log (see recordlog) as they arrive.
+    """
+
+    def __init__(self, window=WINDOW_ROWS, tier=None, on_evict=None):
+        self.window = max(int(window), 1)
+        self._rings = {name: RingBuffer(self.window, dtype) for name, dtype in COLUMN_DTYPES.items()}
+        self._latest = {name: None for name, _, _, _ in PARAMETERS}
+        self._stats = {name: RunningStats() for name, _, _, _ in PARAMETERS}
+        self.time_axis = TimeAxis(window=self.window)
+        self.tier = tier if tier is not None else DownsampledTier()
+        self.on_evict = on_evict
+
+    def __len__(self):
+        return self._rings['time_ms'].total
+
+    @property
+    def first(self):
+        return self._rings['time_ms'].first
+
+    @property
+    def capacity(self):
+        return self.window
+
+    @property
+    def nbytes(self):
+        return sum(ring.nbytes for ring in self._rings.values())
+
+    def clear(self):
+        """Drop all rows, and the tier, but keep the allocated buffers"""
+        for ring in self._rings.values():
+            ring.clear()
+        self.time_axis.clear()
+        self.tier.clear()
+        for name in self._latest:
+            self._latest[name] = None
+            self._stats[name].clear()
+
+    def reserve(self, capacity):
+        """Nothing to do, the buffers never grow"""
+
+    def append(self, time_ms, flags, values, intervals, current, voltage):
+        row = {'time_ms': time_ms, 'flags': flags, 'current': current, 'voltage': voltage}
+        for (_, _, value_key, interval_key), value, interval in zip(PARAMETERS, values, intervals):
+            row[value_key] = value
+            row[interval_key] = interval
+        self.extend({name: np.array([row[name]], dtype=dtype) for name, dtype in COLUMN_DTYPES.items()})
+
+    def extend(self, columns):
+        count = len(columns['time_ms'])
+        if count > self.window:
+            # Each part pushes out what the next one would overwrite, so
+            # its times are copied before the next part goes in
+            return np.concatenate([
+                self.extend({name: columns[name][lo:lo + self.window] for name in COLUMN_DTYPES}).copy()
+                for lo in range(0, count, self.window)])
+        if count == 0:
+            return np.empty(0, dtype=np.int64)
+        columns = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        overflow = len(self) - self.first + count - self.window
+        if overflow > 0:
+            self._evict(overflow)
+        for name, ring in self._rings.items():
+            ring.extend(columns[name])
+        self._track(columns)
+        return self.time_axis.elapsed(len(self) - count)
+
+    def _evict(self, count):
+        """Hand on the `count` oldest rows before they are overwritten"""
+        start = self.first
+        columns = {name: ring.view(start)[:count] for name, ring in self._rings.items()}
+        elapsed = self.time_axis.elapsed(start)[:count]
+        self.tier.add(columns, elapsed)
+        if self.on_evict is not None:
+            self.on_evict(columns, elapsed)
+
+    def _held(self, name):
+        return self._rings[name].view()
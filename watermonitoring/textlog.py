@@ -0,0 +1,97 @@
+"""Write-behind appender for text logs such as the alert log
+
+Like RecordLogWriter for readings: append() only queues the text and a
+thread of its own opens the file and writes it, so the Tk loop or a
+socket reader never waits for the disk. The thread is started by the
+first append(), so a log that never gets a line costs neither a thread
+nor a file.
+
+The queue holds at most LOG_QUEUE_SIZE appends; beyond that append()
+waits for the disk instead of letting memory grow. A failed write stops
+the log. The error is kept in `error` and raised again by the next
+append() or by close().
+"""
+
+import os
+import queue
+import threading
+
+# Appends queued before append() waits for the writer thread
+LOG_QUEUE_SIZE = 1024
+
+
+class TextLogWriter:
+    """Append text to `path` on a background thread
+
+    `header` is written first when the file is new or empty.
+    """
+
+    def __init__(self, path, header=None, max_pending=LOG_QUEUE_SIZE):
+        self.path = path
+        self.header = header
+        self.error = None
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def append(self, text):
+        """Queue `text`; raises the error that stopped the writer, if any"""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"{self.path} is closed")
+            if self.error is not None:
+                raise self.error
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="text-log", daemon=True)
+                self._thread.start()
+        self._queue.put(text)
+
+    def close(self):
+        """Write everything queued and stop the thread; raises a write error"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            f = open(self.path, 'a')
+        except OSError as e:
+            self.error = e
+            self._discard()
+            return
+        with f:
+            if self.header is not None and f.tell() == 0:
+                f.write(self.header)
+            while True:
+                texts = [self._queue.get()]
+                # Whatever else is queued goes out in the same write
+                while texts[-1] is not None:
+                    try:
+                        texts.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                closing = texts[-1] is None
+                if closing:
+                    texts.pop()
+                try:
+                    f.write(''.join(texts))
+                    f.flush()
+                except OSError as e:
+                    self.error = e
+                    if not closing:
+                        self._discard()
+                    return
+                if closing:
+                    return
+
+    def _discard(self):
+        """Empty the queue after an error so appenders and close() never wait"""
+        while True:
+            if self._queue.get() is None:
+                return
@@ -0,0 +1,183 @@
+"""Continuous time axis over the ESP32's ms-since-midnight stamps
+
+The probe stamps readings with the time of day only, so a run that passes
+midnight jumps back by a day. TimeAxis turns the decoded stamps into
+milliseconds since midnight of the first day as rows are ingested:
+
+- a backwards jump of more than half a day is a midnight rollover and adds
+  a day to every following stamp
+- any other backwards step is non-monotonic; the axis holds at the latest
+  time instead of going back, so plots and range lookups stay sorted
+- undecodable stamps (TIME_INVALID) also hold the axis at the latest time
+
+Every rollover, non-monotonic or malformed stamp is recorded in `issues`.
+
+With a `window` only the elapsed times of the newest `window` rows are
+kept (see RingBuffer), and of the issues the newest ISSUE_HISTORY or more,
+so the axis of an endless stream stays within fixed memory.
+"""
+
+import numpy as np
+
+from .protocol import TIME_INVALID
+from .ring import RingBuffer
+
+DAY_MS = 24 * 3600 * 1000
+
+# Kinds of entries in TimeAxis.issues
+MALFORMED = 'malformed'
+NON_MONOTONIC = 'non-monotonic'
+ROLLOVER = 'rollover'
+
+# Issues a windowed TimeAxis keeps at least
+ISSUE_HISTORY = 1000
+
+
+class TimeAxis:
+    """Incrementally built, non-decreasing elapsed-ms axis with diagnostics
+
+    Rows before the first decodable stamp get TIME_INVALID.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self._elapsed = np.empty(1024, dtype=np.int64)
+        self._ring = RingBuffer(window, np.int64) if window else None
+        self.clear()
+
+    def clear(self):
+        self._size = 0
+        if self._ring is not None:
+            self._ring.clear()
+        # Issues dropped from a windowed axis, by kind
+        self._dropped = dict.fromkeys((MALFORMED, NON_MONOTONIC, ROLLOVER), 0)
+        self.days = 0
+        self.first = None
+        self._last_stamp = None
+        self._latest = TIME_INVALID
+        # (row, kind, stamp, previous stamp) per suspicious row
+        self.issues = []
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def first_row(self):
+        """Row number of the oldest row whose time is held"""
+        return self._ring.first if self._ring is not None else 0
+
+    def elapsed(self, start=None):
+        """Milliseconds since midnight of the first day, one entry per held row
+
+        With `start` only rows from that row number on.
+        """
+        if self._ring is not None:
+            return self._ring.view(start)
+        return self._elapsed[start or 0:self._size]
+
+    def counts(self):
+        """Number of issues of each kind"""
+        counts = dict(self._dropped)
+        for _, kind, _, _ in self.issues:
+            counts[kind] += 1
+        return counts
+
+    def extend(self, time_ms):
+        """Add the decoded stamps of new rows"""
+        time_ms = np.asarray(time_ms, dtype=np.int64)
+        count = len(time_ms)
+        if count == 0:
+            return
+        start = self._size
+        latest_before = self._latest
+        good = time_ms != TIME_INVALID
+        good_rows = np.flatnonzero(good)
+
+        elapsed = np.full(count, TIME_INVALID, dtype=np.int64)
+        issues = []
+        if len(good_rows):
+            stamps = time_ms[good_rows]
+            previous = np.empty(len(stamps), dtype=np.int64)
+            previous[1:] = stamps[:-1]
+            previous[0] = stamps[0] if self._last_stamp is None else self._last_stamp
+            step = stamps - previous
+            rollover = step < -DAY_MS // 2
+            days = self.days + np.cumsum(rollover)
+            unwrapped = stamps + days * DAY_MS
+            # Hold at the latest time over backward steps
+            held = np.maximum.accumulate(np.maximum(unwrapped, self._latest))
+            backwards = (unwrapped < held) & ~rollover
+            elapsed[good_rows] = held
+
+            for mask, kind in ((rollover, ROLLOVER), (backwards, NON_MONOTONIC)):
+                for i in np.flatnonzero(mask):
+                    issues.append((start + int(good_rows[i]), kind,
+                                   int(stamps[i]), int(previous[i])))
+            if self.first is None:
+                self.first = int(held[0])
+            self.days = int(days[-1])
+            self._last_stamp = int(stamps[-1])
+            self._latest = int(held[-1])
+
+        bad_rows = np.flatnonzero(~good)
+        if len(bad_rows):
+            # Carry the latest time forward over bad stamps
+            latest = np.maximum.accumulate(np.maximum(elapsed, latest_before))
+            elapsed[bad_rows] = latest[bad_rows]
+            issues.extend((start + int(row), MALFORMED, TIME_INVALID, TIME_INVALID)
+                          for row in bad_rows)
+        self.issues.extend(sorted(issues))
+        self._append(elapsed)
+
+    def append(self, stamp):
+        """Scalar version of extend() for a single row"""
+        stamp = int(stamp)
+        row = self._size
+        if stamp == TIME_INVALID:
+            self.issues.append((row, MALFORMED, TIME_INVALID, TIME_INVALID))
+            elapsed = self._latest
+        else:
+            previous = stamp if self._last_stamp is None else self._last_stamp
+            rollover = stamp - previous < -DAY_MS // 2
+            if rollover:
+                self.days += 1
+                self.issues.append((row, ROLLOVER, stamp, previous))
+            unwrapped = stamp + self.days * DAY_MS
+            if unwrapped < self._latest and not rollover:
+                self.issues.append((row, NON_MONOTONIC, stamp, previous))
+            elapsed = self._latest = max(unwrapped, self._latest)
+            if self.first is None:
+                self.first = elapsed
+            self._last_stamp = stamp
+        if self._ring is not None or row == len(self._elapsed):
+            self._append([elapsed])
+        else:
+            self._elapsed[row] = elapsed
+            self._size += 1
+
+    def _append(self, elapsed):
+        if self._ring is not None:
+            self._ring.extend(elapsed)
+            self._size = self._ring.total
+            if len(self.issues) > 2 * ISSUE_HISTORY:
+                for _, kind, _, _ in self.issues[:-ISSUE_HISTORY]:
+                    self._dropped[kind] += 1
+                del self.issues[:-ISSUE_HISTORY]
+            return
+        end = self._size + len(elapsed)
+        if end > len(self._elapsed):
+            grown = np.empty(max(end, 2 * len(self._elapsed)), dtype=np.int64)
+            grown[:self._size] = self._elapsed[:self._size]
+            self._elapsed = grown
+        self._elapsed[self._size:end] = elapsed
+        self._size = end
+
+    def seconds(self, start=None):
+        """Seconds since the first decodable stamp for held rows from `start`
+
+        Rows before the first decodable stamp sit at 0.0.
+        """
+        elapsed = self.elapsed(start)
+        if self.first is None:
+            return np.zeros(len(elapsed))
+        return np.maximum(elapsed - self.first, 0) / 1000.0
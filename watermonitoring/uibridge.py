@@ -0,0 +1,196 @@
+"""Thread-safe hand-off of events from worker threads to the Tk main loop
+
+Tk widgets may only be touched from the thread running the main loop.
+Worker threads give their work to a UIBridge instead of calling
+root.after() themselves:
+
+    bridge.post(fn, *args)        # control event, e.g. "test finished"
+    bridge.push(consumer, item)   # data event, e.g. a parsed batch
+
+Both go into one queue in order. A single Tk timer drains it every
+`interval_ms`: consecutive data items for the same consumer are coalesced
+into one `consumer(items)` call, and `on_frame()` runs after a frame that
+delivered data, at most once per `interval_ms`, so widgets are updated at
+a fixed rate no matter how many batches arrived.
+
+A frame handles at most `limit` data items. The limit adapts to the time
+the frames take: it is halved when a frame runs past `budget_ms` and grows
+again while frames stay well inside it. While items are left over the next
+frame follows after a millisecond, giving the events Tk has waiting a turn
+in between, so the event loop stays responsive at any ingest rate. Once
+`max_pending` data items are queued push() blocks. That backpressure slows
+the receive thread and, through TCP, the probe, rather than letting the
+queue and the event-loop lag grow without bound.
+
+Only the standard library is used, so the GUI can create a bridge before
+NumPy is imported.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+
+# Default time between drains of the queue (ms)
+FRAME_MS = 50
+
+# Default Tk time one frame should take at most (ms); half the 50 ms
+# event-loop lag the GUI is allowed
+FRAME_BUDGET_MS = 25
+
+# Default data items queued before push() blocks
+MAX_PENDING = 256
+
+# Seconds a blocked push() waits between checks of a closed bridge
+PUSH_POLL_S = 0.5
+
+
+class UIBridge:
+    """Queue from worker threads to the Tk thread, drained on one timer
+
+    Create it on the Tk thread.
+    """
+
+    def __init__(self, root, interval_ms=FRAME_MS, budget_ms=FRAME_BUDGET_MS,
+                 max_pending=MAX_PENDING, on_frame=None, metrics=None):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.budget = budget_ms / 1000
+        self.max_pending = max(int(max_pending), 1)
+        self.on_frame = on_frame
+        self.metrics = metrics
+        # Data items one frame may deliver, adapted to the frame time; starts
+        # low so the first frames, before the cost is known, stay short
+        self.limit = 1
+        self.frames = 0
+        self._refreshed = 0.0
+        self._events = deque()
+        self._cond = threading.Condition()
+        # Data items queued, and events queued or being handled
+        self._data = 0
+        self._unfinished = 0
+        self._closed = False
+        self._tk_thread = threading.get_ident()
+        self._timer = root.after(interval_ms, self._drain)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._events)
+
+    def post(self, fn, *args):
+        """Run `fn(*args)` on the Tk thread; never blocks"""
+        with self._cond:
+            if self._closed:
+                return
+            self._events.append((None, fn, args))
+            self._unfinished += 1
+
+    def push(self, consumer, item):
+        """Queue `item` for `consumer(items)` on the Tk thread
+
+        Blocks while `max_pending` data items wait, except on the Tk thread
+        itself. Returns False if the bridge was closed and the item dropped.
+        """
+        with self._cond:
+            if self._data >= self.max_pending and threading.get_ident() != self._tk_thread:
+                started = time.perf_counter()
+                while self._data >= self.max_pending and not self._closed:
+                    self._cond.wait(PUSH_POLL_S)
+                if self.metrics is not None:
+                    self.metrics.observe('ui_backpressure_seconds', time.perf_counter() - started)
+            if self._closed:
+                return False
+            self._events.append((consumer, None, item))
+            self._data += 1
+            self._unfinished += 1
+            return True
+
+    def flush(self, timeout=None):
+        """Wait until every queued event was handled; False on timeout
+
+        Returns at once when the bridge is closed. Must not be called on the
+        Tk thread, which is the one that empties the queue.
+        """
+        if threading.get_ident() == self._tk_thread:
+            raise RuntimeError("flush() would block the Tk thread that drains the queue")
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed or not self._unfinished, timeout)
+
+    def close(self):
+        """Stop the timer and drop what is queued; blocked callers return"""
+        with self._cond:
+            self._closed = True
+            self._events.clear()
+            self._data = self._unfinished = 0
+            self._cond.notify_all()
+        try:
+            self.root.after_cancel(self._timer)
+        except Exception:
+            # The Tk interpreter may already be gone
+            pass
+
+    def _take(self):
+        """Events of one frame: all control events and up to `limit` data items"""
+        taken = []
+        data = 0
+        with self._cond:
+            while self._events and (self._events[0][0] is None or data < self.limit):
+                event = self._events.popleft()
+                data += event[0] is not None
+                taken.append(event)
+        return taken, data
+
+    def _deliver(self, taken):
+        """Call the events in order, grouping consecutive items of one consumer"""
+        i = 0
+        while i < len(taken):
+            consumer, fn, payload = taken[i]
+            j = i + 1
+            try:
+                if consumer is None:
+                    fn(*payload)
+                else:
+                    while j < len(taken) and taken[j][0] is consumer:
+                        j += 1
+                    consumer([event[2] for event in taken[i:j]])
+            except Exception:
+                # Reported as Tk reports a failing callback; the rest still runs
+                self.root.report_callback_exception(*sys.exc_info())
+            i = j
+
+    def _drain(self):
+        started = time.perf_counter()
+        taken, data = self._take()
+        try:
+            self._deliver(taken)
+            if data and self.on_frame is not None and (
+                    started - self._refreshed >= self.interval_ms / 1000 or len(self) == 0):
+                self._refreshed = started
+                self.on_frame()
+        except Exception:
+            self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            spent = time.perf_counter() - started
+            with self._cond:
+                closed = self._closed
+                # close() has already reset the counts
+                if not closed:
+                    self._data -= data
+                    self._unfinished -= len(taken)
+                backlog = self._data
+                self._cond.notify_all()
+            if taken:
+                self._adapt(spent, data)
+                self.frames += 1
+                if self.metrics is not None:
+                    self.metrics.observe('ui_frame_seconds', spent)
+                    self.metrics.count('ui_events_total', len(taken))
+                    self.metrics.set('ui_queue_depth', backlog)
+            if not closed:
+                self._timer = self.root.after(1 if backlog else self.interval_ms, self._drain)
+
+    def _adapt(self, spent, data):
+        if spent > self.budget:
+            self.limit = max(1, self.limit // 2)
+        elif spent < self.budget / 2 and data >= self.limit:
+            self.limit = min(self.max_pending, self.limit + max(1, self.limit // 4))